@@ -1,16 +1,36 @@
 import os
+import asyncio
+import json
 import time
 import traceback
 import uvicorn
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from models import CodePrompt, CodeRequest, CodeInput
+from models import CodePrompt, CodeRequest, CodeInput, ClassifyBatch
 from ml_engine import (
-    generate_code, generate_reply, generate_reply_code_only, _load_model, autocomplete_code
+    generate_code, generate_reply, generate_reply_code_only, _load_model, autocomplete_code,
+    MODEL_POOL, TEMPERATURES, model_id, model_stats, speculative_stats,
+    stream_code, stream_autocomplete, stream_reply, stream_reply_code_only,
+    embed_text, SEMANTIC_CACHE_ENDPOINTS
 )
-from db import connect_db, close_db
-from auth import verify_token
+from db import connect_db, close_db, get_db, telemetry
+from auth import verify_token, start_cert_refresh, auth_stats
+from inference import (
+    InferenceExecutor, RemoteExecutor, QueueFullError, UserQueueFullError, JobCancelledError, SupersedingJobs,
+    JobAbortedError, JobDeadlineError, ClientDisconnectedError, executor_options,
+    PRIORITY_AUTOCOMPLETE, PRIORITY_GENERATE, PRIORITY_REPLY, PRIORITY_BATCH
+)
+from context_budget import ContextOverflowError
+from sandbox import SandboxPool
+from batch import BatchItem, parse_records, run_batch
+from coalesce import SingleFlight
+from classifier import classify_batch, classify_text
+import metrics
+from telemetry import UsageRecorder
+from response_cache import ResponseCache, cache_key, normalize_code, normalize_text
+from semantic_cache import SemanticCache
 from dotenv import load_dotenv
 
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -19,6 +39,68 @@ print("TEST_MODE =", os.getenv("TEST_MODE"))
 
 app = FastAPI()
 
+# With INFERENCE_SOCKET set, models live in the shared inference_server process
+# and every uvicorn worker forwards its jobs there.
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+
+if INFERENCE_SOCKET:
+    remote_executor = RemoteExecutor(INFERENCE_SOCKET)
+    executors = {name: remote_executor for name in MODEL_POOL.models}
+else:
+    # One executor per model, so a busy model never holds up the endpoints routed to another.
+    executors = {
+        name: InferenceExecutor(workers=slots, **executor_options())
+        for name, slots in MODEL_POOL.slots().items()
+    }
+
+# Validation of /reply-code-only output: "off", "flag" (report the result) or
+# "regenerate" (retry invalid code up to CODE_VALIDATION_RETRIES times, then flag).
+CODE_VALIDATION = os.getenv("CODE_VALIDATION", "off").lower()
+CODE_VALIDATION_RETRIES = int(os.getenv("CODE_VALIDATION_RETRIES", "1"))
+
+sandbox = SandboxPool(
+    workers=int(os.getenv("SANDBOX_WORKERS", "2")),
+    cpu_seconds=int(os.getenv("SANDBOX_CPU_SECONDS", "2")),
+    memory_mb=int(os.getenv("SANDBOX_MEMORY_MB", "256")),
+    timeout=float(os.getenv("SANDBOX_TIMEOUT", "5"))
+) if CODE_VALIDATION in ("flag", "regenerate") else None
+
+# Items of one /batch request in flight at once, and the most items it may hold.
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "2"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# Texts one /classify/batch request may hold; larger batches are scored off the event loop.
+CLASSIFY_BATCH_MAX = int(os.getenv("CLASSIFY_BATCH_MAX", "10000"))
+CLASSIFY_THREAD_THRESHOLD = 256
+
+# Seconds between checks that the client of a non-streaming generation is still connected.
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.25"))
+
+# Only the newest autocomplete request of each user is worth finishing.
+autocomplete_jobs = SupersedingJobs()
+
+# Identical requests in flight at the same time share one generation.
+in_flight = SingleFlight()
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+    collection=lambda: get_db().response_cache,
+    db_timeout=int(os.getenv("RESPONSE_CACHE_DB_TIMEOUT_MS", "200")) / 1000,
+    db_retry_after=float(os.getenv("RESPONSE_CACHE_DB_RETRY_SECONDS", "30"))
+)
+
+# Answers shared by similar prompts on SEMANTIC_CACHE_ENDPOINTS, matched by embedding.
+semantic_cache = SemanticCache(
+    capacity=int(os.getenv("SEMANTIC_CACHE_SIZE", "10000")),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+    path=os.getenv("SEMANTIC_CACHE_PATH") or None
+) if SEMANTIC_CACHE_ENDPOINTS and "embed" in MODEL_POOL.routes else None
+
+app.add_middleware(metrics.RequestTimer)
+app.add_middleware(UsageRecorder, writer=telemetry)
+
 allowed_origins = os.getenv("CORS_ALLOWED_ORIGINS", "").split(",")
 app.add_middleware(
     CORSMiddleware,
@@ -32,23 +114,459 @@ app.add_middleware(
 def root():
     return {"message": "Code Assistant API is running"}
 
+# Startup steps that run in the background; /ready answers 200 once all are done.
+readiness = {"models": False, "database": False}
+startup_errors = {}
+warm_up_task: asyncio.Task | None = None
+
+@app.get("/live")
+async def live():
+    """
+    Liveness probe: the process serves HTTP, whether or not it is ready.
+    """
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the models are loaded and MongoDB is connected.
+
+    With a shared inference server, the server's socket is checked on every
+    probe, so a crashed server turns the probe to 503 instead of every request
+    failing behind a cached answer.
+
+    Returns:
+        JSONResponse: Status of each startup step, 503 while any is pending or the server is gone.
+    """
+    steps = dict(readiness)
+    if INFERENCE_SOCKET and readiness["models"]:
+        steps["inference_server"] = await remote_executor.reachable()
+    ok = all(steps.values())
+    content = {"status": "ready" if ok else ("unavailable" if all(readiness.values()) else "starting"),
+               "steps": steps}
+    if startup_errors:
+        content["errors"] = startup_errors
+    return JSONResponse(status_code=200 if ok else 503, content=content)
+
 @app.get("/health")
-def health():
+async def health():
     try:
-        _load_model()
-        return {"status": "ok"}
+        if INFERENCE_SOCKET:
+            return {
+                "status": "ok",
+                "ready": readiness,
+                "inference_server": await remote_executor.server_stats(),
+                "client": remote_executor.stats(),
+                "response_cache": response_cache.stats(),
+                "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+                "sandbox": sandbox.stats() if sandbox is not None else None,
+                "telemetry": telemetry.stats(),
+                "auth": auth_stats(),
+                "in_flight": in_flight.stats()
+            }
+        return {
+            "status": "ok",
+            "ready": readiness,
+            "queues": {name: executor.stats() for name, executor in executors.items()},
+            "models": model_stats(),
+            "speculative": speculative_stats(),
+            "response_cache": response_cache.stats(),
+            "semantic_cache": semantic_cache.stats() if semantic_cache is not None else None,
+            "sandbox": sandbox.stats() if sandbox is not None else None,
+            "telemetry": telemetry.stats(),
+            "auth": auth_stats(),
+            "in_flight": in_flight.stats()
+        }
     except Exception as e:
         return {"status": "error", "detail": str(e)}
 
-@app.on_event("startup")
-def startup_event():
-    _load_model()
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Expose stage timings as Prometheus histograms.
+
+    Auth and request times come from this worker only and are labelled
+    with its pid: with several uvicorn workers each scrape reaches one of
+    them, so sum the series over the "worker" label. Queue wait, prompt
+    evaluation, generation and postprocessing come from the process that
+    runs the models (the shared inference server when INFERENCE_SOCKET is set).
+
+    Returns:
+        PlainTextResponse: Prometheus text exposition.
+    """
+    text = metrics.render()
+    if INFERENCE_SOCKET:
+        try:
+            text += await remote_executor.server_metrics()
+        except Exception:
+            print("Error reading inference server metrics:", traceback.format_exc())
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+def _request_key(endpoint: str, **fields) -> str:
+    """
+    Build the response cache key for a generation endpoint.
+
+    Args:
+        endpoint (str): Endpoint name, also the key into TEMPERATURES.
+        **fields: Normalized request fields that affect the output.
+
+    Returns:
+        str: Cache key.
+    """
+    return cache_key(endpoint, model_id(endpoint), TEMPERATURES[endpoint], **fields)
+
+def _similar(endpoint: str, text: str, **fields) -> tuple[str, str] | None:
+    """
+    Describe a request for the semantic cache, if its endpoint uses it.
+
+    Args:
+        endpoint (str): Endpoint name.
+        text (str): Normalized text matched by similarity, e.g. the prompt.
+        **fields: Other normalized fields that affect the output; they must match exactly.
+
+    Returns:
+        tuple[str, str] | None: Partition and text, or None when the endpoint is not semantically cached.
+    """
+    if semantic_cache is None or endpoint not in SEMANTIC_CACHE_ENDPOINTS:
+        return None
+    return _request_key(endpoint, **fields), text
+
+def _executor(endpoint: str) -> InferenceExecutor:
+    return executors[MODEL_POOL.route(endpoint).name]
+
+def _cache_policy(request: Request) -> tuple[bool, bool]:
+    """
+    Read the cache bypass flags from the Cache-Control header.
+
+    "no-cache" skips the lookup but stores the fresh result; "no-store"
+    skips both.
+
+    Returns:
+        tuple[bool, bool]: Whether to look up and whether to store.
+    """
+    directives = request.headers.get("cache-control", "").lower()
+    store = "no-store" not in directives
+    return store and "no-cache" not in directives, store
+
+def _cacheable(text: str) -> bool:
+    return bool(text) and not text.startswith("⚠️") and not text.startswith("❌")
+
+async def _semantic_lookup(request: Request, similar: tuple[str, str] | None, priority: int):
+    """
+    Embed a request's text and look for the answer of a similar one.
+
+    Embedding errors (e.g. a full queue) count as a miss.
+
+    Returns:
+        tuple: Cached answer or None, and the embedding (None if it failed).
+    """
+    if similar is None:
+        return None, None
+    partition, text = similar
+    try:
+        embedding = await _executor("embed").submit(
+            embed_text, text, priority=priority, user=getattr(request.state, "user_id", None)
+        )
+    except Exception as e:
+        semantic_cache.errors += 1
+        print(f"⚠️ Semantic cache lookup skipped: {e}")
+        return None, None
+    match = semantic_cache.get(partition, embedding)
+    if match is None:
+        return None, embedding
+    answer, similarity, matched = match
+    # Logged so hits can be audited for false positives.
+    print(f"🧠 Semantic cache hit on {request.url.path} ({similarity:.3f}): {text[:80]!r} ~ {matched[:80]!r}")
+    return answer, embedding
+
+async def _store(request: Request, key: str, text: str, similar=None, embedding=None):
+    await response_cache.set(key, text, request.url.path)
+    if similar is not None and embedding is not None:
+        semantic_cache.add(similar[0], embedding, text, similar[1])
+
+async def _unless_disconnected(request: Request, call):
+    """
+    Await a generation, giving it up if the client disconnects first.
+
+    Giving up cancels the wait; the executor then stops the job at its next
+    token and frees the model (a coalesced job keeps running while other
+    callers still wait for it). Streaming responses need no watching:
+    Starlette closes their iterator when the client leaves.
+
+    Args:
+        request (Request): Request whose client is watched.
+        call (Awaitable): The generation.
+
+    Returns:
+        Any: Result of the call.
+
+    Raises:
+        ClientDisconnectedError: If the client left before the result was ready.
+    """
+    task = asyncio.ensure_future(call)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                raise ClientDisconnectedError("Client disconnected before the response was ready")
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def _cached_submit(request: Request, endpoint: str, key: str, fn, *args,
+                         priority: int = PRIORITY_GENERATE, cancel=None, check=None, similar=None) -> str:
+    """
+    Serve a generation from the response cache, or run it and cache the result.
+
+    Results of cancelled jobs are partial and never cached, and neither are
+    fresh results rejected by check (an async predicate).
+
+    On a cache miss, a request identical to one already generating (same
+    key, and cacheable) waits for that generation instead of starting its
+    own; only the request that started it stores the result.
+
+    With similar (from _similar), an exact miss is looked up in the
+    semantic cache before generating.
+
+    Returns:
+        str: Generated (or cached) text.
+    """
+    lookup, store = _cache_policy(request)
+    embedding = None
+    if lookup:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            return cached
+        cached, embedding = await _semantic_lookup(request, similar, priority)
+        if cached is not None:
+            return cached
+    else:
+        response_cache.bypass()
+
+    def submit():
+        return _executor(endpoint).submit(
+            fn, *args, priority=priority, cancel=cancel, user=getattr(request.state, "user_id", None)
+        )
+
+    # Superseding jobs (cancel) belong to one user and cannot be shared.
+    if lookup and cancel is None:
+        result, leader = await _unless_disconnected(request, in_flight.run(key, submit))
+    else:
+        result, leader = await _unless_disconnected(request, submit()), True
+    if check is not None and _cacheable(result) and not await check(result):
+        return result
+    if leader and store and _cacheable(result) and not (cancel is not None and cancel.is_set()):
+        await _store(request, key, result, similar, embedding)
+    return result
+
+def _code_check(language: str):
+    """
+    Return a check for _cached_submit that passes code the sandbox pool validates.
+
+    /reply-code-only serves its cache hits without validating them again, so
+    every path that stores code-only replies must validate them first.
+
+    Returns:
+        Callable | None: Async predicate, or None when CODE_VALIDATION is off.
+    """
+    if sandbox is None:
+        return None
+
+    async def check(code: str) -> bool:
+        return (await sandbox.validate(code, language)).valid
+
+    return check
+
+async def _replay(text: str):
+    yield text
+
+async def _cached_stream(request: Request, endpoint: str, key: str, fn, *args,
+                         priority: int = PRIORITY_GENERATE, cancel=None, similar=None):
+    """
+    Streaming counterpart of _cached_submit.
+
+    A request identical to a stream already generating subscribes to it,
+    replaying the tokens produced so far.
+
+    Returns:
+        tuple: Text pieces, and a coroutine function storing the full text (None on a hit or with no-store).
+    """
+    lookup, store = _cache_policy(request)
+    embedding = None
+    if lookup:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            return _replay(cached), None
+        cached, embedding = await _semantic_lookup(request, similar, priority)
+        if cached is not None:
+            return _replay(cached), None
+    else:
+        response_cache.bypass()
+
+    def save(text: str):
+        return _store(request, key, text, similar, embedding)
+
+    def open_stream():
+        return _executor(endpoint).open_stream(
+            fn, *args, priority=priority, cancel=cancel, user=getattr(request.state, "user_id", None)
+        )
+
+    if lookup and cancel is None:
+        chunks, leader = await in_flight.stream(key, open_stream)
+        return chunks, save if store and leader else None
+    return await open_stream(), save if store else None
+
+def _streaming_response(request: Request, chunks, field: str, start: float,
+                        cache=None, cancel=None) -> StreamingResponse:
+    """
+    Send a token stream as NDJSON, or as Server-Sent Events when requested.
+
+    Each decoded piece is sent as {"token": ...}. The last event carries the
+    full text under `field` together with time-to-first-token and duration.
+
+    Args:
+        request (Request): Incoming request, used to pick the wire format.
+        chunks (AsyncIterator[str]): Text pieces from executor.stream.
+        field (str): Name of the result field in the final event.
+        start (float): Request start time.
+        cache (Callable): Stores the full text in the response cache, from _cached_stream.
+        cancel (threading.Event): Cancel event of a job that may be superseded.
+
+    Returns:
+        StreamingResponse: Chunked response.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def events():
+        parts = []
+        ttft = None
+        try:
+            async for chunk in chunks:
+                if ttft is None:
+                    ttft = time.time() - start
+                parts.append(chunk)
+                yield {"token": chunk}
+            text = "".join(parts)
+            if cancel is not None and cancel.is_set():
+                yield {"done": True, field: text, "superseded": True}
+                return
+            yield {"done": True, field: text, "ttft": ttft, "duration": time.time() - start}
+            if cache is not None and _cacheable(text):
+                await cache(text)
+        except JobCancelledError:
+            yield {"done": True, field: "", "superseded": True}
+        except JobDeadlineError as e:
+            # The pieces already sent stand; the cut-off text is not cached.
+            yield {"done": True, field: "".join(parts), "error": str(e), "deadline_exceeded": True}
+        except QueueFullError as e:
+            yield {"error": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            print(f"Error in {request.url.path}:", traceback.format_exc())
+            yield {"error": f"⚠️ Internal assistant error ({str(e)})"}
+
+    async def body():
+        async for event in events():
+            data = json.dumps(event)
+            yield f"data: {data}\n\n" if sse else data + "\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream" if sse else "application/x-ndjson")
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    # A user over their own share gets 429; an overloaded model gets 503.
+    return JSONResponse(
+        status_code=429 if isinstance(exc, UserQueueFullError) else 503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after))}
+    )
+
+@app.exception_handler(JobAbortedError)
+async def job_aborted_handler(request: Request, exc: JobAbortedError):
+    # 499 is never seen by the departed client; it only marks the request in logs and metrics.
+    return JSONResponse(
+        status_code=504 if isinstance(exc, JobDeadlineError) else 499,
+        content={"detail": str(exc)}
+    )
+
+@app.exception_handler(ContextOverflowError)
+async def context_overflow_handler(request: Request, exc: ContextOverflowError):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+async def _load_models():
+    # Remote executors wait here until the inference server has loaded them.
+    for executor in set(executors.values()):
+        await executor.start()
+    if not INFERENCE_SOCKET:
+        await asyncio.to_thread(_load_model)
     print("✅ Model preloaded")
-    connect_db()
-    print("✅ MongoDB connection established")
+
+async def _connect_db():
+    # MongoDB may come up after the API; keep trying instead of failing the pod.
+    delay = 1
+    while True:
+        try:
+            await asyncio.to_thread(connect_db)
+            print("✅ MongoDB connection established")
+            return
+        except Exception as e:
+            startup_errors["database"] = str(e)
+            print(f"⚠️ MongoDB not reachable, retrying in {delay}s:", e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+async def _warm_up():
+    """
+    Load the models and connect to MongoDB concurrently, recording readiness.
+    """
+    async def step(name, start):
+        try:
+            await start()
+        except Exception as e:
+            startup_errors[name] = str(e)
+            print(f"❌ Startup step {name} failed:", traceback.format_exc())
+            return
+        startup_errors.pop(name, None)
+        readiness[name] = True
+
+    start = time.time()
+    await asyncio.gather(step("models", _load_models), step("database", _connect_db))
+    if all(readiness.values()):
+        print(f"✅ Ready in {time.time() - start:.1f}s")
+
+@app.on_event("startup")
+async def startup_event():
+    """
+    Start serving at once and warm up in the background.
+
+    /live answers immediately; /ready turns 200 once the models are loaded
+    and MongoDB is connected. Requests arriving earlier wait for the model.
+    """
+    global warm_up_task
+    start_cert_refresh()
+    if not INFERENCE_SOCKET:
+        # Local executors start instantly; jobs wait in the queue for the model load.
+        for executor in set(executors.values()):
+            await executor.start()
+    if sandbox is not None:
+        await sandbox.start()
+    warm_up_task = asyncio.create_task(_warm_up())
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+    for executor in set(executors.values()):
+        await executor.stop()
+    MODEL_POOL.close()
+    print("🛑 Inference executor stopped")
+    if semantic_cache is not None:
+        semantic_cache.save()
+    if sandbox is not None:
+        await sandbox.stop()
+        print("🛑 Sandbox pool stopped")
     close_db()
     print("🛑 MongoDB connection closed")
 
@@ -57,7 +575,7 @@ if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=port, reload=False)
 
 @app.post("/generate")
-async def generate(data: CodePrompt, user=Depends(verify_token)):
+async def generate(data: CodePrompt, request: Request, user=Depends(verify_token)):
     """
     Generate code snippet based on a given prompt.
 
@@ -69,21 +587,58 @@ async def generate(data: CodePrompt, user=Depends(verify_token)):
         dict: Generated code snippet.
     """
     try:
-        code = generate_code(data.prompt, data.language)
+        prompt = normalize_text(data.prompt)
+        key = _request_key("generate", prompt=prompt, language=data.language)
+        code = await _cached_submit(request, "generate", key, generate_code, data.prompt, data.language,
+                                    similar=_similar("generate", prompt, language=data.language))
         return {"code": code}
+    except (QueueFullError, ContextOverflowError, JobAbortedError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/autocomplete")
-async def autocomplete(data: CodeInput, user=Depends(verify_token)):
+async def autocomplete(data: CodeInput, request: Request, user=Depends(verify_token)):
+    """
+    Suggest a continuation for the code being typed.
+
+    A newer request from the same user cancels this one, which then returns
+    an empty suggestion flagged as superseded.
+
+    Args:
+        data (CodeInput): Code typed so far and its language.
+        user (dict): Authenticated user information.
+
+    Returns:
+        dict: Suggestion, or a superseded flag.
+    """
+    cancel = autocomplete_jobs.start(user["uid"])
     try:
-        suggestion = autocomplete_code(data.code, data.language)
+        key = _request_key("autocomplete", code=normalize_code(data.code), language=data.language)
+        suggestion = await _cached_submit(
+            request,
+            "autocomplete",
+            key,
+            autocomplete_code,
+            data.code,
+            data.language,
+            user["uid"],
+            cancel,
+            priority=PRIORITY_AUTOCOMPLETE,
+            cancel=cancel
+        )
+        if cancel.is_set():
+            return {"suggestion": "", "superseded": True}
         return {"suggestion": suggestion}
+    except JobCancelledError:
+        return {"suggestion": "", "superseded": True}
+    except (QueueFullError, ContextOverflowError, JobAbortedError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/reply")
-async def reply(data: CodeRequest, user=Depends(verify_token)):
+async def reply(data: CodeRequest, request: Request, user=Depends(verify_token)):
     """
     Generate mentor-style explanation for provided code.
 
@@ -96,12 +651,20 @@ async def reply(data: CodeRequest, user=Depends(verify_token)):
     """
     try:
         start = time.time()
-        response = generate_reply(
+        code = normalize_code(data.code)
+        key = _request_key("reply", code=code, language=data.language, user_level=data.user_level)
+        response = await _cached_submit(
+            request,
+            "reply",
+            key,
+            generate_reply,
             data.prompt,
             data.language,
             data.code,
             user["uid"],
-            data.user_level
+            data.user_level,
+            priority=PRIORITY_REPLY,
+            similar=_similar("reply", code, language=data.language, user_level=data.user_level)
         )
         duration = time.time() - start
 
@@ -109,40 +672,113 @@ async def reply(data: CodeRequest, user=Depends(verify_token)):
             return {"reply": "⚠️ Unable to generate explanation, please try again."}
 
         return {"reply": response, "duration": duration}
+    except (QueueFullError, ContextOverflowError, JobAbortedError):
+        raise
     except Exception as e:
         print("Error in /reply:", traceback.format_exc())
         return {"reply": f"⚠️ Internal assistant error ({str(e)})"}
 
 @app.post("/reply-code-only")
-async def reply_code_only(data: CodeRequest, user=Depends(verify_token)):
+async def reply_code_only(data: CodeRequest, request: Request, user=Depends(verify_token)):
     """
     Generate code-only response for a given prompt.
 
+    With CODE_VALIDATION enabled the code is checked in the sandbox pool;
+    invalid code is regenerated (in "regenerate" mode) and is never cached.
+
     Args:
         data (CodeRequest): Prompt, language, code, and user information.
         user (dict): Authenticated user information.
 
     Returns:
-        dict: Generated code and duration.
+        dict: Generated code and duration, plus the validation result when enabled.
     """
     try:
         start = time.time()
-        response = generate_reply_code_only(
-            data.prompt,
-            data.language,
-            data.code,
-            user["uid"]
+        key = _request_key(
+            "reply-code-only",
+            prompt=normalize_text(data.prompt),
+            code=normalize_code(data.code),
+            language=data.language
         )
+        validations = []
+
+        async def check(code: str) -> bool:
+            validations.append(await sandbox.validate(code, data.language))
+            return validations[-1].valid
+
+        attempts = 1 + (CODE_VALIDATION_RETRIES if CODE_VALIDATION == "regenerate" else 0)
+        for _ in range(attempts):
+            validations.clear()
+            response = await _cached_submit(
+                request,
+                "reply-code-only",
+                key,
+                generate_reply_code_only,
+                data.prompt,
+                data.language,
+                data.code,
+                user["uid"],
+                priority=PRIORITY_REPLY,
+                check=check if sandbox is not None else None
+            )
+            # Cache hits passed validation when they were stored.
+            if not validations or validations[-1].valid:
+                break
         duration = time.time() - start
 
         if not response or response.startswith("⚠️") or response.startswith("❌"):
             return {"code": "⚠️ Unable to generate valid code."}
 
-        return {"code": response, "duration": duration}
+        result = {"code": response, "duration": duration}
+        if sandbox is not None:
+            result["valid"] = not validations or validations[-1].valid
+            if not result["valid"]:
+                result["validation_error"] = validations[-1].error
+        return result
+    except (QueueFullError, ContextOverflowError, JobAbortedError):
+        raise
     except Exception as e:
         print("Error in /reply-code-only:", traceback.format_exc())
         return {"code": f"⚠️ Internal assistant error ({str(e)})"}
 
+@app.post("/batch")
+async def batch(request: Request, user=Depends(verify_token)):
+    """
+    Run many generation requests from one JSONL body.
+
+    Each line is a CodePrompt or CodeRequest record with an optional "id"
+    and "endpoint" ("generate", "reply" or "reply-code-only"). Items run at
+    the lowest queue priority, ordered to reuse prompt prefixes, and share
+    the response cache with the single-item endpoints.
+
+    Args:
+        request (Request): Request whose body holds the JSONL records.
+        user (dict): Authenticated user information.
+
+    Returns:
+        StreamingResponse: One NDJSON result per record, in completion order.
+    """
+    body = (await request.body()).decode("utf-8")
+    items, errors = parse_records(body.splitlines(), user_id=user["uid"])
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch holds more than {BATCH_MAX_ITEMS} items")
+
+    async def submit(item: BatchItem) -> str:
+        op = item.operation
+        key = _request_key(item.endpoint, **op.key_fields(item.data))
+        check = _code_check(item.data.language) if item.endpoint == "reply-code-only" else None
+        return await _cached_submit(request, item.endpoint, key, op.fn, *op.args(item.data),
+                                    priority=PRIORITY_BATCH, check=check)
+
+    async def results():
+        for error in errors:
+            yield json.dumps(error) + "\n"
+        async for result in run_batch(items, submit, BATCH_CONCURRENCY):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.post("/classify")
 async def classify(request: Request, user=Depends(verify_token)):
     """
@@ -153,22 +789,143 @@ async def classify(request: Request, user=Depends(verify_token)):
         user (dict): Authenticated user information.
 
     Returns:
-        dict: Original text and classification label.
+        dict: Original text, classification label and sentiment score.
     """
     try:
         data = await request.json()
         text = data.get("text", "").lower()
+        label, score = classify_text(text)
+        return {"text": text, "classification": label, "score": score}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        positive_words = ["good", "excellent", "happy", "fantastic", "positive", "great", "wonderful"]
-        negative_words = ["bad", "terrible", "sad", "horrible", "negative", "awful", "fatal"]
+@app.post("/classify/batch")
+async def classify_many(data: ClassifyBatch, user=Depends(verify_token)):
+    """
+    Classify the sentiment of many texts, e.g. a whole chat log, at once.
 
-        if any(word in text for word in positive_words):
-            label = "positive"
-        elif any(word in text for word in negative_words):
-            label = "negative"
-        else:
-            label = "neutral"
+    Args:
+        data (ClassifyBatch): Texts to classify.
+        user (dict): Authenticated user information.
 
-        return {"text": text, "classification": label}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    Returns:
+        dict: Label and score of every text, in order, and the count of each label.
+    """
+    if len(data.texts) > CLASSIFY_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch holds more than {CLASSIFY_BATCH_MAX} texts")
+    if len(data.texts) > CLASSIFY_THREAD_THRESHOLD:
+        scored = await asyncio.to_thread(classify_batch, data.texts)
+    else:
+        scored = classify_batch(data.texts)
+    counts = {"positive": 0, "negative": 0, "neutral": 0}
+    for label, _ in scored:
+        counts[label] += 1
+    return {
+        "results": [{"classification": label, "score": score} for label, score in scored],
+        "counts": counts
+    }
+
+@app.post("/generate/stream")
+async def generate_stream(data: CodePrompt, request: Request, user=Depends(verify_token)):
+    """
+    Streaming variant of /generate.
+
+    Returns:
+        StreamingResponse: Code pieces, then a final event with the full code.
+    """
+    start = time.time()
+    prompt = normalize_text(data.prompt)
+    key = _request_key("generate", prompt=prompt, language=data.language)
+    chunks, cache = await _cached_stream(request, "generate", key, stream_code, data.prompt, data.language,
+                                         similar=_similar("generate", prompt, language=data.language))
+    return _streaming_response(request, chunks, "code", start, cache)
+
+@app.post("/autocomplete/stream")
+async def autocomplete_stream(data: CodeInput, request: Request, user=Depends(verify_token)):
+    """
+    Streaming variant of /autocomplete.
+
+    Returns:
+        StreamingResponse: Suggestion pieces, then a final event with the full suggestion.
+    """
+    start = time.time()
+    cancel = autocomplete_jobs.start(user["uid"])
+    key = _request_key("autocomplete", code=normalize_code(data.code), language=data.language)
+    chunks, cache = await _cached_stream(
+        request,
+        "autocomplete",
+        key,
+        stream_autocomplete,
+        data.code,
+        data.language,
+        user["uid"],
+        cancel,
+        priority=PRIORITY_AUTOCOMPLETE,
+        cancel=cancel
+    )
+    return _streaming_response(request, chunks, "suggestion", start, cache, cancel)
+
+@app.post("/reply/stream")
+async def reply_stream(data: CodeRequest, request: Request, user=Depends(verify_token)):
+    """
+    Streaming variant of /reply.
+
+    Returns:
+        StreamingResponse: Explanation pieces, then a final event with the full reply.
+    """
+    start = time.time()
+    code = normalize_code(data.code)
+    key = _request_key("reply", code=code, language=data.language, user_level=data.user_level)
+    chunks, cache = await _cached_stream(
+        request,
+        "reply",
+        key,
+        stream_reply,
+        data.prompt,
+        data.language,
+        data.code,
+        user["uid"],
+        data.user_level,
+        priority=PRIORITY_REPLY,
+        similar=_similar("reply", code, language=data.language, user_level=data.user_level)
+    )
+    return _streaming_response(request, chunks, "reply", start, cache)
+
+@app.post("/reply-code-only/stream")
+async def reply_code_only_stream(data: CodeRequest, request: Request, user=Depends(verify_token)):
+    """
+    Streaming variant of /reply-code-only.
+
+    With CODE_VALIDATION enabled, the streamed code is validated before it is
+    cached, since /reply-code-only serves cache hits as they are.
+
+    Returns:
+        StreamingResponse: Code pieces, then a final event with the full code.
+    """
+    start = time.time()
+    key = _request_key(
+        "reply-code-only",
+        prompt=normalize_text(data.prompt),
+        code=normalize_code(data.code),
+        language=data.language
+    )
+    chunks, cache = await _cached_stream(
+        request,
+        "reply-code-only",
+        key,
+        stream_reply_code_only,
+        data.prompt,
+        data.language,
+        data.code,
+        user["uid"],
+        priority=PRIORITY_REPLY
+    )
+    check = _code_check(data.language)
+    if cache is not None and check is not None:
+        store = cache
+
+        async def cache(code: str):
+            if await check(code):
+                await store(code)
+
+    return _streaming_response(request, chunks, "code", start, cache)
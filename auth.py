@@ -1,10 +1,222 @@
 import os
+import re
 import json
-import firebase_admin
-from firebase_admin import credentials, auth
-from fastapi import Header, HTTPException
+import time
+import asyncio
+import hashlib
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Callable
 
-# Only initialize Firebase if not in test mode
+from fastapi import Header, HTTPException, Request
+
+from metrics import AUTH_SECONDS
+
+# Public certificates of the keys signing Firebase ID tokens.
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_ISSUER = "https://securetoken.google.com/"
+
+
+class TokenCache:
+    """
+    LRU cache of verified token claims, keyed by the token's SHA-256.
+
+    An entry lives until the token's own "exp" claim, so a cached token is
+    never accepted after Firebase would have rejected it.
+
+    Args:
+        max_entries (int): Tokens kept at most; the least recently used goes first.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> dict | None:
+        """
+        Look up the claims of a verified, unexpired token.
+
+        Args:
+            token (str): Raw ID token.
+
+        Returns:
+            dict | None: The cached claims, or None.
+        """
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, claims: dict):
+        """
+        Cache the claims of a token that passed verification.
+
+        Args:
+            token (str): Raw ID token.
+            claims (dict): Its decoded claims; "exp" bounds the entry's life.
+        """
+        if self.max_entries <= 0 or "exp" not in claims:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (claims, float(claims["exp"]))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def fetch_firebase_certs() -> tuple[dict, float]:
+    """
+    Download the Firebase token signing certificates.
+
+    Returns:
+        tuple[dict, float]: Certificates by key id, and the seconds they may be cached.
+    """
+    import requests
+
+    response = requests.get(FIREBASE_CERTS_URL, timeout=10)
+    response.raise_for_status()
+    max_age = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return response.json(), float(max_age.group(1)) if max_age else 3600.0
+
+
+class CertificateStore:
+    """
+    Signing certificates kept fresh by a background thread.
+
+    The thread refetches the certificates shortly before their max-age runs
+    out, so requests read them from memory and never wait on the network.
+    Only a request arriving before the very first fetch fetches them itself.
+
+    Args:
+        fetch (Callable): Returns (certificates by key id, max-age in seconds).
+        refresh_margin (float): Seconds before expiry to refetch.
+        retry_interval (float): Seconds between attempts after a failed fetch.
+    """
+
+    def __init__(self, fetch: Callable = fetch_firebase_certs, refresh_margin: float = 300,
+                 retry_interval: float = 60):
+        self._fetch = fetch
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._certs = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.refreshes = 0
+
+    def refresh(self) -> float:
+        """
+        Fetch the certificates now.
+
+        Returns:
+            float: Seconds until the next refresh is due.
+        """
+        certs, max_age = self._fetch()
+        self._certs = certs
+        self.refreshes += 1
+        return max(self.retry_interval, max_age - self.refresh_margin)
+
+    def get(self) -> dict:
+        """
+        Return the current certificates, fetching them if none were loaded yet.
+        """
+        if self._certs is None:
+            with self._lock:
+                if self._certs is None:
+                    self.refresh()
+        return self._certs
+
+    def start(self):
+        """
+        Start the refresh thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cert-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                delay = self.refresh()
+            except Exception:
+                print("⚠️ Error refreshing Firebase certificates:", traceback.format_exc())
+                delay = self.retry_interval
+            self._stopping.wait(delay)
+
+
+class FirebaseVerifier:
+    """
+    Local verification of Firebase ID tokens against cached certificates.
+
+    Performs the checks of firebase_admin.auth.verify_id_token (signature,
+    expiry, audience, issuer, subject) without its network round trips.
+
+    Args:
+        project_id (str): Firebase project the tokens must be issued for.
+        certificates (CertificateStore): Source of the signing certificates.
+    """
+
+    def __init__(self, project_id: str, certificates: CertificateStore):
+        self.project_id = project_id
+        self.certificates = certificates
+
+    def __call__(self, token: str) -> dict:
+        """
+        Verify a token.
+
+        Args:
+            token (str): Raw ID token.
+
+        Returns:
+            dict: Its claims, with "uid" set to the subject.
+
+        Raises:
+            ValueError: If the token is invalid or expired.
+        """
+        from google.auth import jwt
+
+        claims = jwt.decode(token, certs=self.certificates.get(), audience=self.project_id)
+        if claims.get("iss") != FIREBASE_ISSUER + self.project_id:
+            raise ValueError("Token has an incorrect issuer")
+        if not claims.get("sub") or not isinstance(claims["sub"], str) or len(claims["sub"]) > 128:
+            raise ValueError("Token has an invalid subject")
+        claims["uid"] = claims["sub"]
+        return claims
+
+
+token_cache = TokenCache(max_entries=int(os.getenv("AUTH_CACHE_SIZE", "10000")))
+certificates: CertificateStore | None = None
+verifier: Callable[[str], dict] | None = None
+
+# Only initialize Firebase if not in test mode. Tokens are verified locally,
+# so only the project id is needed and the firebase_admin SDK is not loaded.
 if os.getenv("TEST_MODE") != "true":
     firebase_credentials = os.environ.get("FIREBASE_CREDENTIAL_JSON")
 
@@ -14,26 +226,74 @@ if os.getenv("TEST_MODE") != "true":
     try:
         # Parse the JSON string directly from the environment variable
         cred_dict = json.loads(firebase_credentials)
-        cred = credentials.Certificate(cred_dict)
-        firebase_admin.initialize_app(cred)
-        print("✅ Firebase initialized")
     except json.JSONDecodeError:
         raise RuntimeError("Invalid FIREBASE_CREDENTIAL_JSON: not valid JSON")
+    if not cred_dict.get("project_id"):
+        raise RuntimeError("Invalid FIREBASE_CREDENTIAL_JSON: missing project_id")
+    certificates = CertificateStore()
+    verifier = FirebaseVerifier(cred_dict["project_id"], certificates)
+    print("✅ Firebase initialized")
 
-def verify_token(authorization: str = Header(...)):
+
+def set_verifier(new_verifier: Callable[[str], dict] | None):
+    """
+    Replace the token verifier, e.g. with one trusting a local test key.
+
+    Args:
+        new_verifier (Callable | None): Maps a raw token to its claims (with
+            "uid") or raises; None accepts any token as the test user.
+    """
+    global verifier
+    verifier = new_verifier
+    token_cache.clear()
+
+
+def start_cert_refresh():
+    """
+    Start refreshing the signing certificates in the background.
+    """
+    if certificates is not None:
+        certificates.start()
+
+
+async def verify_token(request: Request, authorization: str = Header(...)):
     """
     Verify Firebase authentication token.
     In test mode, accepts any token and returns a fake user.
+    The user id is kept in request.state for usage telemetry.
+
+    Verified tokens are cached until they expire, so repeat requests skip
+    signature checks; a cache miss verifies in a worker thread.
     """
-    if os.getenv("TEST_MODE") == "true":
+    with AUTH_SECONDS.time(endpoint=request.url.path, worker=os.getpid()):
+        user = await _verify(authorization)
+    request.state.user_id = user["uid"]
+    return user
+
+async def _verify(authorization: str) -> dict:
+    if verifier is None:
         return {"uid": "test_user", "email": "test@example.com"}
 
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid token format")
 
     token = authorization.split(" ")[1]
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
     try:
-        decoded = auth.verify_id_token(token)
-        return decoded
+        claims = await asyncio.to_thread(verifier, token)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
+    token_cache.put(token, claims)
+    return claims
+
+
+def auth_stats() -> dict:
+    """
+    Report token cache and certificate refresh counters.
+    """
+    return {
+        **token_cache.stats(),
+        "cert_refreshes": certificates.refreshes if certificates is not None else None,
+    }
@@ -0,0 +1,315 @@
+"""
+Hardware auto-tuner for the llama.cpp settings of the served models.
+
+Sweeps n_threads, n_batch and mmap/mlock on this host against
+representative prompts, measures prompt evaluation and decode throughput,
+and saves the fastest settings as a profile keyed by CPU model and core
+count. ModelPool.load applies the matching profile automatically, so each
+instance type runs with the settings measured on it.
+
+Usage:
+    python autotune.py                      # every model of the pool
+    python autotune.py --name mentor --threads 4,8 --batch 128,256,512
+    python autotune.py --model models/tinyllama.gguf --mlock
+    python autotune.py --repo-id org/repo --filename model.gguf
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Settings a profile may set; settings given in MODEL_CONFIG are kept.
+TUNABLE = ("n_threads", "n_batch", "use_mmap", "use_mlock")
+
+_profiles_lock = threading.Lock()
+
+
+def profile_path() -> str:
+    """
+    Path of the profile file (TUNING_PROFILES, default tuning_profiles.json).
+    """
+    return os.getenv("TUNING_PROFILES", os.path.join(PROJECT_ROOT, "tuning_profiles.json"))
+
+
+def cpu_key() -> str:
+    """
+    Identify this host's CPU model and core count.
+
+    Returns:
+        str: e.g. "intel-xeon-platinum-8375c-cpu-2-90ghz-8c".
+    """
+    name = ""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    name = line.split(":", 1)[1]
+                    break
+    except OSError:
+        pass
+    name = name or platform.processor() or platform.machine()
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower().replace("(r)", "").replace("(tm)", "")).strip("-")
+    return f"{slug}-{os.cpu_count() or 1}c"
+
+
+def load_profiles(path: str | None = None) -> dict:
+    """
+    Read every saved profile.
+
+    Returns:
+        dict: Profiles by CPU key, then by model id.
+    """
+    try:
+        with open(path or profile_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def find_profile(model_id: str, path: str | None = None) -> dict | None:
+    """
+    Return the profile tuned for a model on this host's CPU, if any.
+
+    Args:
+        model_id (str): ModelSpec.model_id of the model.
+        path (str): Profile file, TUNING_PROFILES by default.
+
+    Returns:
+        dict | None: Tuned settings and their measurements.
+    """
+    return load_profiles(path).get(cpu_key(), {}).get(model_id)
+
+
+def save_profile(model_id: str, profile: dict, path: str | None = None):
+    """
+    Store a model's profile for this host's CPU, keeping the others.
+
+    Args:
+        model_id (str): ModelSpec.model_id of the model.
+        profile (dict): Tuned settings and their measurements.
+        path (str): Profile file, TUNING_PROFILES by default.
+    """
+    path = path or profile_path()
+    with _profiles_lock:
+        profiles = load_profiles(path)
+        profiles.setdefault(cpu_key(), {})[model_id] = profile
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+
+def apply_profile(spec, path: str | None = None) -> dict | None:
+    """
+    Apply the matching profile to a model spec.
+
+    Settings named in spec.pinned (set explicitly in MODEL_CONFIG) win
+    over the profile.
+
+    Args:
+        spec (ModelSpec): Spec to update in place.
+        path (str): Profile file, TUNING_PROFILES by default.
+
+    Returns:
+        dict | None: The settings applied, or None without a profile.
+    """
+    profile = find_profile(spec.model_id, path)
+    if profile is None:
+        return None
+    applied = {name: profile[name] for name in TUNABLE if name in profile and name not in spec.pinned}
+    for name, value in applied.items():
+        setattr(spec, name, value)
+    print(f"⚙️ Tuned profile for {spec.name} on {cpu_key()}: {applied}")
+    return applied
+
+
+def representative_prompts(workload: str | None = None, limit: int = 4) -> list[str]:
+    """
+    Build prompts shaped like the API's from the load test workload.
+
+    Args:
+        workload (str): JSONL workload, benchmarks/workload.jsonl by default.
+        limit (int): Prompts at most.
+
+    Returns:
+        list[str]: Prompt texts, explanation prompts with code first.
+    """
+    from ml_engine import _reply_instructions
+
+    workload = workload or os.path.join(PROJECT_ROOT, "benchmarks", "workload.jsonl")
+    with open(workload, encoding="utf-8") as f:
+        bodies = [json.loads(line)["body"] for line in f if line.strip()]
+    bodies.sort(key=lambda body: not body.get("code"))
+    prompts = []
+    for body in bodies[:limit]:
+        language = body.get("language", "python")
+        if body.get("code"):
+            prompts.append(f"{_reply_instructions(language, 'intermediate')}{body['code']}\n\nExplanation:\n")
+        else:
+            prompts.append(f"# Language: {language}\n# Task: {body['prompt']}\n")
+    return prompts
+
+
+def _llama_timings(llm):
+    # llama.cpp's per-context timings, for models that have a context.
+    if getattr(llm, "ctx", None) is None:
+        return None
+    import llama_cpp
+
+    return llama_cpp
+
+
+def measure(llm, prompts: list[str], max_tokens: int) -> dict:
+    """
+    Run the prompts and measure prompt evaluation and decode throughput.
+
+    Uses llama.cpp's own timings when available, so prompt evaluation and
+    decoding are measured separately; otherwise the wall time of each call
+    is split at its first generated token.
+
+    Args:
+        llm (Llama): Loaded model.
+        prompts (list[str]): Prompts to run, in order.
+        max_tokens (int): Tokens generated per prompt.
+
+    Returns:
+        dict: Tokens/sec of prompt evaluation and decoding, and seconds per prompt.
+    """
+    llama_cpp = _llama_timings(llm)
+    prompt_tokens = prompt_seconds = tokens = decode_seconds = 0.0
+    for prompt in prompts:
+        llm.reset()
+        if llama_cpp is not None:
+            llama_cpp.llama_reset_timings(llm.ctx)
+            llm(prompt, max_tokens=max_tokens, temperature=0.0)
+            timings = llama_cpp.llama_get_timings(llm.ctx)
+            prompt_tokens += timings.n_p_eval
+            prompt_seconds += timings.t_p_eval_ms / 1000
+            tokens += timings.n_eval
+            decode_seconds += (timings.t_eval_ms + timings.t_sample_ms) / 1000
+            continue
+        start = time.perf_counter()
+        first = None
+        count = 0
+        for _ in llm(prompt, max_tokens=max_tokens, temperature=0.0, stream=True):
+            first = first or time.perf_counter()
+            count += 1
+        end = time.perf_counter()
+        prompt_tokens += len(llm.tokenize(prompt.encode("utf-8")))
+        prompt_seconds += (first or end) - start
+        tokens += count
+        decode_seconds += end - (first or end)
+    return {
+        "prompt_tps": round(prompt_tokens / prompt_seconds, 2) if prompt_seconds else 0.0,
+        "decode_tps": round(tokens / decode_seconds, 2) if decode_seconds else 0.0,
+        "seconds_per_prompt": round((prompt_seconds + decode_seconds) / len(prompts), 4),
+    }
+
+
+def sweep(create: Callable[..., object], prompts: list[str], threads: list[int], batches: list[int],
+          mmap_options: list[bool], mlock_options: list[bool], max_tokens: int = 64) -> list[dict]:
+    """
+    Measure every combination of settings.
+
+    Args:
+        create (Callable): Loads a model from keyword settings (n_threads, n_batch, use_mmap, use_mlock).
+        prompts (list[str]): Representative prompts.
+        threads, batches (list[int]): n_threads and n_batch values to try.
+        mmap_options, mlock_options (list[bool]): use_mmap and use_mlock values to try.
+        max_tokens (int): Tokens generated per prompt.
+
+    Returns:
+        list[dict]: Settings, load time and measurements of every combination, fastest first.
+    """
+    results = []
+    for use_mmap in mmap_options:
+        for use_mlock in mlock_options:
+            for n_threads in threads:
+                for n_batch in batches:
+                    settings = {"n_threads": n_threads, "n_batch": n_batch,
+                                "use_mmap": use_mmap, "use_mlock": use_mlock}
+                    start = time.perf_counter()
+                    try:
+                        llm = create(**settings)
+                    except Exception as e:
+                        print(f"⚠️ {settings} failed to load: {e}")
+                        continue
+                    load_seconds = time.perf_counter() - start
+                    measure(llm, prompts[:1], 8)  # warm the page cache and allocator
+                    result = {**settings, "load_seconds": round(load_seconds, 3),
+                              **measure(llm, prompts, max_tokens)}
+                    del llm
+                    print(f"⏱️ {result}")
+                    results.append(result)
+    return sorted(results, key=lambda r: r["seconds_per_prompt"])
+
+
+def _ints(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Tune llama.cpp settings for this host.")
+    parser.add_argument("--name", help="Model of the pool to tune (default: all)")
+    parser.add_argument("--model", help="Local GGUF file to tune instead of the pool's models; "
+                                        "its profile applies to models configured with that path")
+    parser.add_argument("--repo-id", help="Hugging Face repository of a model to tune instead of the pool's; "
+                                          "its profile applies to models configured with this repo_id and filename")
+    parser.add_argument("--filename", help="GGUF file in --repo-id (read from --model when given)")
+    parser.add_argument("--threads", type=_ints,
+                        default=sorted({max(1, cores // 4), max(1, cores // 2), cores}))
+    parser.add_argument("--batch", type=_ints, default=[64, 128, 256, 512])
+    parser.add_argument("--mlock", action="store_true", help="Also try use_mlock=True")
+    parser.add_argument("--no-mmap", action="store_true", help="Also try use_mmap=False")
+    parser.add_argument("--max-tokens", type=int, default=64, help="Tokens generated per prompt")
+    parser.add_argument("--workload", help="JSONL workload the prompts are built from")
+    parser.add_argument("--dry-run", action="store_true", help="Report without saving the profile")
+    args = parser.parse_args()
+    if bool(args.repo_id) != bool(args.filename):
+        parser.error("--repo-id and --filename go together")
+
+    from llama_cpp import Llama
+    from model_registry import ModelSpec, _resolve
+    from ml_engine import MODEL_POOL
+
+    if args.repo_id:
+        # Profiles are looked up by ModelSpec.model_id, which is repo_id/filename for hub models.
+        spec = ModelSpec(name="model", repo_id=args.repo_id, filename=args.filename,
+                         local_dir=os.getenv("HF_LOCAL_DIR"))
+        targets = [(spec, args.model or _resolve(spec))]
+    elif args.model:
+        targets = [(ModelSpec(name="model", path=args.model), args.model)]
+    else:
+        models = [m for m in MODEL_POOL.models.values() if args.name in (None, m.name)]
+        if not models:
+            raise SystemExit(f"No model named {args.name} in the pool")
+        targets = [(m.spec, _resolve(m.spec)) for m in models]
+
+    prompts = representative_prompts(args.workload)
+    print(f"🖥️ Tuning on {cpu_key()} with {len(prompts)} prompts")
+    for spec, path in targets:
+        results = sweep(
+            lambda **settings: Llama(model_path=path, n_ctx=spec.n_ctx, verbose=False, **settings),
+            prompts, args.threads, args.batch,
+            [True, False] if args.no_mmap else [True], [False, True] if args.mlock else [False],
+            args.max_tokens
+        )
+        if not results:
+            print(f"❌ No setting could load {spec.name}")
+            continue
+        best = {**results[0], "tuned_at": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+        print(f"🏆 {spec.name}: {best}")
+        if not args.dry_run:
+            save_profile(spec.model_id, best)
+            print(f"💾 Profile for {spec.model_id} saved to {profile_path()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel, ValidationError
+
+from models import CodePrompt, CodeRequest
+from ml_engine import generate_code, generate_reply, generate_reply_code_only
+from inference import QueueFullError
+from response_cache import normalize_code, normalize_text
+
+
+@dataclass
+class BatchOperation:
+    """
+    How records of one endpoint are validated, run and cached.
+
+    Attributes:
+        model (type): Pydantic model of a record.
+        fn (Callable): ml_engine function that serves the record.
+        field (str): Name of the result field, as in the endpoint's response.
+        args (Callable): Builds fn's positional arguments from a record.
+        key_fields (Callable): Builds the response cache key fields from a record.
+        prefix (Callable): Prompt-template prefix shared by records that can reuse its evaluated state.
+    """
+    model: type
+    fn: Callable[..., str]
+    field: str
+    args: Callable[[Any], tuple]
+    key_fields: Callable[[Any], dict]
+    prefix: Callable[[Any], tuple]
+
+
+OPERATIONS = {
+    "generate": BatchOperation(
+        CodePrompt,
+        generate_code,
+        "code",
+        lambda d: (d.prompt, d.language),
+        lambda d: {"prompt": normalize_text(d.prompt), "language": d.language},
+        lambda d: (d.language,)
+    ),
+    "reply": BatchOperation(
+        CodeRequest,
+        generate_reply,
+        "reply",
+        lambda d: (d.prompt, d.language, d.code, d.user_id, d.user_level),
+        lambda d: {"code": normalize_code(d.code), "language": d.language, "user_level": d.user_level},
+        lambda d: (d.language, d.user_level)
+    ),
+    "reply-code-only": BatchOperation(
+        CodeRequest,
+        generate_reply_code_only,
+        "code",
+        lambda d: (d.prompt, d.language, d.code, d.user_id),
+        lambda d: {"prompt": normalize_text(d.prompt), "code": normalize_code(d.code), "language": d.language},
+        lambda d: (d.language,)
+    ),
+}
+
+
+@dataclass
+class BatchItem:
+    """
+    One validated batch record.
+
+    Attributes:
+        id (Any): Record id, or its line number when the record has none.
+        endpoint (str): Endpoint whose model and cleanup serve the record.
+        data (BaseModel): CodePrompt or CodeRequest.
+    """
+    id: Any
+    endpoint: str
+    data: BaseModel
+
+    @property
+    def operation(self) -> BatchOperation:
+        return OPERATIONS[self.endpoint]
+
+    def size(self) -> int:
+        return len(self.data.prompt) + len(getattr(self.data, "code", ""))
+
+
+def parse_records(lines, user_id: str | None = None) -> tuple[list[BatchItem], list[dict]]:
+    """
+    Parse JSONL batch records.
+
+    Each line is a CodePrompt or CodeRequest object with an optional "id" and
+    "endpoint" ("generate", "reply" or "reply-code-only"); without an
+    endpoint, records with code are explained ("reply") and others generated.
+
+    Args:
+        lines (Iterable[str]): JSONL lines; blank lines are skipped.
+        user_id (str): Overrides the records' user_id (the authenticated user).
+
+    Returns:
+        tuple[list[BatchItem], list[dict]]: Valid items, and an error result per invalid line.
+    """
+    items, errors = [], []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        record_id = number
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("record must be a JSON object")
+            record_id = record.pop("id", number)
+            endpoint = record.pop("endpoint", None) or ("reply" if "code" in record else "generate")
+            if endpoint not in OPERATIONS:
+                raise ValueError(f"unknown endpoint {endpoint!r}")
+            if user_id is not None:
+                record["user_id"] = user_id
+            items.append(BatchItem(record_id, endpoint, OPERATIONS[endpoint].model(**record)))
+        except (ValueError, ValidationError) as e:
+            errors.append({"id": record_id, "error": f"Invalid record on line {number}: {e}"})
+    return items, errors
+
+
+def schedule(items: list[BatchItem]) -> list[BatchItem]:
+    """
+    Order items for throughput.
+
+    Records of the same endpoint and prompt-template prefix run back to back,
+    so the evaluated prefix stays in the model's prefix cache, and shorter
+    records run first within a group so batched sequences finish together.
+
+    Args:
+        items (list[BatchItem]): Items in input order.
+
+    Returns:
+        list[BatchItem]: Items in execution order.
+    """
+    return sorted(items, key=lambda item: (item.endpoint, item.operation.prefix(item.data), item.size()))
+
+
+async def run_batch(items: list[BatchItem], submit: Callable[[BatchItem], Awaitable[str]],
+                    concurrency: int = 2, retry_delay: float = 1.0):
+    """
+    Run batch items and yield their results as they complete.
+
+    At most `concurrency` items are queued at once, so a batch never fills
+    the inference queue ahead of interactive requests; an item rejected with
+    QueueFullError is retried after retry_delay seconds.
+
+    Args:
+        items (list[BatchItem]): Items to run.
+        submit (Callable): Runs one item and returns the generated text.
+        concurrency (int): Items in flight at once.
+        retry_delay (float): Wait before retrying an item rejected by a full queue.
+
+    Yields:
+        dict: {"id", "endpoint", <result field>, "duration"}, or {"id", "endpoint", "error"}.
+    """
+    async def run(item: BatchItem) -> dict:
+        start = time.time()
+        while True:
+            try:
+                text = await submit(item)
+                return {
+                    "id": item.id,
+                    "endpoint": item.endpoint,
+                    item.operation.field: text,
+                    "duration": time.time() - start
+                }
+            except QueueFullError:
+                await asyncio.sleep(retry_delay)
+            except Exception as e:
+                return {"id": item.id, "endpoint": item.endpoint, "error": str(e)}
+
+    pending = iter(schedule(items))
+    running = set()
+    try:
+        while True:
+            for item in pending:
+                running.add(asyncio.create_task(run(item)))
+                if len(running) >= concurrency:
+                    break
+            if not running:
+                return
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in running:
+            task.cancel()
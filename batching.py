@@ -0,0 +1,348 @@
+import codecs
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+_DONE = object()
+
+
+@dataclass
+class Sequence:
+    """
+    One in-flight generation inside the batch.
+
+    Attributes:
+        prompt (str): Prompt text, tokenized on admission.
+        max_tokens (int): Maximum number of tokens to generate.
+        temperature (float): Sampling temperature (0 means greedy).
+        stop (list): Stop sequences.
+        output (queue.Queue): Text pieces for the waiting caller, then _DONE.
+    """
+    prompt: str
+    max_tokens: int
+    temperature: float
+    stop: list
+    output: queue.Queue = field(default_factory=queue.Queue)
+    seq_id: int = -1
+    tokens: list = field(default_factory=list)
+    n_prompt: int = 0
+    n_past: int = 0
+    generated: int = 0
+    text: str = ""
+    sent: int = 0
+    cancelled: bool = False
+    decoder: codecs.IncrementalDecoder = field(
+        default_factory=lambda: codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    )
+
+
+def _context(llm):
+    ctx = getattr(llm, "ctx", None)
+    return ctx if ctx is not None else llm._ctx.ctx
+
+
+def _batch_init(n_tokens: int, n_seq_max: int):
+    import llama_cpp
+
+    try:
+        return llama_cpp.llama_batch_init(n_tokens, 0, n_seq_max)
+    except TypeError:
+        # Older llama.cpp builds take (n_tokens, embd) only.
+        return llama_cpp.llama_batch_init(n_tokens, 0)
+
+
+def _set_token(batch, i: int, token: int, pos: int, seq_id: int, logits: bool):
+    batch.token[i] = token
+    batch.pos[i] = pos
+    if hasattr(batch, "n_seq_id"):
+        batch.n_seq_id[i] = 1
+        batch.seq_id[i][0] = seq_id
+    else:
+        batch.seq_id[i] = seq_id
+    batch.logits[i] = logits
+
+
+def _candidates(logits: np.ndarray, temperature: float, top_k: int = 40,
+                top_p: float = 0.95) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Turn raw logits into the top-k / top-p filtered sampling distribution.
+
+    Args:
+        logits (np.ndarray): Logits over the vocabulary.
+        temperature (float): Sampling temperature, must be positive.
+        top_k (int): Number of candidates kept before nucleus filtering.
+        top_p (float): Cumulative probability kept.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Candidate token ids and their probabilities, most likely first.
+    """
+    candidates = np.argpartition(logits, -top_k)[-top_k:]
+    scores = logits[candidates] / temperature
+    order = np.argsort(scores)[::-1]
+    candidates, scores = candidates[order], scores[order]
+
+    probs = np.exp(scores - scores[0])
+    probs /= probs.sum()
+    keep = int(np.searchsorted(np.cumsum(probs), top_p)) + 1
+    return candidates[:keep], probs[:keep] / probs[:keep].sum()
+
+
+def _sample(logits: np.ndarray, temperature: float, rng: np.random.Generator,
+            top_k: int = 40, top_p: float = 0.95) -> int:
+    """
+    Sample a token id from raw logits with top-k / top-p filtering.
+
+    Args:
+        logits (np.ndarray): Logits over the vocabulary.
+        temperature (float): Sampling temperature, 0 for greedy decoding.
+        rng (np.random.Generator): Random generator.
+        top_k (int): Number of candidates kept before nucleus filtering.
+        top_p (float): Cumulative probability kept.
+
+    Returns:
+        int: Sampled token id.
+    """
+    if temperature <= 0:
+        return int(np.argmax(logits))
+
+    candidates, probs = _candidates(logits, temperature, top_k, top_p)
+    return int(candidates[rng.choice(len(candidates), p=probs)])
+
+
+class BatchScheduler:
+    """
+    Continuous batching over one multi-sequence llama.cpp context.
+
+    Every decode step packs the next token of each running sequence, plus
+    prompt chunks of newly admitted ones, into a single llama_decode call, so
+    concurrent requests share one model evaluation instead of waiting for
+    each other. New requests are admitted between steps and finished ones are
+    retired immediately, freeing their KV cache cells and sequence slot.
+
+    The Llama instance must be created with n_ctx large enough for
+    max_batch_size sequences; the scheduler thread is its only user.
+
+    Args:
+        llm (Llama): Model instance owned by the scheduler.
+        max_batch_size (int): Maximum number of sequences decoded together.
+        seed (int): Seed for token sampling.
+    """
+
+    def __init__(self, llm, max_batch_size: int = 4, seed: int | None = None):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.n_batch = llm.n_batch
+        self.n_ctx_per_seq = llm.n_ctx() // max_batch_size
+        self._ctx = _context(llm)
+        self._n_vocab = llm.n_vocab()
+        self._eos = llm.token_eos()
+        self._batch = _batch_init(self.n_batch, max_batch_size)
+        self._rng = np.random.default_rng(seed)
+        self._pending: queue.Queue = queue.Queue()
+        self._active: dict[int, Sequence] = {}
+        self._free_ids = list(range(max_batch_size))
+        self._stopped = threading.Event()
+        self._steps = 0
+        self._tokens = 0
+        self._busy_time = 0.0
+        self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def generate(self, prompt: str, max_tokens: int = 128, temperature: float = 0.7, stop=None):
+        """
+        Run a prompt through the shared batch, blocking the calling thread.
+
+        Args:
+            prompt (str): Full prompt text.
+            max_tokens (int): Maximum number of tokens to generate.
+            temperature (float): Sampling temperature.
+            stop (list): Stop sequences.
+
+        Yields:
+            str: Text pieces in decoding order.
+        """
+        seq = Sequence(prompt, max_tokens, temperature, list(stop or []))
+        self._pending.put(seq)
+        try:
+            while True:
+                item = seq.output.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The caller stopped iterating; retire the sequence at the next step.
+            seq.cancelled = True
+
+    def close(self):
+        """
+        Stop the scheduler thread and fail every queued or running sequence.
+        """
+        self._stopped.set()
+        self._pending.put(None)
+        self._thread.join(timeout=5)
+
+    def stats(self) -> dict:
+        """
+        Report batch occupancy and throughput counters.
+
+        Returns:
+            dict: Active and pending sequences, decode steps, tokens and tokens/sec.
+        """
+        return {
+            "max_batch_size": self.max_batch_size,
+            "active": len(self._active),
+            "pending": self._pending.qsize(),
+            "steps": self._steps,
+            "tokens": self._tokens,
+            "tokens_per_sec": round(self._tokens / self._busy_time, 2) if self._busy_time else 0.0,
+        }
+
+    def _admit(self, block: bool):
+        while self._free_ids:
+            try:
+                seq = self._pending.get(block=block and not self._active)
+            except queue.Empty:
+                return
+            if seq is None:
+                return
+            if seq.cancelled:
+                seq.output.put(_DONE)
+                continue
+
+            tokens = self.llm.tokenize(seq.prompt.encode("utf-8"))
+            room = self.n_ctx_per_seq - seq.max_tokens
+            if room <= 0 or len(tokens) > room:
+                seq.output.put(ValueError(
+                    f"Requested tokens ({len(tokens) + seq.max_tokens}) exceed context window of {self.n_ctx_per_seq}"
+                ))
+                continue
+
+            seq.seq_id = self._free_ids.pop()
+            seq.tokens = tokens
+            seq.n_prompt = len(tokens)
+            self._active[seq.seq_id] = seq
+            block = False
+
+    def _retire(self, seq: Sequence, error: Exception | None = None):
+        import llama_cpp
+
+        llama_cpp.llama_kv_cache_seq_rm(self._ctx, seq.seq_id, -1, -1)
+        del self._active[seq.seq_id]
+        self._free_ids.append(seq.seq_id)
+        seq.output.put(error if error is not None else _DONE)
+
+    def _fill_batch(self) -> list:
+        """
+        Pack one token per decoding sequence, then prompt chunks, into the batch.
+
+        Returns:
+            list: (sequence, batch index) pairs whose logits were requested.
+        """
+        n = 0
+        sampled = []
+        decoding = [s for s in self._active.values() if s.n_past >= s.n_prompt]
+        prefilling = [s for s in self._active.values() if s.n_past < s.n_prompt]
+
+        for seq in decoding:
+            _set_token(self._batch, n, seq.tokens[-1], seq.n_past, seq.seq_id, True)
+            sampled.append((seq, n))
+            seq.n_past += 1
+            n += 1
+
+        for seq in prefilling:
+            take = min(seq.n_prompt - seq.n_past, self.n_batch - n)
+            if take <= 0:
+                break
+            for i in range(take):
+                last = seq.n_past + i == seq.n_prompt - 1
+                _set_token(self._batch, n, seq.tokens[seq.n_past + i], seq.n_past + i, seq.seq_id, last)
+                if last:
+                    sampled.append((seq, n))
+                n += 1
+            seq.n_past += take
+
+        self._batch.n_tokens = n
+        return sampled
+
+    def _emit(self, seq: Sequence, token: int) -> bool:
+        """
+        Append a sampled token and push newly final text to the caller.
+
+        Returns:
+            bool: True when the sequence is finished.
+        """
+        seq.tokens.append(token)
+        seq.generated += 1
+        finished = token == self._eos or seq.generated >= seq.max_tokens
+
+        if token != self._eos:
+            seq.text += seq.decoder.decode(self.llm.detokenize([token]))
+
+        end = len(seq.text)
+        for stop in seq.stop:
+            at = seq.text.find(stop, max(seq.sent - len(stop), 0))
+            if at >= 0:
+                end = min(end, at)
+                finished = True
+
+        if not finished:
+            # Hold back text that could still become the start of a stop sequence.
+            for stop in seq.stop:
+                for k in range(min(len(stop) - 1, end - seq.sent), 0, -1):
+                    if seq.text.endswith(stop[:k]):
+                        end = min(end, len(seq.text) - k)
+                        break
+
+        if end > seq.sent:
+            seq.output.put(seq.text[seq.sent:end])
+            seq.sent = end
+        return finished
+
+    def _step(self):
+        import llama_cpp
+
+        for seq in [s for s in self._active.values() if s.cancelled]:
+            self._retire(seq)
+
+        sampled = self._fill_batch()
+        if self._batch.n_tokens == 0:
+            return
+
+        start = time.perf_counter()
+        if llama_cpp.llama_decode(self._ctx, self._batch) != 0:
+            raise RuntimeError("llama_decode failed: KV cache is full")
+        self._steps += 1
+
+        for seq, index in sampled:
+            logits = np.ctypeslib.as_array(
+                llama_cpp.llama_get_logits_ith(self._ctx, index), shape=(self._n_vocab,)
+            )
+            token = _sample(logits, seq.temperature, self._rng)
+            self._tokens += 1
+            if self._emit(seq, token):
+                self._retire(seq)
+        self._busy_time += time.perf_counter() - start
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                self._admit(block=True)
+                self._step()
+            except Exception as e:
+                print("Error in batch scheduler:", traceback.format_exc())
+                for seq in list(self._active.values()):
+                    self._retire(seq, e)
+
+        for seq in list(self._active.values()):
+            self._retire(seq, RuntimeError("Batch scheduler stopped"))
+        while not self._pending.empty():
+            seq = self._pending.get_nowait()
+            if seq is not None:
+                seq.output.put(RuntimeError("Batch scheduler stopped"))
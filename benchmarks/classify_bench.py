@@ -0,0 +1,116 @@
+"""
+Throughput benchmark of the sentiment classifier on chat-log sized batches.
+
+Times the previous substring scan of /classify, the compiled lexicon one
+text at a time, and classify_batch over a synthetic chat log, then the
+same log sent through the app as one /classify request per text and as
+/classify/batch requests, and reports texts per second. Also counts the
+texts whose label changed because the previous scan matched words inside
+other words ("bad" in "badge") or ignored negations ("not good").
+
+Usage:
+    python benchmarks/classify_bench.py [--texts 10000] [--repeat 3] [--batch-size 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from classifier import classify_batch, classify_text  # noqa: E402
+
+POSITIVE_WORDS = ["good", "excellent", "happy", "fantastic", "positive", "great", "wonderful"]
+NEGATIVE_WORDS = ["bad", "terrible", "sad", "horrible", "negative", "awful", "fatal"]
+
+MESSAGES = [
+    "the new build is {adj}, thanks for the quick fix",
+    "I am not {adj} with how the deploy went yesterday",
+    "can you review my pull request when you have a moment?",
+    "the badge on the dashboard still shows the old count",
+    "this error message is {adj}, nobody understands it",
+    "tests pass locally but the pipeline is {adj} again",
+    "a fatal exception was raised in the worker thread",
+    "the refactor looks {adj} to me, merging now",
+    "don't worry, it wasn't that {adj} in the end",
+    "meeting moved to three, see the calendar invite",
+]
+
+
+def legacy_classify(text: str) -> str:
+    # The /classify scan as it was before the compiled lexicon, kept as the baseline.
+    text = text.lower()
+    if any(word in text for word in POSITIVE_WORDS):
+        return "positive"
+    if any(word in text for word in NEGATIVE_WORDS):
+        return "negative"
+    return "neutral"
+
+
+def chat_log(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    adjectives = POSITIVE_WORDS + NEGATIVE_WORDS + ["fine", "slow", "odd"]
+    return [rng.choice(MESSAGES).format(adj=rng.choice(adjectives)) for _ in range(count)]
+
+
+def bench(name: str, fn, count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    rate = count / best
+    print(f"  {name:<26} {best * 1000:9.1f} ms {rate:12,.0f} texts/s")
+    return rate
+
+
+async def endpoint_rates(texts: list[str], batch_size: int) -> tuple[float, float]:
+    # Must run before the app is imported: auth reads TEST_MODE at import time.
+    os.environ["TEST_MODE"] = "true"
+    from app import app
+    from benchmarks.load_test import call
+
+    start = time.perf_counter()
+    for text in texts:
+        assert (await call(app, "/classify", {"text": text}, {}))["status"] == 200
+    single = len(texts) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        assert (await call(app, "/classify/batch", {"texts": texts[i:i + batch_size]}, {}))["status"] == 200
+    batch = len(texts) / (time.perf_counter() - start)
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=5000, help="Texts per /classify/batch request.")
+    parser.add_argument("--no-http", action="store_true", help="Skip the timings through the app.")
+    args = parser.parse_args()
+
+    texts = chat_log(args.texts)
+    batch = classify_batch(texts)
+    assert batch == [classify_text(t) for t in texts]
+    print("✅ Batch results match per-text results")
+
+    changed = sum(legacy_classify(t) != label for t, (label, _) in zip(texts, batch))
+    print(f"🔎 {changed} of {len(texts)} labels differ from the substring scan")
+
+    print(f"classify ({len(texts)} texts)")
+    bench("substring scan", lambda: [legacy_classify(t) for t in texts], len(texts), args.repeat)
+    bench("compiled, per text", lambda: [classify_text(t) for t in texts], len(texts), args.repeat)
+    bench("compiled, batch", lambda: classify_batch(texts), len(texts), args.repeat)
+
+    if not args.no_http:
+        print(f"through the app ({args.batch_size} texts per batch request)")
+        single, batch = asyncio.run(endpoint_rates(texts, args.batch_size))
+        print(f"  {'/classify per text':<26} {single:22,.0f} texts/s")
+        print(f"  {'/classify/batch':<26} {batch:22,.0f} texts/s")
+        print(f"  speedup: {batch / single:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import threading
+import time
+
+# Canned outputs, picked by what the prompt asks for, so every endpoint's
+# cleanup has realistic text to work on.
+REPLY = (
+    "Step 1: The function reads the input list and checks that it is not empty. "
+    "Step 2: It walks over the items once and keeps the running result. "
+    "Step 3: It returns the result to the caller.\n\n"
+    "Limitation: Large inputs are processed in memory at once."
+)
+CODE = (
+    "def solution(items):\n"
+    "    result = []\n"
+    "    for item in items:\n"
+    "        if item is not None:\n"
+    "            result.append(item)\n"
+    "    return result\n"
+    "# END"
+)
+COMPLETION = "    return sum(item.price for item in items)\n"
+
+
+class FakeLlama:
+    """
+    Deterministic stand-in for llama_cpp.Llama with configurable latency.
+
+    Tokens are whitespace-separated words (and the whitespace itself), so
+    prompt budgeting behaves like with a real tokenizer. Generation sleeps
+    prompt_latency per prompt token and token_latency per generated token,
+    then emits a canned output chosen from the prompt, so the same workload
+    always produces the same text and timings.
+
+    Args:
+        token_latency (float): Seconds per generated token.
+        prompt_latency (float): Seconds per evaluated prompt token.
+        n_ctx (int): Context window reported to the budgeter.
+    """
+
+    def __init__(self, token_latency: float = 0.005, prompt_latency: float = 0.0, n_ctx: int = 512):
+        self.token_latency = token_latency
+        self.prompt_latency = prompt_latency
+        self._n_ctx = n_ctx
+        self._vocab = {}
+        self._words = []
+        self._lock = threading.Lock()
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    def token_eos(self) -> int:
+        return -1
+
+    def _split(self, text: str) -> list:
+        pieces, word = [], ""
+        for c in text:
+            if c.isspace() != word[-1:].isspace() and word:
+                pieces.append(word)
+                word = ""
+            word += c
+        return pieces + [word] if word else pieces
+
+    def tokenize(self, text: bytes, add_bos: bool = True) -> list:
+        with self._lock:
+            tokens = []
+            for piece in self._split(text.decode("utf-8", errors="ignore")):
+                if piece not in self._vocab:
+                    self._vocab[piece] = len(self._words)
+                    self._words.append(piece)
+                tokens.append(self._vocab[piece])
+            return tokens
+
+    def detokenize(self, tokens: list) -> bytes:
+        with self._lock:
+            return "".join(self._words[t] for t in tokens).encode("utf-8")
+
+    def reset(self):
+        pass
+
+    def eval(self, tokens: list):
+        time.sleep(self.prompt_latency * len(tokens))
+
+    def _output(self, prompt: str) -> list:
+        if "Explanation:" in prompt:
+            return self._split(REPLY)
+        if "# CONTINUE:" in prompt:
+            return self._split(COMPLETION)
+        return self._split(CODE)
+
+    def _generate(self, prompt: str, max_tokens: int, stop, stopping_criteria):
+        # Like Llama._create_completion in llama-cpp-python 0.2.11, which only takes text.
+        prompt = self.tokenize(prompt.encode("utf-8"))
+        self.eval(prompt)
+        text = ""
+        for piece in self._output(self.detokenize(prompt).decode("utf-8"))[:max_tokens]:
+            if stopping_criteria is not None and any(c(None, None) for c in stopping_criteria):
+                return
+            time.sleep(self.token_latency)
+            text += piece
+            if any(s in text for s in stop or []):
+                return
+            yield piece
+
+    def __call__(self, prompt: str, max_tokens: int = 16, temperature: float = 0.8, stop=None,
+                 stopping_criteria=None, grammar=None, stream: bool = False, **kwargs):
+        pieces = self._generate(prompt, max_tokens, stop, stopping_criteria)
+        if stream:
+            return ({"choices": [{"text": piece}]} for piece in pieces)
+        return {"choices": [{"text": "".join(pieces)}]}
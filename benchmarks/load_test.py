@@ -0,0 +1,266 @@
+"""
+In-process load test of the API.
+
+Drives app.app directly through ASGI (no server, no network) with a
+workload of JSONL requests at a fixed concurrency, and reports latency
+percentiles, time to first token, throughput and queue wait per endpoint.
+
+By default every model of the pool is replaced by a deterministic fake
+(benchmarks/fake_model.py) with configurable per-token latency, so results
+are reproducible and measure the serving stack itself. With --model the
+given local GGUF file is loaded instead.
+
+Workload lines look like {"path": "/reply/stream", "body": {...}}.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 8 --requests 200 --output bench.json
+    python benchmarks/load_test.py --model models/tinyllama.gguf --requests 20
+    python benchmarks/load_test.py --compare before.json --output after.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKLOAD = os.path.join(ROOT, "benchmarks", "workload.jsonl")
+
+
+async def call(app, path: str, body: dict, headers: dict) -> dict:
+    """
+    Send one POST request to an ASGI app and time its response.
+
+    Args:
+        app: ASGI application.
+        path (str): Request path.
+        body (dict): JSON body.
+        headers (dict): Extra request headers.
+
+    Returns:
+        dict: Status, latency and time to the first body chunk, in seconds.
+    """
+    payload = json.dumps(body).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"authorization", b"Bearer load-test")]
+                   + [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("load-test", 80),
+    }
+    received = False
+    result = {"status": None, "ttft": None}
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        # The client never disconnects; the app cancels this wait when the response is done.
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body") and result["ttft"] is None:
+            result["ttft"] = time.perf_counter() - start
+
+    await app(scope, receive, send)
+    result["latency"] = time.perf_counter() - start
+    if result["ttft"] is None:
+        result["ttft"] = result["latency"]
+    return result
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest-rank percentile.
+
+    Args:
+        values (list): Samples.
+        q (float): Percentile between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 without samples.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(samples: list, seconds: float) -> dict:
+    ok = [s for s in samples if s["status"] == 200]
+    latencies = [s["latency"] for s in ok]
+    ttfts = [s["ttft"] for s in ok]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput_rps": round(len(ok) / seconds, 3) if seconds else 0.0,
+        **{f"latency_p{q}": round(percentile(latencies, q), 4) for q in (50, 95, 99)},
+        **{f"ttft_p{q}": round(percentile(ttfts, q), 4) for q in (50, 95, 99)},
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _configure(args):
+    # Must run before the app is imported: the model pool is built at import time.
+    os.environ["TEST_MODE"] = "true"
+    os.environ.pop("INFERENCE_SOCKET", None)
+    # Every request comes from the same test user.
+    os.environ.setdefault("INFERENCE_USER_QUEUE_SIZE", "0")
+    if args.model:
+        config = {"models": [{"name": "load-test", "path": args.model, "n_ctx": args.n_ctx,
+                              "n_threads": args.threads}]}
+        handle = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        json.dump(config, handle)
+        handle.close()
+        os.environ["MODEL_CONFIG"] = handle.name
+    elif args.config:
+        os.environ["MODEL_CONFIG"] = args.config
+    else:
+        os.environ.pop("MODEL_CONFIG", None)
+
+    if not args.model:
+        # The fake model has no KV state to cache.
+        os.environ["PREFIX_CACHE_MB"] = "0"
+        os.environ["AUTOCOMPLETE_SESSION_MB"] = "0"
+        import model_registry
+        from benchmarks.fake_model import FakeLlama
+
+        def create(model, path):
+            llm = FakeLlama(args.token_latency, args.prompt_latency, model.spec.n_ctx)
+            return model_registry.ModelInstance(model, llm)
+
+        model_registry._resolve = lambda spec: os.path.abspath(__file__)
+        model_registry._create = create
+
+
+async def run(args) -> dict:
+    import app as api
+    from ml_engine import MODEL_POOL, _load_model
+
+    with open(args.workload, encoding="utf-8") as f:
+        workload = [json.loads(line) for line in f if line.strip()]
+    total = args.requests or len(workload)
+    headers = {} if args.cache else {"Cache-Control": "no-store"}
+
+    await asyncio.to_thread(_load_model)
+    for executor in set(api.executors.values()):
+        await executor.start()
+
+    samples = {}
+    jobs = asyncio.Queue()
+    for i in range(total):
+        jobs.put_nowait(workload[i % len(workload)])
+
+    async def client():
+        while not jobs.empty():
+            item = jobs.get_nowait()
+            sample = await call(api.app, item["path"], item["body"], headers)
+            samples.setdefault(item["path"], []).append(sample)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        seconds = time.perf_counter() - start
+        queues = {name: executor.stats() for name, executor in api.executors.items()}
+    finally:
+        for executor in set(api.executors.values()):
+            await executor.stop()
+        MODEL_POOL.close()
+
+    endpoints = {}
+    for path, path_samples in sorted(samples.items()):
+        endpoint = path.strip("/").split("/")[0]
+        queue = queues[MODEL_POOL.route(endpoint).name] if endpoint in MODEL_POOL.routes else {}
+        endpoints[path] = {
+            **summarize(path_samples, seconds),
+            "queue_wait_avg": queue.get("wait_avg"),
+            "queue_wait_max": queue.get("wait_max"),
+        }
+    return {
+        "commit": _git_commit(),
+        "config": {
+            "backend": args.model or "fake",
+            "token_latency": None if args.model else args.token_latency,
+            "prompt_latency": None if args.model else args.prompt_latency,
+            "concurrency": args.concurrency,
+            "requests": total,
+            "workload": os.path.relpath(args.workload, ROOT),
+            "cache": args.cache,
+        },
+        "seconds": round(seconds, 3),
+        "total": summarize([s for path_samples in samples.values() for s in path_samples], seconds),
+        "endpoints": endpoints,
+        "queues": queues,
+    }
+
+
+def report(results: dict, baseline: dict | None = None):
+    print(f"\n📊 {results['total']['requests']} requests in {results['seconds']}s "
+          f"({results['total']['throughput_rps']} req/s, {results['total']['errors']} errors)")
+    columns = ("latency_p50", "latency_p95", "latency_p99", "ttft_p50", "ttft_p95", "queue_wait_avg")
+    print(f"{'endpoint':<26}" + "".join(f"{c:>16}" for c in columns))
+    for path, stats in results["endpoints"].items():
+        row = f"{path:<26}"
+        for column in columns:
+            value = stats.get(column) or 0.0
+            old = (baseline or {}).get("endpoints", {}).get(path, {}).get(column)
+            change = f" ({(value - old) / old:+.0%})" if old else ""
+            row += f"{value:>9.3f}{change:>7}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test of the API.")
+    parser.add_argument("--workload", default=WORKLOAD, help="JSONL file of {path, body} requests")
+    parser.add_argument("--requests", type=int, default=0, help="Requests to send (default: one per workload line)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Fake model seconds per generated token")
+    parser.add_argument("--prompt-latency", type=float, default=0.0005, help="Fake model seconds per prompt token")
+    parser.add_argument("--model", help="Local GGUF file to benchmark instead of the fake model")
+    parser.add_argument("--config", help="Model pool config, served by fake models unless --model is set")
+    parser.add_argument("--n-ctx", type=int, default=1024, help="Context size with --model")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4, help="Threads with --model")
+    parser.add_argument("--cache", action="store_true", help="Allow response cache hits")
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare with")
+    args = parser.parse_args()
+
+    _configure(args)
+    results = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
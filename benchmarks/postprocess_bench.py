@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of the postprocessing rules on raw model outputs.
+
+Times the single-pass cleanups in postprocess.py against the previous
+implementation (one re.sub per rule, whole-text re-clean on every streamed
+chunk) and checks that both produce the same text. outputs.json holds sample
+raw outputs per endpoint; replace it with outputs recorded from a deployment
+to benchmark real traffic.
+
+Usage:
+    python benchmarks/postprocess_bench.py [--repeat 200] [--chunk 4]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postprocess import (  # noqa: E402
+    AutocompleteFilter, CodeLineFilter, MentorFilter, clean_mentor_response, run_filter, stream_filter
+)
+
+OUTPUTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs.json")
+
+
+def legacy_clean_mentor_response(text: str) -> str:
+    # The cleanup as it was before the rules were combined, kept as the baseline.
+    if not text:
+        return ""
+    result = text.strip()
+    for prefix in ("answer:", "explanation:", "response:"):
+        if result.lower().startswith(prefix):
+            result = result[len(prefix):].strip()
+    result = re.sub(r"\\begin\{code\}[\s\S]*?\\end\{code\}", "", result, flags=re.IGNORECASE)
+    result = re.sub(r"```[\s\S]*?```", "", result)
+    for pat in (
+        r"edge_all_open_tabs\s*=\s*\[[\s\S]*?\]",
+        r"#\s*User.*browser.*tabs.*metadata.*",
+        r"\bdef\s+_load_model\b",
+        r"\bllama_cpp\b",
+        r"\bimport\s+os\b",
+        r"\btraceback\b",
+    ):
+        result = re.sub(pat, "", result, flags=re.IGNORECASE)
+    m = re.search(r"(Step\s*1|^\s*1\.)", result, flags=re.IGNORECASE | re.MULTILINE)
+    if m:
+        result = result[m.start():].strip()
+    result = re.sub(r"\n{3,}", "\n\n", result).strip()
+    result = re.sub(r"[ \t]{2,}", " ", result)
+    return re.sub(r"(?i)^limitation\s*:", "Limitation:", result)
+
+
+def legacy_stream(chunks, clean):
+    # Re-cleans the whole text on every chunk, as the streaming endpoints used to.
+    raw = sent = ""
+    for chunk in chunks:
+        raw += chunk
+        cleaned = clean(raw)
+        if len(cleaned) > len(sent) and cleaned.startswith(sent):
+            yield cleaned[len(sent):]
+            sent = cleaned
+
+
+def chunked(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def bench(name: str, fn, repeat: int) -> float:
+    per_call = min(timeit.repeat(fn, number=repeat, repeat=3)) / repeat * 1e6
+    print(f"  {name:<34} {per_call:9.1f} µs")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--chunk", type=int, default=4, help="Characters per simulated streamed token.")
+    args = parser.parse_args()
+
+    with open(OUTPUTS, encoding="utf-8") as f:
+        outputs = json.load(f)
+
+    replies = outputs["reply"]
+    completions = outputs["autocomplete"]
+    code_only = outputs["reply-code-only"]
+
+    for text in replies:
+        assert clean_mentor_response(text) == legacy_clean_mentor_response(text), text
+    for item in code_only:
+        whole = run_filter(CodeLineFilter(item["language"]), item["text"])
+        streamed = "".join(stream_filter(chunked(item["text"], args.chunk), CodeLineFilter(item["language"])))
+        assert whole == streamed, item
+    print("✅ Outputs match the previous implementation")
+
+    print(f"reply ({len(replies)} outputs)")
+    old = bench("legacy cleanup", lambda: [legacy_clean_mentor_response(t) for t in replies], args.repeat)
+    new = bench("single-pass cleanup", lambda: [clean_mentor_response(t) for t in replies], args.repeat)
+    print(f"  speedup: {old / new:.2f}x")
+
+    print(f"reply stream ({args.chunk} chars per chunk)")
+    streams = [chunked(t, args.chunk) for t in replies]
+    old = bench("legacy re-clean per chunk",
+                lambda: [list(legacy_stream(c, legacy_clean_mentor_response)) for c in streams], args.repeat // 10 or 1)
+    new = bench("MentorFilter", lambda: [list(stream_filter(c, MentorFilter())) for c in streams], args.repeat // 10 or 1)
+    print(f"  speedup: {old / new:.2f}x")
+
+    print(f"autocomplete stream ({len(completions)} outputs)")
+    streams = [chunked(t, args.chunk) for t in completions]
+    bench("AutocompleteFilter", lambda: [list(stream_filter(c, AutocompleteFilter())) for c in streams], args.repeat)
+
+    print(f"reply-code-only ({len(code_only)} outputs)")
+    bench("CodeLineFilter", lambda: [run_filter(CodeLineFilter(i["language"]), i["text"]) for i in code_only],
+          args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+False-positive evaluation of the semantic cache threshold.
+
+Embeds labeled prompt pairs with a GGUF model and reports, per similarity
+threshold, how many pairs that need different answers would share one
+(false positives) and how many equivalent pairs would hit. semantic_pairs.jsonl
+holds sample pairs; replace it with pairs labeled from production prompts
+before choosing SEMANTIC_CACHE_THRESHOLD.
+
+Usage:
+    python benchmarks/semantic_cache_eval.py --model models/embedder.gguf [--thresholds 0.85,0.9,0.95]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import evaluate  # noqa: E402
+
+PAIRS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "semantic_pairs.jsonl")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", required=True, help="GGUF model computing the embeddings")
+    parser.add_argument("--pairs", default=PAIRS, help="JSONL file of {\"a\", \"b\", \"same\"} pairs")
+    parser.add_argument("--thresholds", default="0.8,0.85,0.9,0.93,0.95,0.97")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from llama_cpp import Llama
+
+    with open(args.pairs, encoding="utf-8") as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    llm = Llama(model_path=args.model, embedding=True, n_threads=args.threads, verbose=False)
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+
+    print(f"{len(pairs)} pairs from {args.pairs}")
+    print(f"  {'threshold':>9} {'false pos.':>11} {'hit rate':>9}")
+    for result in evaluate(pairs, llm.embed, thresholds):
+        print(f"  {result['threshold']:>9.3f} {result['false_positive_rate']:>10.1%} {result['hit_rate']:>9.1%}"
+              f"  ({result['false_positives']}/{result['different_pairs']} different pairs would hit)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import re
+from itertools import repeat
+
+import numpy as np
+
+# Sentiment words and their weights; strong words count double.
+LEXICON = {
+    "good": 1.0, "great": 1.0, "happy": 1.0, "positive": 1.0,
+    "excellent": 2.0, "fantastic": 2.0, "wonderful": 2.0,
+    "bad": -1.0, "sad": -1.0, "negative": -1.0,
+    "terrible": -2.0, "horrible": -2.0, "awful": -2.0, "fatal": -2.0,
+}
+
+# Words that flip the sentiment of the words following them in the same clause.
+NEGATIONS = (
+    "not", "no", "never", "nothing", "hardly", "without",
+    "isn't", "aren't", "wasn't", "weren't", "don't", "doesn't", "didn't",
+    "can't", "cannot", "won't", "wouldn't", "shouldn't", "couldn't",
+)
+
+# Sentiment words up to this many words after a negation are flipped.
+NEGATION_WINDOW = 3
+
+# Separates the texts of a batch; also ends a clause, so negations never cross texts.
+_SEPARATOR = "\x1e"
+
+# Token kinds; lexicon words are _WORD + their index in LEXICON.
+_OTHER, _CLAUSE, _NEXT_TEXT, _NEGATION, _WORD = range(5)
+
+# One compiled pass splits the text into words and clause breaks, and every
+# word is looked up in a single table, so "bad" no longer matches inside
+# "badge" and the cost does not grow with the size of the lexicon.
+_TOKENS = re.compile(rf"\w+(?:'\w+)*|[.,!?;:\n{_SEPARATOR}]")
+_KINDS = {
+    **{mark: _CLAUSE for mark in ".,!?;:\n"},
+    "but": _CLAUSE,
+    _SEPARATOR: _NEXT_TEXT,
+    **{word: _NEGATION for word in NEGATIONS},
+    **{word: _WORD + i for i, word in enumerate(LEXICON)},
+}
+_WEIGHTS = [0.0] * _WORD + list(LEXICON.values())
+_WEIGHT_TABLE = np.array(_WEIGHTS)
+
+
+def _kinds(text: str):
+    return map(_KINDS.get, _TOKENS.findall(text.lower()), repeat(_OTHER))
+
+
+def _label(score: float) -> str:
+    if score > 0:
+        return "positive"
+    if score < 0:
+        return "negative"
+    return "neutral"
+
+
+def classify_text(text: str) -> tuple[str, float]:
+    """
+    Classify the sentiment of one text.
+
+    The score is the sum of the weights of the lexicon words in the text,
+    with words shortly after a negation in the same clause ("not good")
+    counted with the opposite sign.
+
+    Args:
+        text (str): Text to classify.
+
+    Returns:
+        tuple[str, float]: "positive", "negative" or "neutral", and the score.
+    """
+    score = 0.0
+    negated_at = None
+    for i, kind in enumerate(_kinds(text)):
+        if kind >= _WORD:
+            weight = _WEIGHTS[kind]
+            if negated_at is not None and i - negated_at <= NEGATION_WINDOW:
+                weight = -weight
+            score += weight
+        elif kind == _NEGATION:
+            negated_at = i
+        elif kind != _OTHER:
+            negated_at = None
+    return _label(score), score
+
+
+def classify_batch(texts: list[str]) -> list[tuple[str, float]]:
+    """
+    Classify many texts with one tokenizer pass and vectorized scoring.
+
+    The texts are joined with a clause-breaking separator and tokenized at
+    once; negation windows and per-text sums are then computed with numpy
+    over the token kinds, without a Python loop per text.
+
+    Args:
+        texts (list[str]): Texts to classify.
+
+    Returns:
+        list[tuple[str, float]]: Label and score of every text, in order.
+    """
+    if not texts:
+        return []
+    joined = _SEPARATOR.join(text.replace(_SEPARATOR, " ") for text in texts)
+    kinds = np.fromiter(_kinds(joined), dtype=np.int64)
+    index = np.arange(len(kinds))
+    owners = np.cumsum(kinds == _NEXT_TEXT)
+    last_break = np.maximum.accumulate(np.where((kinds == _CLAUSE) | (kinds == _NEXT_TEXT), index, -1))
+    last_negation = np.maximum.accumulate(np.where(kinds == _NEGATION, index, -1))
+    negated = (last_negation > last_break) & (index - last_negation <= NEGATION_WINDOW)
+    weights = np.where(negated, -_WEIGHT_TABLE[kinds], _WEIGHT_TABLE[kinds])
+    scores = np.bincount(owners, weights=weights, minlength=len(texts))
+    labels = np.array(["negative", "neutral", "positive"])[np.sign(scores).astype(int) + 1]
+    return list(zip(labels.tolist(), scores.tolist()))
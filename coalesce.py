@@ -0,0 +1,167 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+
+class _Broadcast:
+    """
+    Fan one async iterator out to any number of subscribers.
+
+    Items are kept, so a subscriber joining late first replays what was
+    already produced and then follows the live stream. The source is
+    consumed by its own task; it is closed once every subscriber has left.
+    """
+
+    def __init__(self, source: AsyncIterator):
+        self._source = source
+        self.items = []
+        self.done = False
+        self.error: BaseException | None = None
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            async for item in self._source:
+                self.items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Shared generation was stopped")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            close = getattr(self._source, "aclose", None)
+            if close is not None:
+                await close()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def subscribe(self) -> AsyncIterator:
+        """
+        Return an iterator over every item of the source, from the first.
+        """
+        self._subscribers += 1
+        return self._iterate()
+
+    async def _iterate(self):
+        index = 0
+        try:
+            while True:
+                while index < len(self.items):
+                    yield self.items[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self._subscribers -= 1
+            if not self._subscribers and not self.done:
+                # Nobody is listening any more; stop generating.
+                self._task.cancel()
+
+
+class SingleFlight:
+    """
+    Deduplicate identical requests that are in flight at the same time.
+
+    The first caller with a key starts the work; callers arriving with the
+    same key before it finishes attach to it and receive the same result,
+    or the same token stream from its first token. Keys are forgotten as
+    soon as the work finishes, so this never serves stale results; reusing
+    finished results is the response cache's job.
+
+    The shared work runs in its own task: it is cancelled only once every
+    caller waiting for it has gone away.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, list] = {}
+        self._streams: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Await call(), or the identical call already in flight.
+
+        Args:
+            key (str): Identity of the request, e.g. its response cache key.
+            call (Callable): Starts the work; only invoked by the first caller.
+
+        Returns:
+            tuple[Any, bool]: The result, and whether this caller started the work.
+        """
+        entry = self._calls.get(key)
+        leader = entry is None
+        if leader:
+            self.leaders += 1
+            task = asyncio.ensure_future(call())
+            entry = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.followers += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task), leader
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    async def stream(self, key: str, open_stream: Callable[[], Awaitable[AsyncIterator]]) -> tuple[AsyncIterator, bool]:
+        """
+        Open a stream, or subscribe to the identical stream already in flight.
+
+        Errors raised while opening (e.g. a full queue) reach every caller
+        waiting for the same key.
+
+        Args:
+            key (str): Identity of the request.
+            open_stream (Callable): Opens the source iterator; only invoked by the first caller.
+
+        Returns:
+            tuple[AsyncIterator, bool]: The items, and whether this caller opened the stream.
+        """
+        opening = self._streams.get(key)
+        if opening is not None:
+            self.followers += 1
+            return (await asyncio.shield(opening)).subscribe(), False
+
+        self.leaders += 1
+        opening = self._streams[key] = asyncio.get_running_loop().create_future()
+        try:
+            broadcast = _Broadcast(await open_stream())
+        except BaseException as e:
+            self._streams.pop(key, None)
+            if isinstance(e, Exception):
+                opening.set_exception(e)
+                opening.exception()  # nobody else may be waiting
+            else:
+                opening.cancel()
+            raise
+        opening.set_result(broadcast)
+        broadcast._task.add_done_callback(
+            lambda _: self._streams.pop(key, None) if self._streams.get(key) is opening else None
+        )
+        return broadcast.subscribe(), True
+
+    def stats(self) -> dict:
+        """
+        Report in-flight keys and how many requests started or joined work.
+        """
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
@@ -0,0 +1,204 @@
+import ast
+import re
+from typing import Callable, Iterable
+
+# Block headers in brace languages whose body can be dropped (functions, methods, arrows).
+_FUNCTION_HEADER = re.compile(r"\)\s*(\{|=>\s*\{|throws\b[^{]*\{)|=>\s*\{|\bfunction\b")
+
+# Python block headers whose body can be dropped when the code does not parse.
+_PYTHON_HEADER = re.compile(r"^(\s*)(async\s+def|def)\b.*:\s*(#.*)?$")
+
+
+class ContextOverflowError(ValueError):
+    """
+    Raised when a prompt cannot be made to fit the model context.
+    """
+
+
+def _comment(language: str) -> str:
+    return "#" if language.lower() == "python" else "//"
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _python_outline(code: str) -> str | None:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+
+    lines = code.split("\n")
+    dropped = set()
+    placeholders = {}
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) or node.lineno - 1 in dropped:
+            continue
+        body = node.body
+        if body[0].lineno == node.lineno:
+            continue
+        start = body[0].lineno - 1
+        first = body[0]
+        if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+            # Keep the docstring, it describes the dropped body.
+            start = first.end_lineno
+        if start >= node.end_lineno:
+            continue
+        placeholders[start] = _indent(lines[body[0].lineno - 1]) + "..."
+        dropped.update(range(start, node.end_lineno))
+
+    out = []
+    for i, line in enumerate(lines):
+        if i in placeholders:
+            out.append(placeholders[i])
+        elif i not in dropped:
+            out.append(line)
+    return "\n".join(out)
+
+
+def _indented_outline(code: str) -> str:
+    out = []
+    body_indent = None
+    for line in code.split("\n"):
+        if body_indent is not None:
+            if not line.strip() or len(_indent(line)) > len(body_indent):
+                continue
+            body_indent = None
+        out.append(line)
+        m = _PYTHON_HEADER.match(line)
+        if m:
+            body_indent = m.group(1)
+            out.append(body_indent + "    ...")
+    return "\n".join(out)
+
+
+def _brace_outline(code: str, language: str) -> str:
+    out = []
+    depth = 0
+    skip_depth = None
+    header_indent = ""
+    for line in code.split("\n"):
+        opens, closes = line.count("{"), line.count("}")
+        if skip_depth is not None:
+            depth += opens - closes
+            if depth <= skip_depth:
+                out.append(f"{header_indent}    {_comment(language)} ...")
+                out.append(line)
+                skip_depth = None
+            continue
+        out.append(line)
+        new_depth = depth + opens - closes
+        if new_depth > depth and _FUNCTION_HEADER.search(line):
+            skip_depth = depth
+            header_indent = _indent(line)
+        depth = new_depth
+    if skip_depth is not None:
+        out.append(f"{header_indent}    {_comment(language)} ...")
+    return "\n".join(out)
+
+
+def outline_code(code: str, language: str) -> str:
+    """
+    Keep the structure of code and drop function bodies.
+
+    Python code is outlined with the ast module (signatures, decorators,
+    class bodies and docstrings are kept), falling back to indentation for
+    code that does not parse. Other languages are outlined by brace depth.
+
+    Args:
+        code (str): Code snippet.
+        language (str): Programming language.
+
+    Returns:
+        str: Outline with "..." in place of function bodies.
+    """
+    if language.lower() == "python":
+        outline = _python_outline(code)
+        return outline if outline is not None else _indented_outline(code)
+    return _brace_outline(code, language)
+
+
+def shrink_candidates(code: str, language: str) -> Iterable[str]:
+    """
+    Yield progressively shorter versions of code, most informative first.
+
+    The first candidate is the outline; after that the outline keeps only
+    its first half, quarter, ... of lines, with a truncation marker.
+
+    Args:
+        code (str): Code snippet.
+        language (str): Programming language.
+
+    Yields:
+        str: Shorter code.
+    """
+    outline = outline_code(code, language)
+    if outline != code:
+        yield outline
+    lines = outline.split("\n")
+    keep = len(lines) // 2
+    while keep > 0:
+        yield "\n".join(lines[:keep] + [f"{_comment(language)} ... (truncated)"])
+        keep //= 2
+
+
+def tail_candidates(code: str) -> Iterable[str]:
+    """
+    Yield progressively shorter endings of code.
+
+    Used for autocomplete, where the lines right before the cursor matter most.
+
+    Args:
+        code (str): Code typed so far.
+
+    Yields:
+        str: Last half, quarter, ... of the lines.
+    """
+    lines = code.split("\n")
+    keep = len(lines) // 2
+    while keep > 0:
+        yield "\n".join(lines[-keep:])
+        keep //= 2
+
+
+def fit_prompt(build: Callable[[str], str], code: str, candidates: Iterable[str],
+               count_tokens: Callable[[str], int], n_ctx: int, max_tokens: int,
+               min_tokens: int) -> tuple[str, int, str]:
+    """
+    Fit a prompt and its generation budget into the context window.
+
+    max_tokens is lowered to what fits as long as at least min_tokens are
+    left for generation; otherwise the code is replaced by the first
+    shorter candidate that leaves min_tokens.
+
+    Args:
+        build (Callable): Renders the prompt around a code snippet.
+        code (str): Variable part of the prompt.
+        candidates (Iterable[str]): Shorter replacements for code, tried in order.
+        count_tokens (Callable): Returns the number of tokens of a prompt.
+        n_ctx (int): Context window of the model.
+        max_tokens (int): Requested number of tokens to generate.
+        min_tokens (int): Smallest acceptable generation budget.
+
+    Returns:
+        tuple[str, int, str]: Prompt, max_tokens and the code used in the prompt.
+
+    Raises:
+        ContextOverflowError: If no candidate leaves min_tokens for generation.
+    """
+    prompt = build(code)
+    used = count_tokens(prompt)
+    if used + min_tokens <= n_ctx:
+        return prompt, min(max_tokens, n_ctx - used), code
+
+    for candidate in candidates:
+        prompt = build(candidate)
+        candidate_used = count_tokens(prompt)
+        if candidate_used + min_tokens <= n_ctx:
+            return prompt, min(max_tokens, n_ctx - candidate_used), candidate
+
+    raise ContextOverflowError(
+        f"Prompt of {used} tokens leaves no room for {min_tokens} generated tokens "
+        f"in a context window of {n_ctx}"
+    )
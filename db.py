@@ -2,12 +2,22 @@ import os
 from dotenv import load_dotenv
 from pymongo import MongoClient
 
+from telemetry import TelemetryWriter
+
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 
 client: MongoClient | None = None
 db = None
 
+# Per-request usage records, bulk-written to ml_metrics.usage off the request path.
+telemetry = TelemetryWriter(
+    collection=lambda: get_db().usage,
+    capacity=int(os.getenv("TELEMETRY_BUFFER_SIZE", "10000")),
+    batch_size=int(os.getenv("TELEMETRY_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("TELEMETRY_FLUSH_SECONDS", "5"))
+)
+
 def connect_db():
     """
     Establish a connection to the MongoDB database.
@@ -24,14 +34,17 @@ def connect_db():
     client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=12000)
     client.admin.command("ping")
     db = client.ml_metrics
+    telemetry.start()
     return db
 
 def close_db():
     """
-    Close the MongoDB connection if it is active.
+    Close the MongoDB connection if it is active, after writing the
+    telemetry records still buffered.
     """
     global client
     if client is not None:
+        telemetry.close()
         client.close()
         client = None
 
@@ -1,9 +1,13 @@
 from huggingface_hub import hf_hub_download
 import os
 
+from model_registry import record_download
+
 def download_model():
     """
     Download the GGUF model from Hugging Face Hub and store it locally.
+    The file is recorded in the directory's manifest, so the API starts
+    from it without contacting the hub (e.g. when run at image build time).
     Environment Variables:
         HF_REPO_ID (str): Hugging Face repository ID.
         HF_FILENAME (str): Model filename to download.
@@ -22,6 +26,7 @@ def download_model():
         local_dir=local_dir
     )
 
+    record_download(local_dir, f"{repo_id}/{filename}", model_path)
     print("Model downloaded at:", model_path)
     return model_path
 
@@ -0,0 +1,59 @@
+import os
+import threading
+
+# Enables grammar-constrained decoding for the languages below.
+GRAMMAR_DECODING = os.getenv("GRAMMAR_DECODING", "false").lower() in ("1", "true", "yes")
+
+# A single Python function: optional decorators, the signature and an indented
+# body. No comment lines and no top-level code after the function, so the
+# model can only stop (EOS) once the body is complete.
+PYTHON_FUNCTION = r'''
+root      ::= decorator* "def " name "(" [^\n#]* ")" returns? ":\n" line+
+decorator ::= "@" [^\n#]+ "\n"
+name      ::= [a-zA-Z_] [a-zA-Z0-9_]*
+returns   ::= " -> " [^:\n#]+
+line      ::= "\n"? indent [^ \t\n#] [^\n#]* "\n"
+indent    ::= "    "+
+'''
+
+# A single JavaScript function declaration ending with the closing brace at
+# column 0; body lines are indented and cannot start a comment.
+JAVASCRIPT_FUNCTION = r'''
+root   ::= "async "? "function " name "(" [^\n]* ") {\n" line* "}"
+name   ::= [a-zA-Z_$] [a-zA-Z0-9_$]*
+line   ::= "\n"? indent [^ \t\n/] [^\n]* "\n"
+indent ::= "  "+
+'''
+
+GRAMMARS = {"python": PYTHON_FUNCTION, "javascript": JAVASCRIPT_FUNCTION}
+
+_compiled = threading.local()
+
+
+def function_grammar(language: str):
+    """
+    Return the compiled single-function grammar for a language.
+
+    Grammars are parsed once per inference thread: a LlamaGrammar carries
+    its parse state while a generation is running, so concurrent instances
+    of the model cannot share one.
+
+    Args:
+        language (str): Programming language.
+
+    Returns:
+        LlamaGrammar | None: Grammar, or None when grammar decoding is
+        disabled or the language has no grammar.
+    """
+    language = language.lower()
+    if not GRAMMAR_DECODING or language not in GRAMMARS:
+        return None
+
+    cache = getattr(_compiled, "grammars", None)
+    if cache is None:
+        cache = _compiled.grammars = {}
+    if language not in cache:
+        from llama_cpp import LlamaGrammar
+
+        cache[language] = LlamaGrammar.from_string(GRAMMARS[language], verbose=False)
+    return cache[language]
@@ -0,0 +1,870 @@
+import asyncio
+import functools
+import json
+import math
+import os
+import struct
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from context_budget import ContextOverflowError
+from scheduler import FairQueue, UserQueueFull
+
+
+# Lower values are served first.
+PRIORITY_AUTOCOMPLETE = 0
+PRIORITY_GENERATE = 1
+PRIORITY_REPLY = 2
+PRIORITY_BATCH = 3
+
+PRIORITY_NAMES = {
+    "autocomplete": PRIORITY_AUTOCOMPLETE,
+    "generate": PRIORITY_GENERATE,
+    "reply": PRIORITY_REPLY,
+    "batch": PRIORITY_BATCH,
+}
+
+
+# Queue wait of the job running on the current inference thread.
+_current_job = threading.local()
+
+
+def job_wait() -> float | None:
+    """
+    Return how long the job running on this thread waited in the queue.
+
+    Returns:
+        float | None: Seconds, or None outside an inference job.
+    """
+    return getattr(_current_job, "wait", None)
+
+
+def job_stop() -> "JobStop | None":
+    """
+    Return the stop signal of the job running on this thread.
+
+    Returns:
+        JobStop | None: Signal to check between tokens, or None outside an inference job.
+    """
+    return getattr(_current_job, "stop", None)
+
+
+def _run_job(wait: float, stop: "JobStop", fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    _current_job.wait = wait
+    _current_job.stop = stop
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_job.wait = None
+        _current_job.stop = None
+
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when the inference queue has no room for another job.
+
+    Args:
+        message (str): Error detail.
+        retry_after (float): Seconds after which a retry is likely to be admitted.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UserQueueFullError(QueueFullError):
+    """
+    Raised when the submitting user already has too many jobs waiting.
+    """
+
+
+class QueueTimeoutError(QueueFullError):
+    """
+    Raised when a job cannot start before its priority class's queue deadline.
+    """
+
+
+class JobCancelledError(RuntimeError):
+    """
+    Raised when a job is cancelled before it starts.
+    """
+
+
+class JobAbortedError(RuntimeError):
+    """
+    Raised when a job is stopped before it finishes.
+    """
+
+
+class JobDeadlineError(JobAbortedError):
+    """
+    Raised when a job does not finish within its request deadline.
+    """
+
+
+class ClientDisconnectedError(JobAbortedError):
+    """
+    Raised when the client leaves before its result is ready.
+    """
+
+
+class JobStop:
+    """
+    Stop signal of a running job, checked by generation between tokens.
+
+    It is set when the job's cancel event is set (e.g. superseded), when
+    every caller has stopped waiting for the result (client disconnected),
+    or once the request deadline passes. It has the is_set() of
+    threading.Event, so generation code treats it as a cancel event.
+
+    Args:
+        cancel (threading.Event): Cancel event of the job, if any.
+        expires_at (float | None): perf_counter time of the request deadline.
+    """
+
+    def __init__(self, cancel: threading.Event | None = None, expires_at: float | None = None):
+        self.cancel = cancel
+        self.expires_at = expires_at
+        self._abandoned = threading.Event()
+
+    def abandon(self):
+        """
+        Record that nobody is waiting for the result any more.
+        """
+        self._abandoned.set()
+
+    def reason(self) -> str | None:
+        """
+        Tell why the job should stop.
+
+        Returns:
+            str | None: "disconnected", "cancelled" or "deadline", or None to keep going.
+        """
+        if self._abandoned.is_set():
+            return "disconnected"
+        if self.cancel is not None and self.cancel.is_set():
+            return "cancelled"
+        if self.expires_at is not None and time.perf_counter() >= self.expires_at:
+            return "deadline"
+        return None
+
+    def is_set(self) -> bool:
+        return self.reason() is not None
+
+
+@dataclass
+class InferenceJob:
+    """
+    A unit of work waiting for the inference thread.
+
+    Attributes:
+        fn (Callable): Blocking function to run (usually an ml_engine call).
+        args (tuple): Positional arguments for fn.
+        kwargs (dict): Keyword arguments for fn.
+        future (asyncio.Future): Resolved with the result of fn.
+        priority (int): Queue priority, lower runs first.
+        cancel (threading.Event): Set to drop the job if it has not started yet.
+        enqueued_at (float): perf_counter timestamp at submission.
+        user (str | None): Submitting user, for fair sharing.
+        deadline (float | None): perf_counter time by which the job must start.
+        started (bool): Whether a worker has taken the job.
+        stop (JobStop): Tells the running job to stop early.
+    """
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: dict
+    future: asyncio.Future
+    priority: int = PRIORITY_GENERATE
+    cancel: threading.Event | None = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    user: str | None = None
+    deadline: float | None = None
+    started: bool = False
+    stop: JobStop | None = None
+
+
+class SupersedingJobs:
+    """
+    Track the latest job per key and cancel the one it replaces.
+
+    Used for keystroke-driven requests such as autocomplete, where only the
+    newest request of a user is still worth computing. Events are held
+    weakly, so keys disappear once their job and caller are done.
+    """
+
+    def __init__(self):
+        self._events = weakref.WeakValueDictionary()
+
+    def start(self, key) -> threading.Event:
+        """
+        Register a new job for key, cancelling the previous one.
+
+        Args:
+            key (Hashable): Grouping key, e.g. the user id.
+
+        Returns:
+            threading.Event: Cancel event for the new job.
+        """
+        previous = self._events.get(key)
+        if previous is not None:
+            previous.set()
+        event = threading.Event()
+        self._events[key] = event
+        return event
+
+
+class InferenceExecutor:
+    """
+    Run blocking model calls on a dedicated inference thread.
+
+    The llama.cpp model is not thread safe and every call into it blocks for
+    the whole generation, so endpoints never call ml_engine directly. Jobs are
+    submitted to a bounded priority queue and executed one at a time on a
+    single worker thread, which keeps the event loop free for /health, auth
+    failures and every other request while a long generation is running.
+    Latency-sensitive jobs (autocomplete) are queued ahead of explanations.
+
+    With continuous batching or several instances of a model, `workers` jobs
+    run at the same time, one per free slot of the model pool.
+
+    Within a priority class, users share the model fairly (see
+    scheduler.FairQueue), so one user's burst cannot starve the others.
+    Each class may have a queue deadline: a job whose estimated wait already
+    exceeds it is rejected on submission, and a job still waiting when it
+    passes fails with QueueTimeoutError, instead of timing out minutes later.
+
+    A running job stops at its next token once its caller stops waiting for
+    it (client disconnected) or its class's request deadline, counted from
+    submission, passes; the latter fails with JobDeadlineError.
+
+    Args:
+        max_queue_size (int): Maximum number of jobs waiting for the model.
+        workers (int): Number of jobs running at the same time.
+        max_user_jobs (int): Maximum number of jobs waiting per user (0 for no limit).
+        deadlines (dict): Longest queue wait in seconds by priority; missing or 0 means none.
+        user_weights (dict): Fair-share weight by user id (default 1).
+        request_deadlines (dict): Longest total time in seconds by priority; missing or 0 means none.
+    """
+
+    def __init__(self, max_queue_size: int = 16, workers: int = 1, max_user_jobs: int = 0,
+                 deadlines: dict | None = None, user_weights: dict | None = None,
+                 request_deadlines: dict | None = None):
+        self.max_queue_size = max_queue_size
+        self.workers = max(1, workers)
+        self.max_user_jobs = max_user_jobs
+        self.deadlines = {p: d for p, d in (deadlines or {}).items() if d}
+        self.user_weights = user_weights or {}
+        self.request_deadlines = {p: d for p, d in (request_deadlines or {}).items() if d}
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._queue: FairQueue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._service_avg = 0.0
+        self._expired = 0
+        self._shed = 0
+        self._running = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._cancelled = 0
+        self._aborted = Counter()
+        self._wait_total = 0.0
+        self._wait_last = 0.0
+        self._wait_max = 0.0
+
+    async def start(self, loader: Callable[[], Any] | None = None):
+        """
+        Start the worker and optionally load the model on the inference thread.
+
+        Args:
+            loader (Callable): Function that loads the model, e.g. ml_engine._load_model.
+        """
+        if self._tasks:
+            return
+        self._queue = FairQueue(self.max_queue_size, self.max_user_jobs, self.user_weights)
+        if loader is not None:
+            await asyncio.get_running_loop().run_in_executor(self._pool, loader)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Stop the worker, failing any job still waiting in the queue.
+        """
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Inference executor stopped"))
+        self._pool.shutdown(wait=False)
+
+    async def submit(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_GENERATE,
+                     cancel: threading.Event | None = None, user: str | None = None, **kwargs) -> Any:
+        """
+        Queue a blocking call and wait for its result.
+
+        Args:
+            fn (Callable): Blocking function to run on the inference thread.
+            *args: Positional arguments for fn.
+            priority (int): Queue priority, lower runs first.
+            cancel (threading.Event): Drops the job if set before it starts.
+            user (str | None): Submitting user, for fair sharing.
+            **kwargs: Keyword arguments for fn.
+
+        Returns:
+            Any: Return value of fn.
+
+        Raises:
+            QueueFullError: If the queue already holds max_queue_size jobs.
+            UserQueueFullError: If the user already holds max_user_jobs jobs.
+            QueueTimeoutError: If the job cannot start within its queue deadline.
+            JobCancelledError: If cancel was set before the job started.
+            RuntimeError: If the executor has not been started.
+        """
+        job = self._enqueue(fn, args, kwargs, priority, cancel, user)
+        return await job.future
+
+    def stream(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_GENERATE,
+               cancel: threading.Event | None = None, user: str | None = None, **kwargs):
+        """
+        Queue a blocking generator and iterate over its items asynchronously.
+
+        The job is queued immediately, so a full queue is reported before the
+        caller starts a streaming response. Items are handed to the event loop
+        as soon as the inference thread produces them. If the consumer stops
+        iterating, the generator is closed after its next item.
+
+        Args:
+            fn (Callable): Generator function to run on the inference thread.
+            *args: Positional arguments for fn.
+            priority (int): Queue priority, lower runs first.
+            cancel (threading.Event): Drops the job if set before it starts.
+            user (str | None): Submitting user, for fair sharing.
+            **kwargs: Keyword arguments for fn.
+
+        Returns:
+            AsyncIterator: Items yielded by fn.
+
+        Raises:
+            QueueFullError: If the job is not admitted (see submit).
+            RuntimeError: If the executor has not been started.
+        """
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            generator = fn(*args, **kwargs)
+            try:
+                for item in generator:
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+                    if stopped.is_set():
+                        break
+            finally:
+                generator.close()
+
+        job = self._enqueue(produce, (), {}, priority, cancel, user)
+        return self._iterate(job, items, stopped)
+
+    async def open_stream(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_GENERATE,
+                          cancel: threading.Event | None = None, user: str | None = None, **kwargs):
+        """
+        Awaitable form of stream, shared with RemoteExecutor.
+
+        Returns:
+            AsyncIterator: Items yielded by fn.
+        """
+        return self.stream(fn, *args, priority=priority, cancel=cancel, user=user, **kwargs)
+
+    async def _iterate(self, job: InferenceJob, items: asyncio.Queue, stopped: threading.Event):
+        getter = None
+        try:
+            while True:
+                getter = asyncio.ensure_future(items.get())
+                await asyncio.wait({getter, job.future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+
+                # The generator finished; items it produced were queued before
+                # the job future resolved, so drain them before returning.
+                while not items.empty():
+                    yield items.get_nowait()
+                job.future.result()
+                return
+        finally:
+            if getter is not None:
+                getter.cancel()
+            stopped.set()
+            if not job.future.done():
+                job.stop.abandon()
+                job.future.cancel()
+
+    def estimated_wait(self, priority: int) -> float:
+        """
+        Estimate how long a new job of this priority would wait to start.
+
+        Args:
+            priority (int): Queue priority of the job.
+
+        Returns:
+            float: Seconds, from the jobs ahead of it and the average run time.
+        """
+        if self._queue is None:
+            return 0.0
+        ahead = self._queue.ahead(priority) + (self._running >= self.workers)
+        return ahead * self._service_avg / self.workers
+
+    def _retry_after(self, priority: int) -> float:
+        return max(1, math.ceil(self.estimated_wait(priority)))
+
+    def _enqueue(self, fn: Callable[..., Any], args: tuple, kwargs: dict, priority: int,
+                 cancel: threading.Event | None, user: str | None = None) -> InferenceJob:
+        if self._queue is None:
+            raise RuntimeError("Inference executor not started, call start first")
+
+        loop = asyncio.get_running_loop()
+        job = InferenceJob(fn, args, kwargs, loop.create_future(), priority, cancel, user=user)
+        limit = self.request_deadlines.get(priority)
+        job.stop = JobStop(cancel, job.enqueued_at + limit if limit is not None else None)
+        deadline = self.deadlines.get(priority)
+        if deadline is not None:
+            if self.estimated_wait(priority) > deadline:
+                self._shed += 1
+                raise QueueTimeoutError(
+                    "Inference queue is too long to start within the deadline, please retry later",
+                    self._retry_after(priority)
+                )
+            job.deadline = job.enqueued_at + deadline
+        try:
+            self._queue.put_nowait(job, priority, user)
+        except UserQueueFull:
+            self._rejected += 1
+            raise UserQueueFullError("Too many requests in progress, please retry later",
+                                     self._retry_after(priority))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise QueueFullError("Inference queue is full, please retry later", self._retry_after(priority))
+
+        # A caller that gives up (client disconnected, timeout) frees its place at once,
+        # or stops the job at its next token if it is already running.
+        job.future.add_done_callback(lambda f: f.cancelled() and job.stop.abandon())
+        job.future.add_done_callback(lambda _: job.started or self._queue.discard(job))
+        if deadline is not None:
+            timer = loop.call_later(deadline, self._expire, job)
+            job.future.add_done_callback(lambda _: timer.cancel())
+        return job
+
+    def _expire(self, job: InferenceJob):
+        if job.started or job.future.done():
+            return
+        self._expired += 1
+        job.future.set_exception(QueueTimeoutError(
+            "Request waited too long for the model, please retry later", self._retry_after(job.priority)
+        ))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            job.started = True
+            if job.future.done():
+                continue
+            if job.cancel is not None and job.cancel.is_set():
+                self._cancelled += 1
+                job.future.set_exception(JobCancelledError("Job cancelled before it started"))
+                continue
+            if job.stop.reason() == "deadline":
+                self._aborted["deadline"] += 1
+                job.future.set_exception(JobDeadlineError("Request deadline passed before the job started"))
+                continue
+
+            wait = time.perf_counter() - job.enqueued_at
+            self._wait_last = wait
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+            self._running += 1
+            start = time.perf_counter()
+            try:
+                call = functools.partial(_run_job, wait, job.stop, job.fn, job.args, job.kwargs)
+                result = await loop.run_in_executor(self._pool, call)
+                reason = job.stop.reason()
+                if reason is not None:
+                    self._aborted[reason] += 1
+                if reason == "deadline":
+                    # The output was cut off; never hand it out as a complete result.
+                    raise JobDeadlineError("Generation did not finish within the request deadline")
+            except JobDeadlineError as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            except Exception as e:
+                self._failed += 1
+                print("Error in inference job:", traceback.format_exc())
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                self._running -= 1
+                self._processed += 1
+                # Streams hold a worker until their consumer closes them, so
+                # this is the time a job keeps a slot, not only compute time.
+                elapsed = time.perf_counter() - start
+                self._service_avg = elapsed if self._processed == 1 else 0.9 * self._service_avg + 0.1 * elapsed
+
+    def stats(self) -> dict:
+        """
+        Report queue depth and wait times.
+
+        Returns:
+            dict: Queue depth, running/processed/rejected counters and wait times in seconds.
+        """
+        waited = self._processed or 1
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "workers": self.workers,
+            "running": self._running,
+            "processed": self._processed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "cancelled": self._cancelled,
+            "expired": self._expired,
+            "shed": self._shed,
+            "aborted": dict(self._aborted),
+            "service_avg": round(self._service_avg, 4),
+            **(self._queue.stats() if self._queue is not None else {}),
+            "wait_last": round(self._wait_last, 4),
+            "wait_avg": round(self._wait_total / waited, 4),
+            "wait_max": round(self._wait_max, 4),
+        }
+
+
+# Length prefix of the frames exchanged with the inference server.
+_HEADER = struct.Struct("!I")
+
+# Errors re-raised on the client side with their original type.
+_REMOTE_ERRORS = {
+    "QueueFullError": QueueFullError,
+    "UserQueueFullError": UserQueueFullError,
+    "QueueTimeoutError": QueueTimeoutError,
+    "JobCancelledError": JobCancelledError,
+    "JobDeadlineError": JobDeadlineError,
+    "ContextOverflowError": ContextOverflowError,
+}
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict | None:
+    """
+    Read one length-prefixed JSON message.
+
+    Args:
+        reader (asyncio.StreamReader): Socket reader.
+
+    Returns:
+        dict | None: Message, or None when the peer closed the connection.
+    """
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        return json.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def write_frame(writer: asyncio.StreamWriter, message: dict):
+    """
+    Queue one length-prefixed JSON message on a socket writer.
+
+    Args:
+        writer (asyncio.StreamWriter): Socket writer.
+        message (dict): JSON-serializable message.
+    """
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    writer.write(_HEADER.pack(len(data)) + data)
+
+
+def raise_remote_error(message: dict):
+    """
+    Re-raise an error reported by the inference server.
+
+    Args:
+        message (dict): Frame with "error" and "type" fields.
+    """
+    error = _REMOTE_ERRORS.get(message.get("type"), RuntimeError)
+    if issubclass(error, QueueFullError):
+        raise error(message["error"], message.get("retry_after", 1.0))
+    raise error(message["error"])
+
+
+class RemoteExecutor:
+    """
+    Client of the shared inference server, with the interface of InferenceExecutor.
+
+    Used when several uvicorn workers serve HTTP: a single inference_server
+    process owns the models and every worker forwards jobs to it over a
+    local Unix socket, so model memory and CPU threads do not grow with the
+    number of workers. Each job uses its own connection; streamed items are
+    forwarded as soon as the server decodes them.
+
+    Only functions exposed by the server can be called. A cancel event is
+    mirrored to the server while the job runs, and closing a stream early
+    closes the connection, which stops the generation on the server.
+
+    Args:
+        path (str): Unix socket path of the inference server.
+        connect_timeout (float): Seconds start() waits for the server to accept connections.
+    """
+
+    def __init__(self, path: str, connect_timeout: float = 300.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self.workers = 0
+        self._running = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    async def start(self, loader: Callable[[], Any] | None = None):
+        """
+        Wait until the inference server accepts connections.
+
+        Args:
+            loader (Callable): Ignored, the server loads the models.
+
+        Raises:
+            RuntimeError: If the server is not reachable within connect_timeout.
+        """
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Inference server not reachable at {self.path}")
+                await asyncio.sleep(0.5)
+                continue
+            writer.close()
+            await writer.wait_closed()
+            return
+
+    async def stop(self):
+        """
+        Nothing to release; connections are closed after every job.
+        """
+
+    async def reachable(self, timeout: float = 1.0) -> bool:
+        """
+        Check that the inference server still accepts connections.
+
+        Args:
+            timeout (float): Seconds to wait for the connection.
+
+        Returns:
+            bool: Whether a connection was accepted in time.
+        """
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        await writer.wait_closed()
+        return True
+
+    async def server_stats(self) -> dict:
+        """
+        Fetch queue and model stats from the inference server.
+
+        Returns:
+            dict: Server-side queue and model pool stats.
+        """
+        return await self._query("stats")
+
+    async def server_metrics(self) -> str:
+        """
+        Fetch the inference server's metrics in the Prometheus text format.
+
+        Returns:
+            str: Exposition text of the queue and model stage histograms.
+        """
+        return await self._query("metrics")
+
+    async def _query(self, op: str) -> Any:
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            write_frame(writer, {"op": op})
+            await writer.drain()
+            message = await read_frame(reader)
+            if message is None or "error" in message:
+                raise_remote_error(message or {"error": "Inference server closed the connection"})
+            return message["result"]
+        finally:
+            writer.close()
+
+    async def submit(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_GENERATE,
+                     cancel: threading.Event | None = None, user: str | None = None, **kwargs) -> Any:
+        """
+        Run a server function and wait for its result.
+
+        Args:
+            fn (Callable): Function exposed by the server, identified by name.
+            *args: JSON-serializable positional arguments (the cancel event may be one of them).
+            priority (int): Queue priority, lower runs first.
+            cancel (threading.Event): Cancels the job on the server when set.
+            user (str | None): Submitting user, for fair sharing on the server.
+            **kwargs: JSON-serializable keyword arguments.
+
+        Returns:
+            Any: Return value of fn.
+
+        Raises:
+            QueueFullError: If the server does not admit the job.
+            JobCancelledError: If cancel was set before the job started.
+        """
+        reader, writer, watcher = await self._open(fn, args, kwargs, priority, cancel, user, stream=False)
+        self._running += 1
+        try:
+            message = await read_frame(reader)
+            if message is None:
+                raise RuntimeError("Inference server closed the connection")
+            if "error" in message:
+                raise_remote_error(message)
+            return message["result"]
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._running -= 1
+            self._processed += 1
+            watcher.cancel()
+            writer.close()
+
+    async def open_stream(self, fn: Callable[..., Any], *args, priority: int = PRIORITY_GENERATE,
+                          cancel: threading.Event | None = None, user: str | None = None, **kwargs):
+        """
+        Queue a server generator and iterate over its items asynchronously.
+
+        Returns once the server has queued the job, so a full queue is
+        reported before the caller starts a streaming response.
+
+        Returns:
+            AsyncIterator: Items yielded by fn.
+
+        Raises:
+            QueueFullError: If the server does not admit the job.
+        """
+        reader, writer, watcher = await self._open(fn, args, kwargs, priority, cancel, user, stream=True)
+        return self._iterate(reader, writer, watcher)
+
+    async def _iterate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, watcher: asyncio.Task):
+        self._running += 1
+        try:
+            while True:
+                message = await read_frame(reader)
+                if message is None:
+                    raise RuntimeError("Inference server closed the connection")
+                if "error" in message:
+                    raise_remote_error(message)
+                if message.get("done"):
+                    return
+                yield message["item"]
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._running -= 1
+            self._processed += 1
+            watcher.cancel()
+            writer.close()
+
+    async def _open(self, fn: Callable[..., Any], args: tuple, kwargs: dict, priority: int,
+                    cancel: threading.Event | None, user: str | None, stream: bool):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        write_frame(writer, {
+            "op": fn.__name__,
+            "args": [None if a is cancel and cancel is not None else a for a in args],
+            "cancel_args": [i for i, a in enumerate(args) if a is cancel and cancel is not None],
+            "kwargs": kwargs,
+            "priority": priority,
+            "user": user,
+            "cancel": cancel is not None,
+            "stream": stream,
+        })
+        await writer.drain()
+
+        message = await read_frame(reader)
+        if message is None or "error" in message:
+            writer.close()
+            if message is not None and message.get("type") in ("QueueFullError", "UserQueueFullError"):
+                self._rejected += 1
+            raise_remote_error(message or {"error": "Inference server closed the connection"})
+        return reader, writer, asyncio.create_task(self._watch(writer, cancel))
+
+    async def _watch(self, writer: asyncio.StreamWriter, cancel: threading.Event | None):
+        # threading.Event cannot be awaited; poll it while the job is in flight.
+        if cancel is None:
+            return
+        while not cancel.is_set():
+            await asyncio.sleep(0.02)
+        try:
+            write_frame(writer, {"cancel": True})
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def stats(self) -> dict:
+        """
+        Report client-side counters.
+
+        Returns:
+            dict: Socket path and running/processed/failed/rejected counters.
+        """
+        return {
+            "server": self.path,
+            "running": self._running,
+            "processed": self._processed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+        }
+
+
+def executor_options() -> dict:
+    """
+    Read the scheduling options of InferenceExecutor from the environment.
+
+    INFERENCE_QUEUE_SIZE and INFERENCE_USER_QUEUE_SIZE bound the waiting jobs
+    in total and per user. QUEUE_DEADLINES maps priority classes to their
+    longest queue wait in seconds ("autocomplete:2,generate:30,reply:60"),
+    and REQUEST_DEADLINES to their longest time from submission to the last
+    token; USER_WEIGHTS gives users a fair-share weight ("uid-a:2,uid-b:0.5").
+
+    Returns:
+        dict: Keyword arguments for InferenceExecutor.
+    """
+    def pairs(value: str) -> dict:
+        return {
+            name.strip(): float(number)
+            for name, _, number in (item.rpartition(":") for item in value.split(",") if item.strip())
+        }
+
+    deadlines = pairs(os.getenv("QUEUE_DEADLINES", "autocomplete:2,generate:30,reply:60,batch:0"))
+    request_deadlines = pairs(os.getenv("REQUEST_DEADLINES", "autocomplete:10,generate:90,reply:180,batch:0"))
+    return {
+        "max_queue_size": int(os.getenv("INFERENCE_QUEUE_SIZE", "16")),
+        "max_user_jobs": int(os.getenv("INFERENCE_USER_QUEUE_SIZE", "4")),
+        "deadlines": {PRIORITY_NAMES[name]: seconds for name, seconds in deadlines.items()},
+        "user_weights": pairs(os.getenv("USER_WEIGHTS", "")),
+        "request_deadlines": {PRIORITY_NAMES[name]: seconds for name, seconds in request_deadlines.items()},
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import threading
+import traceback
+
+from ml_engine import (
+    MODEL_POOL, _load_model, model_stats, speculative_stats,
+    generate_code, autocomplete_code, generate_reply, generate_reply_code_only,
+    stream_code, stream_autocomplete, stream_reply, stream_reply_code_only, embed_text
+)
+from inference import InferenceExecutor, PRIORITY_GENERATE, executor_options, read_frame, write_frame
+import metrics
+
+# Functions HTTP workers may call, with the endpoint whose model runs them.
+OPERATIONS = {
+    "generate_code": ("generate", generate_code),
+    "autocomplete_code": ("autocomplete", autocomplete_code),
+    "generate_reply": ("reply", generate_reply),
+    "generate_reply_code_only": ("reply-code-only", generate_reply_code_only),
+    "stream_code": ("generate", stream_code),
+    "stream_autocomplete": ("autocomplete", stream_autocomplete),
+    "stream_reply": ("reply", stream_reply),
+    "stream_reply_code_only": ("reply-code-only", stream_reply_code_only),
+    "embed_text": ("embed", embed_text),
+}
+
+executors = {
+    name: InferenceExecutor(workers=slots, **executor_options())
+    for name, slots in MODEL_POOL.slots().items()
+}
+
+
+def _error(e: Exception) -> dict:
+    error = {"error": str(e), "type": type(e).__name__}
+    if hasattr(e, "retry_after"):
+        error["retry_after"] = e.retry_after
+    return error
+
+
+def _once(fn):
+    # Runs a plain function as a one-item generator, so every job is queued the same way.
+    def run(*args, **kwargs):
+        yield fn(*args, **kwargs)
+    return run
+
+
+def _stats() -> dict:
+    return {
+        "queues": {name: executor.stats() for name, executor in executors.items()},
+        "models": model_stats(),
+        "speculative": speculative_stats(),
+    }
+
+
+async def _watch(reader: asyncio.StreamReader, cancel: threading.Event | None):
+    # Returns when the client disconnects; a cancel frame only sets the event.
+    while True:
+        message = await read_frame(reader)
+        if message is None:
+            break
+        if message.get("cancel") and cancel is not None:
+            cancel.set()
+    if cancel is not None:
+        cancel.set()
+
+
+async def _run_job(request: dict, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    endpoint, fn = OPERATIONS[request["op"]]
+    stream = bool(request.get("stream"))
+    cancel = threading.Event() if request.get("cancel") else None
+    args = list(request.get("args", []))
+    for index in request.get("cancel_args", []):
+        args[index] = cancel
+
+    executor = executors[MODEL_POOL.route(endpoint).name]
+    try:
+        items = executor.stream(
+            fn if stream else _once(fn),
+            *args,
+            priority=request.get("priority", PRIORITY_GENERATE),
+            cancel=cancel,
+            user=request.get("user"),
+            **request.get("kwargs", {})
+        )
+    except Exception as e:
+        write_frame(writer, _error(e))
+        return
+    write_frame(writer, {"accepted": True})
+    await writer.drain()
+
+    async def forward():
+        async for item in items:
+            write_frame(writer, {"item": item} if stream else {"result": item})
+            await writer.drain()
+        if stream:
+            write_frame(writer, {"done": True})
+
+    forwarding = asyncio.create_task(forward())
+    watching = asyncio.create_task(_watch(reader, cancel))
+    await asyncio.wait({forwarding, watching}, return_when=asyncio.FIRST_COMPLETED)
+
+    if not forwarding.done():
+        # The HTTP worker went away; stop the job instead of generating for nobody.
+        forwarding.cancel()
+        await asyncio.gather(forwarding, return_exceptions=True)
+        return
+    watching.cancel()
+    if forwarding.exception() is not None:
+        write_frame(writer, _error(forwarding.exception()))
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Serve one job request from an HTTP worker.
+
+    Args:
+        reader (asyncio.StreamReader): Connection reader.
+        writer (asyncio.StreamWriter): Connection writer.
+    """
+    try:
+        request = await read_frame(reader)
+        if request is None:
+            return
+        if request.get("op") == "stats":
+            write_frame(writer, {"result": _stats()})
+        elif request.get("op") == "metrics":
+            write_frame(writer, {"result": metrics.render()})
+        elif request.get("op") not in OPERATIONS:
+            write_frame(writer, {"error": f"Unknown operation: {request.get('op')}", "type": "ValueError"})
+        else:
+            await _run_job(request, reader, writer)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    except Exception:
+        print("Error in inference server:", traceback.format_exc())
+    finally:
+        writer.close()
+
+
+async def serve(path: str):
+    """
+    Load the models and serve jobs on a Unix socket until cancelled.
+
+    Args:
+        path (str): Socket path shared with the HTTP workers.
+    """
+    await asyncio.to_thread(_load_model)
+    for executor in executors.values():
+        await executor.start()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path=path)
+    os.chmod(path, 0o600)
+    print(f"✅ Inference server listening on {path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for executor in executors.values():
+            await executor.stop()
+        MODEL_POOL.close()
+        print("🛑 Inference server stopped")
+
+
+if __name__ == "__main__":
+    socket_path = os.getenv("INFERENCE_SOCKET")
+    if not socket_path:
+        raise RuntimeError("INFERENCE_SOCKET is not set in environment variables")
+    asyncio.run(serve(socket_path))
@@ -0,0 +1,221 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Bucket upper bounds for durations in seconds, and for token counts.
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+
+class Histogram:
+    """
+    Prometheus histogram with labels, safe to observe from any thread.
+
+    Args:
+        name (str): Metric name.
+        documentation (str): HELP text.
+        labelnames (tuple): Label names, every observation passes all of them.
+        buckets (tuple): Increasing bucket upper bounds; +Inf is implicit.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        """
+        Record one observation.
+
+        Args:
+            value (float): Observed value.
+            **labels: Value of every label in labelnames.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the duration of a with block, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def has_observations(self) -> bool:
+        with self._lock:
+            return bool(self._series)
+
+    def render(self) -> list[str]:
+        """
+        Render the histogram in the Prometheus text format.
+
+        Returns:
+            list[str]: Exposition lines.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """
+    Prometheus counter with labels, safe to increment from any thread.
+
+    Args:
+        name (str): Metric name, ending in _total.
+        documentation (str): HELP text.
+        labelnames (tuple): Label names, every increment passes all of them.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Add to the counter.
+
+        Args:
+            amount (float): Increment.
+            **labels: Value of every label in labelnames.
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def has_observations(self) -> bool:
+        with self._lock:
+            return bool(self._values)
+
+    def render(self) -> list[str]:
+        """
+        Render the counter in the Prometheus text format.
+
+        Returns:
+            list[str]: Exposition lines.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            labels = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY: list[Histogram | Counter] = []
+
+# HTTP-level stages, labelled by request path and the pid of the uvicorn worker that served it.
+# Each worker keeps its own series and a scrape reaches one worker, so sum over "worker" in queries.
+REQUEST_SECONDS = Histogram(
+    "assistant_request_seconds", "Time to the end of the response.", ("endpoint", "worker")
+)
+AUTH_SECONDS = Histogram("assistant_auth_seconds", "Token verification time.", ("endpoint", "worker"))
+
+# Model stages, labelled by endpoint name ("reply", ...) and the model serving it.
+QUEUE_WAIT_SECONDS = Histogram(
+    "assistant_queue_wait_seconds", "Time a job waited for a free model slot.", ("endpoint", "model")
+)
+PROMPT_EVAL_SECONDS = Histogram(
+    "assistant_prompt_eval_seconds", "Prompt evaluation time.", ("endpoint", "model")
+)
+PROMPT_TOKENS = Histogram(
+    "assistant_prompt_tokens", "Prompt tokens evaluated (not restored from cached state).",
+    ("endpoint", "model"), TOKEN_BUCKETS
+)
+GENERATION_SECONDS = Histogram(
+    "assistant_generation_seconds", "Token generation time.", ("endpoint", "model")
+)
+GENERATED_TOKENS = Histogram(
+    "assistant_generated_tokens", "Generated tokens.", ("endpoint", "model"), TOKEN_BUCKETS
+)
+TOKENS_PER_SECOND = Histogram(
+    "assistant_generation_tokens_per_second", "Generation speed.", ("endpoint", "model"), RATE_BUCKETS
+)
+POSTPROCESS_SECONDS = Histogram(
+    "assistant_postprocess_seconds", "Output cleanup time.", ("endpoint", "model")
+)
+GENERATIONS_ABORTED = Counter(
+    "assistant_generations_aborted_total",
+    "Generations stopped early: client disconnected, superseded (cancelled) or past the request deadline.",
+    ("endpoint", "model", "reason")
+)
+
+
+def render() -> str:
+    """
+    Render every metric with observations in the Prometheus text format.
+
+    Metrics without observations are left out, so the HTTP workers and
+    the inference server can be scraped together without repeating a metric.
+
+    Returns:
+        str: Exposition text.
+    """
+    return "".join(
+        "\n".join(metric.render()) + "\n" for metric in REGISTRY if metric.has_observations()
+    )
+
+
+class RequestTimer:
+    """
+    ASGI middleware recording REQUEST_SECONDS until the last byte of the response.
+
+    Paths that match no route share the "other" label, so unknown URLs
+    cannot create new series.
+
+    Args:
+        app: ASGI application to wrap.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._paths is None:
+            self._paths = {getattr(route, "path", None) for route in scope["app"].routes}
+        path = scope["path"] if scope["path"] in self._paths else "other"
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=path, worker=os.getpid())
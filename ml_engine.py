@@ -1,47 +1,392 @@
-from llama_cpp import Llama
-from huggingface_hub import hf_hub_download
+import functools
 import os
+import threading
+import time
 import traceback
-import re
 
-_llm = None
+from model_registry import ModelPool
+from context_budget import fit_prompt, shrink_candidates, tail_candidates
+from grammars import function_grammar
+from postprocess import (
+    MENTOR_FALLBACK, AutocompleteFilter, CodeLineFilter, IncrementalCleaner, MentorFilter,
+    clean_autocomplete, clean_mentor_response, run_filter
+)
+from inference import job_stop, job_wait
+from metrics import (
+    QUEUE_WAIT_SECONDS, PROMPT_EVAL_SECONDS, PROMPT_TOKENS, GENERATION_SECONDS, GENERATED_TOKENS,
+    TOKENS_PER_SECOND, POSTPROCESS_SECONDS, GENERATIONS_ABORTED
+)
+import speculative
+
+# Memory budget for evaluated prompt-template prefixes, per model (0 disables the cache).
+PREFIX_CACHE_MB = int(os.getenv("PREFIX_CACHE_MB", "512"))
+
+# Sampling temperature per endpoint; also part of the response cache key.
+TEMPERATURES = {"generate": 0.7, "autocomplete": 0.7, "reply": 0.3, "reply-code-only": 0.2}
+
+# Memory budget for per-user autocomplete states, per model (0 disables session reuse).
+AUTOCOMPLETE_SESSION_MB = int(os.getenv("AUTOCOMPLETE_SESSION_MB", "256"))
+
+# Models served by the API and the endpoints routed to each of them.
+MODEL_POOL = ModelPool.from_env(
+    prefix_cache_bytes=PREFIX_CACHE_MB * 1024 * 1024,
+    session_cache_bytes=AUTOCOMPLETE_SESSION_MB * 1024 * 1024
+)
+
+# Endpoints decoded with prompt-lookup speculative decoding, e.g. "reply-code-only".
+SPECULATIVE_ENDPOINTS = [e.strip() for e in os.getenv("SPECULATIVE_ENDPOINTS", "").split(",") if e.strip()]
+
+# Verifying drafts needs the logits of every evaluated position.
+for _endpoint in SPECULATIVE_ENDPOINTS:
+    MODEL_POOL.route(_endpoint).spec.logits_all = True
+
+_speculative_stats = {endpoint: speculative.SpeculativeStats() for endpoint in SPECULATIVE_ENDPOINTS}
+
+# Endpoints whose answers are also served to similar prompts, e.g. "generate,reply".
+SEMANTIC_CACHE_ENDPOINTS = [e.strip() for e in os.getenv("SEMANTIC_CACHE_ENDPOINTS", "").split(",") if e.strip()]
+
+# The model serving "embed" (the default model unless another claims it) embeds the prompts.
+if SEMANTIC_CACHE_ENDPOINTS and "embed" in MODEL_POOL.routes:
+    MODEL_POOL.route("embed").spec.embedding = True
 
 def _load_model():
     """
-    Load the Llama model, downloading it from Hugging Face Hub if needed.
+    Load every model of the pool, downloading them from Hugging Face Hub if needed.
     Environment Variables:
-        HF_REPO_ID (str): Hugging Face repository ID.
-        HF_FILENAME (str): Model filename to download.
+        MODEL_CONFIG (str): JSON file listing the models and their endpoints.
+        MODEL_MEMORY_MB (int): Memory budget of the pool (0 means unlimited).
+        HF_REPO_ID (str): Hugging Face repository ID (without MODEL_CONFIG).
+        HF_FILENAME (str): Model filename to download (without MODEL_CONFIG).
         HF_LOCAL_DIR (str): Local directory to store the model.
+        LLAMA_BATCH_SIZE (int): Sequences per continuous batch (without MODEL_CONFIG, 1 disables batching).
+    """
+    try:
+        MODEL_POOL.load()
+    except Exception as e:
+        print("❌ Error loading model:", traceback.format_exc())
+        raise
+
+def model_id(endpoint: str) -> str:
+    """
+    Return the identity of the model serving an endpoint.
+
+    Args:
+        endpoint (str): Endpoint name, e.g. "reply".
+
+    Returns:
+        str: Model identity, used to keep cached responses of different models apart.
+    """
+    return MODEL_POOL.route(endpoint).spec.model_id
+
+def speculative_stats() -> dict:
+    """
+    Report speculative decoding acceptance and speedup per endpoint.
+
+    Returns:
+        dict: Stats keyed by endpoint name.
+    """
+    return {endpoint: stats.as_dict() for endpoint, stats in _speculative_stats.items()}
+
+def model_stats() -> dict:
+    """
+    Report model pool usage, batching and KV state cache counters.
+
+    Returns:
+        dict: Per-model stats, routes and memory estimate.
+    """
+    return MODEL_POOL.stats()
+
+def embed_text(text: str) -> list:
+    """
+    Embed a text with the model serving "embed", for the semantic cache.
+
+    Texts longer than the model's context window are truncated.
+
+    Args:
+        text (str): Text to embed, e.g. a normalized prompt.
+
+    Returns:
+        list[float]: Embedding vector.
+
+    Raises:
+        RuntimeError: If no model serves "embed" or it batches sequences.
+    """
+    if "embed" not in MODEL_POOL.routes:
+        raise RuntimeError("No model serves embeddings")
+    with MODEL_POOL.acquire("embed") as instance:
+        if instance.batcher is not None:
+            raise RuntimeError(f"Model {instance.model.name} batches sequences and cannot embed")
+        llm = instance.llm
+        n_ctx = instance.model.spec.n_ctx
+        tokens = llm.tokenize(text.encode("utf-8"))
+        if len(tokens) > n_ctx:
+            text = llm.detokenize(tokens[:n_ctx - 1]).decode("utf-8", errors="ignore")
+        return llm.embed(text)
+
+@functools.lru_cache(maxsize=1024)
+def _tokens(model_name: str, text: str) -> tuple:
+    """
+    Tokenize a prompt once; the budgeter and the generation call share the result.
+    """
+    return tuple(MODEL_POOL.models[model_name].instances[0].llm.tokenize(text.encode("utf-8")))
+
+def _fit(endpoint: str, build, code: str, max_tokens: int, candidates=()) -> tuple[str, int, str]:
     """
-    global _llm
-    if _llm is not None:
+    Fit a prompt into the context window of the model serving an endpoint.
+
+    Requests that would overflow are shrunk (or rejected) before any prompt
+    evaluation, and max_tokens is lowered to what the context can hold.
+
+    Args:
+        endpoint (str): Endpoint name, selects the model.
+        build (Callable): Renders the prompt around the code.
+        code (str): Variable part of the prompt.
+        max_tokens (int): Requested number of tokens to generate.
+        candidates (Iterable[str]): Shorter replacements for code, tried in order.
+
+    Returns:
+        tuple[str, int, str]: Prompt, max_tokens and the code used in the prompt.
+
+    Raises:
+        ContextOverflowError: If not even half of max_tokens can be generated.
+    """
+    MODEL_POOL.load()
+    model = MODEL_POOL.route(endpoint)
+    return fit_prompt(
+        build,
+        code,
+        candidates,
+        lambda text: len(_tokens(model.name, text)),
+        model.spec.n_ctx,
+        max_tokens,
+        max_tokens // 2
+    )
+
+def _grammar(endpoint: str, language: str):
+    """
+    Return the single-function grammar for a language when the endpoint's model can apply it.
+
+    The continuous batching scheduler samples without grammars, so batched
+    models fall back to unconstrained decoding and the usual output cleanup.
+    """
+    if MODEL_POOL.route(endpoint).spec.batch_size > 1:
+        return None
+    return function_grammar(language)
+
+def _prepare_prompt(instance, prompt: str, prefix: str | None, session: tuple | None = None):
+    """
+    Restore the evaluated state of a shared prompt prefix before generation.
+
+    A resumed autocomplete session takes precedence over the prefix. On a
+    cache miss the prefix is evaluated once and its state stored. The prompt
+    stays text, as Llama.__call__ requires: llama.cpp matches its tokens
+    against whatever state the model holds and evaluates only the differing
+    suffix.
+
+    Args:
+        instance (ModelInstance): Model instance that will run the prompt.
+        prompt (str): Full prompt text.
+        prefix (str): Leading part of the prompt shared by other requests.
+        session (tuple): (user_id, language, code) of an autocomplete request.
+
+    Returns:
+        str: Prompt text to pass to the model.
+    """
+    llm = instance.llm
+    prefix_cache = instance.model.prefix_cache
+    if _resume_session(instance, session):
+        prefix = None
+    if prefix is not None and prefix_cache is not None:
+        if not prefix_cache.restore(llm, prefix):
+            llm.reset()
+            llm.eval(llm.tokenize(prefix.encode("utf-8")))
+            prefix_cache.save(llm, prefix)
+    return prompt
+
+def _resume_session(instance, session: tuple | None) -> bool:
+    """
+    Restore the user's previous autocomplete state when the new code extends it.
+
+    The restored KV cache already holds the header and the previous code, so
+    only the newly typed characters and the marker are evaluated.
+
+    Returns:
+        bool: True if a session state was restored.
+    """
+    model = instance.model
+    if session is None or model.session_cache is None:
+        return False
+    user_id, language, code = session
+    previous = model.session_inputs.get(user_id)
+    if previous is None or previous[0] != language or not code.startswith(previous[1]):
+        return False
+    return model.session_cache.restore(instance.llm, user_id)
+
+def _save_session(instance, session: tuple | None):
+    model = instance.model
+    if session is None or model.session_cache is None or instance.batcher is not None:
         return
+    user_id, language, code = session
+    model.session_cache.save(instance.llm, user_id)
+    with model.lock:
+        model.session_inputs[user_id] = (language, code)
+        model.session_inputs.move_to_end(user_id)
+        while len(model.session_inputs) > 4096:
+            model.session_inputs.popitem(last=False)
+
+def _stopping_criteria(cancel: threading.Event | None):
+    if cancel is None:
+        return None
+    from llama_cpp import StoppingCriteriaList
+
+    return StoppingCriteriaList([lambda input_ids, logits: cancel.is_set()])
+
+def _batched(batcher, prompt: str, max_tokens: int, temperature: float, stop, cancel: threading.Event | None):
+    for text in batcher.generate(prompt, max_tokens, temperature, stop):
+        yield text
+        if cancel is not None and cancel.is_set():
+            return
+
+class _GenerationTimer:
+    """
+    Record the queue wait, prompt evaluation and generation of one request as metrics.
 
-    try:
-        repo_id = os.getenv("HF_REPO_ID")
-        filename = os.getenv("HF_FILENAME")
-        local_dir = os.getenv("HF_LOCAL_DIR")
+    When the call has the llama context to itself, llama.cpp's own timings
+    split prompt evaluation from decoding and count only the prompt tokens
+    that were actually evaluated. Batched and speculative generations (and
+    models without a context) are split at the first generated piece instead.
 
-        print(f"📥 Downloading model {repo_id}/{filename} to {local_dir}")
-        model_path = hf_hub_download(repo_id=repo_id, filename=filename, local_dir=local_dir)
+    Generations stopped early by their cancel signal are also counted, by reason.
 
-        _llm = Llama(model_path=model_path, n_threads=4, n_ctx=512, n_batch=128, temperature=0.6, verbose=False)
-        print("✅ Model loaded successfully")
+    Args:
+        endpoint (str): Endpoint name.
+        instance (ModelInstance): Model instance running the request.
+        prompt (str): Full prompt text.
+        exact (bool): Whether llama.cpp's timings can be attributed to this request.
+        cancel (JobStop | threading.Event): Stop signal of the generation.
+    """
 
-    except Exception as e:
-        print("❌ Error loading model:", traceback.format_exc())
-        raise
+    def __init__(self, endpoint: str, instance, prompt: str, exact: bool = True, cancel=None):
+        self.labels = {"endpoint": endpoint, "model": instance.model.name}
+        self.instance = instance
+        self.prompt = prompt
+        self.cancel = cancel
+        self.ctx = getattr(instance.llm, "ctx", None) if exact and instance.batcher is None else None
+        self.text = ""
+        self.first = None
+        self.start = time.perf_counter()
+        wait = job_wait()
+        if wait is not None:
+            QUEUE_WAIT_SECONDS.observe(wait, **self.labels)
+        if self.ctx is not None:
+            import llama_cpp
+
+            llama_cpp.llama_reset_timings(self.ctx)
+
+    def pieces(self, pieces):
+        for piece in pieces:
+            if self.first is None:
+                self.first = time.perf_counter()
+            self.text += piece
+            yield piece
+
+    def finish(self, text: str | None = None):
+        end = time.perf_counter()
+        if self.ctx is not None:
+            import llama_cpp
+
+            timings = llama_cpp.llama_get_timings(self.ctx)
+            prompt_seconds, prompt_tokens = timings.t_p_eval_ms / 1000, timings.n_p_eval
+            generation_seconds = (timings.t_eval_ms + timings.t_sample_ms) / 1000
+            tokens = timings.n_eval
+        else:
+            prompt_seconds = self.first - self.start if self.first is not None else None
+            prompt_tokens = len(_tokens(self.labels["model"], self.prompt))
+            generation_seconds = end - (self.first or self.start)
+            text = self.text if text is None else text
+            tokens = len(self.instance.llm.tokenize(text.encode("utf-8"), add_bos=False)) if text else 0
+
+        if prompt_seconds is not None:
+            PROMPT_EVAL_SECONDS.observe(prompt_seconds, **self.labels)
+        PROMPT_TOKENS.observe(prompt_tokens, **self.labels)
+        GENERATION_SECONDS.observe(generation_seconds, **self.labels)
+        GENERATED_TOKENS.observe(tokens, **self.labels)
+        if tokens and generation_seconds > 0:
+            TOKENS_PER_SECOND.observe(tokens / generation_seconds, **self.labels)
+        if self.cancel is not None and self.cancel.is_set():
+            reason = self.cancel.reason() if hasattr(self.cancel, "reason") else "cancelled"
+            GENERATIONS_ABORTED.inc(reason=reason, **self.labels)
+
+def _postprocess(endpoint: str, clean, *args):
+    with POSTPROCESS_SECONDS.time(endpoint=endpoint, model=MODEL_POOL.route(endpoint).name):
+        return clean(*args)
+
+def _stream_postprocess(endpoint: str, chunks, text_filter):
+    """
+    Run a streaming filter over raw text pieces, recording the time spent in it.
 
-def generate_response(prompt: str, max_tokens: int = 128, temperature: float = 0.7, stop=None) -> str:
+    Yields:
+        str: Cleaned text pieces.
+    """
+    elapsed = 0.0
     try:
-        _load_model()
-        output = _llm(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            stop=stop or ["</s>", "###"]
-        )
+        for chunk in chunks:
+            start = time.perf_counter()
+            out = text_filter.feed(chunk)
+            elapsed += time.perf_counter() - start
+            if out:
+                yield out
+        start = time.perf_counter()
+        out = text_filter.finish()
+        elapsed += time.perf_counter() - start
+        if out:
+            yield out
+    finally:
+        POSTPROCESS_SECONDS.observe(elapsed, endpoint=endpoint, model=MODEL_POOL.route(endpoint).name)
+
+def _speculative(instance, endpoint: str, grammar) -> bool:
+    # Drafts are verified without grammar support, so a grammar takes precedence.
+    return endpoint in _speculative_stats and instance.batcher is None and grammar is None
+
+def generate_response(prompt: str, max_tokens: int = 128, temperature: float = 0.7, stop=None,
+                      prefix: str | None = None, cancel: threading.Event | None = None,
+                      endpoint: str = "generate", session: tuple | None = None, grammar=None) -> str:
+    # Inside an inference job, also stop when the client leaves or the deadline passes.
+    cancel = job_stop() or cancel
+    try:
+        with MODEL_POOL.acquire(endpoint) as instance:
+            use_speculative = _speculative(instance, endpoint, grammar)
+            timer = _GenerationTimer(endpoint, instance, prompt, exact=not use_speculative, cancel=cancel)
+            if instance.batcher is not None:
+                text = "".join(timer.pieces(_batched(instance.batcher, prompt, max_tokens, temperature,
+                                                     stop or ["</s>", "###"], cancel)))
+                timer.finish()
+                return text.strip()
+
+            if use_speculative:
+                text = "".join(timer.pieces(speculative.generate(
+                    instance.llm,
+                    list(_tokens(instance.model.name, _prepare_prompt(instance, prompt, prefix, session))),
+                    max_tokens,
+                    temperature,
+                    stop or ["</s>", "###"],
+                    cancel,
+                    _speculative_stats[endpoint]
+                )))
+                timer.finish()
+                _save_session(instance, session)
+                return text.strip()
+
+            output = instance.llm(
+                _prepare_prompt(instance, prompt, prefix, session),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop or ["</s>", "###"],
+                stopping_criteria=_stopping_criteria(cancel),
+                grammar=grammar
+            )
+            timer.finish(output["choices"][0]["text"] if output.get("choices") else "")
+            _save_session(instance, session)
 
         if "choices" not in output or len(output["choices"]) == 0:
             return "⚠️ ERROR: Empty model output"
@@ -52,6 +397,71 @@ def generate_response(prompt: str, max_tokens: int = 128, temperature: float = 0
         print("Error in generate_response:", traceback.format_exc())
         return f"❌ Error: {str(e)}"
 
+def stream_response(prompt: str, max_tokens: int = 128, temperature: float = 0.7, stop=None,
+                    prefix: str | None = None, cancel: threading.Event | None = None,
+                    endpoint: str = "generate", session: tuple | None = None, grammar=None):
+    """
+    Stream raw model output as it is decoded.
+
+    Args:
+        prompt (str): Full prompt text.
+        max_tokens (int): Maximum number of tokens to generate.
+        temperature (float): Sampling temperature.
+        stop (list): Stop sequences.
+        prefix (str): Leading part of the prompt whose evaluated state is cached.
+        cancel (threading.Event): Stops generation at the next token when set; inside an
+            inference job the job's stop signal (client gone, deadline) is used instead.
+        endpoint (str): Endpoint name, selects the model.
+        session (tuple): (user_id, language, code) of an autocomplete request, enables state reuse.
+        grammar (LlamaGrammar): Constrains decoding; not applied by the continuous batching scheduler.
+
+    Yields:
+        str: Text pieces in decoding order.
+    """
+    cancel = job_stop() or cancel
+    with MODEL_POOL.acquire(endpoint) as instance:
+        use_speculative = _speculative(instance, endpoint, grammar)
+        timer = _GenerationTimer(endpoint, instance, prompt, exact=not use_speculative, cancel=cancel)
+        if instance.batcher is not None:
+            try:
+                yield from timer.pieces(_batched(instance.batcher, prompt, max_tokens, temperature,
+                                                 stop or ["</s>", "###"], cancel))
+            finally:
+                timer.finish()
+            return
+
+        try:
+            if use_speculative:
+                yield from timer.pieces(speculative.generate(
+                    instance.llm,
+                    list(_tokens(instance.model.name, _prepare_prompt(instance, prompt, prefix, session))),
+                    max_tokens,
+                    temperature,
+                    stop or ["</s>", "###"],
+                    cancel,
+                    _speculative_stats[endpoint]
+                ))
+                return
+
+            chunks = instance.llm(
+                _prepare_prompt(instance, prompt, prefix, session),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=stop or ["</s>", "###"],
+                stopping_criteria=_stopping_criteria(cancel),
+                grammar=grammar,
+                stream=True
+            )
+            for text in timer.pieces(chunk["choices"][0]["text"] for chunk in chunks):
+                if text:
+                    yield text
+        finally:
+            timer.finish()
+            _save_session(instance, session)
+
+def _language_header(language: str) -> str:
+    return f"# Language: {language}\n"
+
 def generate_code(prompt: str, language: str = "python") -> str:
     """
     Generate a short code snippet based on a prompt.
@@ -63,57 +473,98 @@ def generate_code(prompt: str, language: str = "python") -> str:
     Returns:
         str: Generated code snippet.
     """
-    input_text = f"# Language: {language}\n# Task: {prompt}\n"
-    return generate_response(input_text, max_tokens=100)
+    header = _language_header(language)
+    input_text, max_tokens, _ = _fit("generate", lambda task: f"{header}# Task: {task}\n", prompt, 100)
+    return generate_response(input_text, max_tokens=max_tokens, temperature=TEMPERATURES["generate"], prefix=header,
+                             grammar=_grammar("generate", language))
+
+def stream_code(prompt: str, language: str = "python"):
+    """
+    Streaming variant of generate_code.
 
-def autocomplete_code(code: str, language: str = "python") -> str:
-    input_text = f"# Language: {language}\n{code}\n# CONTINUE:\n"
-    result = generate_response(input_text, max_tokens=40)
-    if "# CONTINUE:" in result:
-        return result.split("# CONTINUE:")[-1].strip()
-    return result.strip()
+    Yields:
+        str: Generated code pieces.
+    """
+    header = _language_header(language)
+    input_text, max_tokens, _ = _fit("generate", lambda task: f"{header}# Task: {task}\n", prompt, 100)
+    yield from _stream_postprocess(
+        "generate",
+        stream_response(input_text, max_tokens=max_tokens, temperature=TEMPERATURES["generate"], prefix=header,
+                        grammar=_grammar("generate", language)),
+        IncrementalCleaner(str.strip)
+    )
 
-def _clean_mentor_response(text: str) -> str:
+def autocomplete_code(code: str, language: str = "python", user_id: str | None = None,
+                      cancel: threading.Event | None = None) -> str:
     """
-    Clean mentor-style responses by removing unwanted patterns.
+    Suggest a continuation for the code being typed.
 
     Args:
-        text (str): Raw model output.
+        code (str): Code typed so far.
+        language (str): Programming language.
+        user_id (str): User identifier, enables reuse of the previous request's state.
+        cancel (threading.Event): Stops generation when a newer request supersedes this one.
 
     Returns:
-        str: Cleaned response text.
+        str: Suggested continuation.
     """
-    if not text:
-        return ""
-    result = text.strip()
-
-    for prefix in ("answer:", "explanation:", "response:"):
-        if result.lower().startswith(prefix):
-            result = result[len(prefix):].strip()
-
-    result = re.sub(r"\\begin\{code\}[\s\S]*?\\end\{code\}", "", result, flags=re.IGNORECASE)
-    result = re.sub(r"```[\s\S]*?```", "", result)
-
-    bad_patterns = [
-        r"edge_all_open_tabs\s*=\s*\[[\s\S]*?\]",
-        r"#\s*User.*browser.*tabs.*metadata.*",
-        r"\bdef\s+_load_model\b",
-        r"\bllama_cpp\b",
-        r"\bimport\s+os\b",
-        r"\btraceback\b",
-    ]
-    for pat in bad_patterns:
-        result = re.sub(pat, "", result, flags=re.IGNORECASE)
+    header = _language_header(language)
+    input_text, max_tokens, code = _fit(
+        "autocomplete", lambda c: f"{header}{c}\n# CONTINUE:\n", code, 40, tail_candidates(code)
+    )
+    result = generate_response(
+        input_text,
+        max_tokens=max_tokens,
+        temperature=TEMPERATURES["autocomplete"],
+        prefix=header,
+        cancel=cancel,
+        endpoint="autocomplete",
+        session=(user_id, language, code) if user_id is not None else None
+    )
+    return _postprocess("autocomplete", clean_autocomplete, result)
 
-    m = re.search(r"(Step\s*1|^\s*1\.)", result, flags=re.IGNORECASE | re.MULTILINE)
-    if m:
-        result = result[m.start():].strip()
+def stream_autocomplete(code: str, language: str = "python", user_id: str | None = None,
+                        cancel: threading.Event | None = None):
+    """
+    Streaming variant of autocomplete_code.
 
-    result = re.sub(r"\n{3,}", "\n\n", result).strip()
-    result = re.sub(r"[ \t]{2,}", " ", result)
-    result = re.sub(r"(?i)^limitation\s*:", "Limitation:", result)
+    Yields:
+        str: Suggestion pieces.
+    """
+    header = _language_header(language)
+    input_text, max_tokens, code = _fit(
+        "autocomplete", lambda c: f"{header}{c}\n# CONTINUE:\n", code, 40, tail_candidates(code)
+    )
+    yield from _stream_postprocess(
+        "autocomplete",
+        stream_response(
+            input_text,
+            max_tokens=max_tokens,
+            temperature=TEMPERATURES["autocomplete"],
+            prefix=header,
+            cancel=cancel,
+            endpoint="autocomplete",
+            session=(user_id, language, code) if user_id is not None else None
+        ),
+        AutocompleteFilter()
+    )
 
-    return result
+def _reply_instructions(language: str, user_level: str) -> str:
+    # Kept ahead of the code so its evaluated state can be reused across requests.
+    return (
+        f"Explain the {language} code below clearly to a {user_level} developer.\n\n"
+        "- Explain what the code does.\n"
+        "- Provide up to 3 numbered steps (Step 1:, Step 2:, Step 3:).\n"
+        "- End with ONE limitation (Limitation: ...).\n"
+        "- Describe only what appears in the code, do not invent structures.\n"
+        "- Suggest improvements or alternatives.\n"
+        "- Include validation or error handling if relevant.\n"
+        "- Do not use Markdown, headers, or comments.\n"
+        "- Do not repeat the code or the prompt.\n"
+       # "- Avoid repeating the same sentence.\n"
+        "- Keep the tone friendly and concise.\n\n"
+        "Code:\n"
+    )
 
 
 def generate_reply(prompt: str, language: str, code: str, user_id: str, user_level: str) -> str:
@@ -130,41 +581,71 @@ def generate_reply(prompt: str, language: str, code: str, user_id: str, user_lev
     Returns:
         str: Mentor-style explanation.
     """
-    input_text = (
-        f"Explain the following {language} code clearly to a {user_level} developer.\n\n"
-        f"{code}\n\n"
-        "- Explain what the code does.\n"
-        "- Provide up to 3 numbered steps (Step 1:, Step 2:, Step 3:).\n"
-        "- End with ONE limitation (Limitation: ...).\n"
-        "- Describe only what appears in the code, do not invent structures.\n"
-        "- Suggest improvements or alternatives.\n"
-        "- Include validation or error handling if relevant.\n"
-        "- Do not use Markdown, headers, or comments.\n"
-        "- Do not repeat the code or the prompt.\n"
-       # "- Avoid repeating the same sentence.\n"
-        "- Keep the tone friendly and concise.\n"
+    instructions = _reply_instructions(language, user_level)
+    input_text, max_tokens, _ = _fit(
+        "reply", lambda c: f"{instructions}{c}\n\nExplanation:\n", code, 400, shrink_candidates(code, language)
     )
 
     response = generate_response(
         input_text,
-        max_tokens=400,
-        temperature=0.3,
-        stop=["</s>", "###"]
+        max_tokens=max_tokens,
+        temperature=TEMPERATURES["reply"],
+        stop=["</s>", "###"],
+        prefix=instructions,
+        endpoint="reply"
     )
 
-    cleaned = _clean_mentor_response(response or "").strip()
+    cleaned = _postprocess("reply", clean_mentor_response, response or "").strip()
 
     if not cleaned:
-        cleaned = (
-            "Step 1: Describe the main idea of the algorithm.\n"
-            "Step 2: Explain how the data is processed step by step.\n"
-            "Step 3: Highlight how edge cases or special conditions are handled.\n\n"
-            "Limitation: May fail if inputs do not match the expected format."
-        )
+        cleaned = MENTOR_FALLBACK
 
     return cleaned
 
 
+def stream_reply(prompt: str, language: str, code: str, user_id: str, user_level: str):
+    """
+    Streaming variant of generate_reply.
+
+    Yields:
+        str: Mentor-style explanation pieces.
+    """
+    instructions = _reply_instructions(language, user_level)
+    input_text, max_tokens, _ = _fit(
+        "reply", lambda c: f"{instructions}{c}\n\nExplanation:\n", code, 400, shrink_candidates(code, language)
+    )
+    streamed = False
+    for piece in _stream_postprocess(
+        "reply",
+        stream_response(
+            input_text,
+            max_tokens=max_tokens,
+            temperature=TEMPERATURES["reply"],
+            stop=["</s>", "###"],
+            prefix=instructions,
+            endpoint="reply"
+        ),
+        MentorFilter()
+    ):
+        streamed = True
+        yield piece
+
+    if not streamed:
+        yield MENTOR_FALLBACK
+
+
+def _code_only_instructions(language: str) -> str:
+    # Kept ahead of the task and code so its evaluated state can be reused across requests.
+    return (
+        f"You are a code generator.\n"
+        f"# Language: {language}\n"
+        "# ONLY return valid code in the specified language.\n"
+        "# Use the function name exactly as given in the prompt.\n"
+        "# No explanations, no comments, no metadata.\n"
+        "# End strictly with '# END'.\n"
+    )
+
+
 def generate_reply_code_only(prompt: str, language: str, code: str, user_id: str) -> str:
     """
     Generate code-only response for a given prompt.
@@ -178,54 +659,49 @@ def generate_reply_code_only(prompt: str, language: str, code: str, user_id: str
     Returns:
         str: Generated code-only output.
     """
-    input_text = (
-        f"You are a code generator.\n"
-        f"# Language: {language}\n"
-        f"# Task: {prompt}\n"
-        f"# Existing code:\n{code}\n\n"
-        "# Output:\n"
-        "# ONLY return valid code in the specified language.\n"
-        "# Use the function name exactly as given in the prompt.\n"
-        "# No explanations, no comments, no metadata.\n"
-        "# End strictly with '# END'.\n"
+    instructions = _code_only_instructions(language)
+    input_text, max_tokens, _ = _fit(
+        "reply-code-only",
+        lambda c: f"{instructions}# Task: {prompt}\n# Existing code:\n{c}\n\n# Output:\n",
+        code,
+        400,
+        shrink_candidates(code, language)
     )
+    grammar = _grammar("reply-code-only", language)
 
     response = generate_response(
         input_text,
-        max_tokens=400,
-        temperature=0.2,
-        stop=["</s>", "###"]
+        max_tokens=max_tokens,
+        temperature=TEMPERATURES["reply-code-only"],
+        stop=["</s>", "###"],
+        prefix=instructions,
+        endpoint="reply-code-only",
+        grammar=grammar
     )
 
-    if not response.strip():
-        if language.lower() == "python":
-            response = "def placeholder():\n    pass\n# END"
-        elif language.lower() == "javascript":
-            response = "function placeholder() {}\n// END"
-
-    clean_lines = []
-    func_started = False
-    for line in response.splitlines():
-        if "BEGIN" in line or "END" in line:
-            continue
-        if line.strip().startswith("#") and not line.strip().startswith("#!"):
-            continue
-        if "edge_all_open_tabs" in line or "User" in line:
-            continue
-        if ("function " in line or line.strip().startswith("def ")) and func_started:
-            continue
-        if "function " in line or line.strip().startswith("def "):
-            func_started = True
-        clean_lines.append(line)
-
-    response = "\n".join(clean_lines).strip()
-
-    if language.lower() == "python":
-        response = response.rstrip() + "\n# END"
-    elif language.lower() in ["javascript", "java", "c++", "c"]:
-        if "}" in response:
-            response = response[:response.rfind("}")+1] + "\n// END"
-        else:
-            response += "\n// END"
+    line_filter = CodeLineFilter(language, drop_lines=grammar is None)
+    return _postprocess("reply-code-only", run_filter, line_filter, response)
 
-    return response
+
+def stream_reply_code_only(prompt: str, language: str, code: str, user_id: str):
+    """
+    Streaming variant of generate_reply_code_only.
+
+    Yields:
+        str: Code pieces, released line by line.
+    """
+    instructions = _code_only_instructions(language)
+    input_text, max_tokens, _ = _fit(
+        "reply-code-only",
+        lambda c: f"{instructions}# Task: {prompt}\n# Existing code:\n{c}\n\n# Output:\n",
+        code,
+        400,
+        shrink_candidates(code, language)
+    )
+    grammar = _grammar("reply-code-only", language)
+    yield from _stream_postprocess(
+        "reply-code-only",
+        stream_response(input_text, max_tokens=max_tokens, temperature=TEMPERATURES["reply-code-only"],
+                        stop=["</s>", "###"], prefix=instructions, endpoint="reply-code-only", grammar=grammar),
+        CodeLineFilter(language, drop_lines=grammar is None)
+    )
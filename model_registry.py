@@ -0,0 +1,481 @@
+import json
+import os
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
+
+from autotune import apply_profile
+from prefix_cache import PrefixCache
+
+# Endpoints that run a model; each one is routed to exactly one model.
+ENDPOINTS = ("generate", "autocomplete", "reply", "reply-code-only")
+
+# Endpoints that may be left unrouted, e.g. prompt embeddings for the semantic cache.
+OPTIONAL_ENDPOINTS = ("embed",)
+
+# Record of the models already downloaded to a local_dir, so restarts skip the hub.
+MANIFEST_NAME = "manifest.json"
+
+
+@dataclass
+class ModelSpec:
+    """
+    Settings of one model served by the pool.
+
+    Attributes:
+        name (str): Name used in routing, stats and logs.
+        repo_id (str): Hugging Face repository to download the model from.
+        filename (str): GGUF file in the repository.
+        path (str): Local GGUF file, used instead of downloading when set.
+        local_dir (str): Download directory.
+        endpoints (list): Endpoints served by this model; empty serves every unclaimed endpoint.
+        instances (int): Independent copies of the model. Weights are mmapped and shared.
+        n_threads (int): CPU threads per instance.
+        n_ctx (int): Context window per sequence.
+        n_batch (int): Prompt evaluation batch size.
+        batch_size (int): Sequences decoded together by continuous batching (1 disables it).
+        kv_bytes_per_token (int): KV cache size per context token, used for the memory estimate.
+        logits_all (bool): Keep the logits of every evaluated token (needed by speculative decoding).
+        use_mmap (bool): Map the weights instead of reading them into memory.
+        use_mlock (bool): Lock the weights in RAM so they are never paged out.
+        embedding (bool): Also compute embeddings, for a model serving "embed" (not with batch_size > 1).
+        pinned (frozenset): Settings given explicitly in MODEL_CONFIG, which tuned profiles leave alone.
+    """
+    name: str
+    repo_id: str | None = None
+    filename: str | None = None
+    path: str | None = None
+    local_dir: str | None = None
+    endpoints: list = field(default_factory=list)
+    instances: int = 1
+    n_threads: int = 4
+    n_ctx: int = 512
+    n_batch: int = 128
+    batch_size: int = 1
+    kv_bytes_per_token: int = 512 * 1024
+    logits_all: bool = False
+    use_mmap: bool = True
+    use_mlock: bool = False
+    embedding: bool = False
+    pinned: frozenset = field(default=frozenset(), init=False, repr=False)
+
+    @property
+    def model_id(self) -> str:
+        """
+        Identity of the model weights, used to keep cached responses of different models apart.
+        """
+        if self.repo_id:
+            return f"{self.repo_id}/{self.filename}"
+        return os.path.basename(self.path or "")
+
+    @property
+    def slots(self) -> int:
+        """
+        Number of requests the model can run at the same time.
+        """
+        return self.instances * self.batch_size
+
+    def context_bytes(self) -> int:
+        """
+        Estimated KV cache memory of all instances.
+        """
+        return self.instances * self.n_ctx * self.batch_size * self.kv_bytes_per_token
+
+
+class ModelInstance:
+    """
+    One loaded copy of a model.
+
+    Attributes:
+        model (ServedModel): Model this instance belongs to.
+        llm (Llama): llama.cpp model.
+        batcher (BatchScheduler): Continuous batching scheduler, or None.
+        active (int): Requests currently using the instance.
+    """
+
+    def __init__(self, model, llm, batcher=None):
+        self.model = model
+        self.llm = llm
+        self.batcher = batcher
+        self.active = 0
+        self.requests = 0
+
+
+class ServedModel:
+    """
+    All instances of one model spec, plus the caches they share.
+
+    KV states are portable between instances of the same model, so the
+    prompt-prefix and autocomplete session caches live here rather than on
+    each instance.
+
+    Args:
+        spec (ModelSpec): Model settings.
+        prefix_cache_bytes (int): Budget of the prompt-prefix cache (0 disables it).
+        session_cache_bytes (int): Budget of the autocomplete session cache (0 disables it).
+    """
+
+    def __init__(self, spec: ModelSpec, prefix_cache_bytes: int = 0, session_cache_bytes: int = 0):
+        self.spec = spec
+        self.name = spec.name
+        self.instances: list[ModelInstance] = []
+        self.prefix_cache = PrefixCache(prefix_cache_bytes) if prefix_cache_bytes > 0 else None
+        self.session_cache = PrefixCache(session_cache_bytes) if session_cache_bytes > 0 else None
+        self.session_inputs: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self._available = threading.Condition()
+
+    def cache_bytes(self) -> int:
+        """
+        Memory budget of the caches of this model.
+        """
+        return sum(c.capacity_bytes for c in (self.prefix_cache, self.session_cache) if c is not None)
+
+    @contextmanager
+    def acquire(self):
+        """
+        Borrow the least busy instance with a free slot, waiting for one if needed.
+
+        Yields:
+            ModelInstance: Instance reserved for the caller.
+        """
+        with self._available:
+            while True:
+                free = [i for i in self.instances if i.active < self.spec.batch_size]
+                if free:
+                    break
+                if not self.instances:
+                    raise RuntimeError(f"Model {self.name} is not loaded")
+                self._available.wait()
+            instance = min(free, key=lambda i: i.active)
+            instance.active += 1
+            instance.requests += 1
+        try:
+            yield instance
+        finally:
+            with self._available:
+                instance.active -= 1
+                self._available.notify()
+
+    def stats(self) -> dict:
+        """
+        Report instance usage and cache counters.
+
+        Returns:
+            dict: Model id, endpoints, busy slots, per-instance batch stats and cache stats.
+        """
+        return {
+            "model": self.spec.model_id,
+            "instances": len(self.instances),
+            "slots": self.spec.slots,
+            "active": sum(i.active for i in self.instances),
+            "requests": sum(i.requests for i in self.instances),
+            "batch": [i.batcher.stats() for i in self.instances if i.batcher is not None] or None,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None,
+            "autocomplete_sessions": self.session_cache.stats() if self.session_cache is not None else None,
+        }
+
+
+def load_config(path: str) -> tuple[list[ModelSpec], int]:
+    """
+    Read model specs from a JSON config file.
+
+    The file holds a "models" list, whose entries use the ModelSpec field
+    names, and an optional "memory_budget_mb".
+
+    Args:
+        path (str): Path of the config file.
+
+    Returns:
+        tuple[list[ModelSpec], int]: Model specs and memory budget in MB (0 means unlimited).
+
+    Raises:
+        ValueError: If the config is malformed.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    known = {f.name for f in fields(ModelSpec) if f.init}
+    specs = []
+    for entry in config.get("models", []):
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown model settings in {path}: {', '.join(sorted(unknown))}")
+        spec = ModelSpec(**entry)
+        spec.pinned = frozenset(entry)
+        specs.append(spec)
+    if not specs:
+        raise ValueError(f"No models defined in {path}")
+    return specs, int(config.get("memory_budget_mb", 0))
+
+
+class ModelPool:
+    """
+    Registry of the models served by the API, with routing by endpoint.
+
+    Each endpoint is served by one model, so a small quantized model can
+    answer autocomplete while a larger one writes explanations, each tuned
+    for its own latency target. A model may run several instances; requests
+    borrow the least busy one.
+
+    Args:
+        specs (list[ModelSpec]): Models to serve. A model without endpoints serves every unclaimed one.
+        memory_budget_mb (int): Upper bound for weights, KV caches and state caches (0 means unlimited).
+        prefix_cache_bytes (int): Prompt-prefix cache budget per model.
+        session_cache_bytes (int): Autocomplete session cache budget per model.
+
+    Raises:
+        ValueError: If names are duplicated, an endpoint is claimed twice or left unrouted.
+    """
+
+    def __init__(self, specs: list[ModelSpec], memory_budget_mb: int = 0,
+                 prefix_cache_bytes: int = 0, session_cache_bytes: int = 0):
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.models = OrderedDict()
+        for spec in specs:
+            if spec.name in self.models:
+                raise ValueError(f"Duplicate model name: {spec.name}")
+            if spec.instances < 1 or spec.batch_size < 1:
+                raise ValueError(f"Model {spec.name} needs at least one instance and batch slot")
+            self.models[spec.name] = ServedModel(spec, prefix_cache_bytes, session_cache_bytes)
+
+        self.routes = {}
+        for spec in specs:
+            for endpoint in spec.endpoints:
+                if endpoint not in ENDPOINTS + OPTIONAL_ENDPOINTS:
+                    raise ValueError(f"Unknown endpoint {endpoint} for model {spec.name}")
+                if endpoint in self.routes:
+                    raise ValueError(f"Endpoint {endpoint} is routed to both {self.routes[endpoint]} and {spec.name}")
+                self.routes[endpoint] = spec.name
+        fallback = next((spec.name for spec in specs if not spec.endpoints), None)
+        for endpoint in ENDPOINTS:
+            if endpoint not in self.routes:
+                if fallback is None:
+                    raise ValueError(f"No model serves endpoint {endpoint}")
+                self.routes[endpoint] = fallback
+        for endpoint in OPTIONAL_ENDPOINTS:
+            if endpoint not in self.routes and fallback is not None:
+                self.routes[endpoint] = fallback
+
+        self.memory_estimate = 0
+        self._load_lock = threading.Lock()
+        self._loaded = False
+
+    @classmethod
+    def from_env(cls, prefix_cache_bytes: int = 0, session_cache_bytes: int = 0) -> "ModelPool":
+        """
+        Build the pool from MODEL_CONFIG, or a single model from the HF_* variables.
+
+        Environment Variables:
+            MODEL_CONFIG (str): Path of a JSON model config.
+            MODEL_MEMORY_MB (int): Memory budget when the config does not set one.
+            HF_REPO_ID, HF_FILENAME, HF_LOCAL_DIR (str): Model of the single-model default.
+            LLAMA_BATCH_SIZE (int): Continuous batching size of the single-model default.
+
+        Returns:
+            ModelPool: Configured, not yet loaded pool.
+        """
+        budget = int(os.getenv("MODEL_MEMORY_MB", "0"))
+        config = os.getenv("MODEL_CONFIG")
+        if config:
+            specs, configured = load_config(config)
+            budget = configured or budget
+        else:
+            specs = [ModelSpec(
+                name="default",
+                repo_id=os.getenv("HF_REPO_ID"),
+                filename=os.getenv("HF_FILENAME"),
+                local_dir=os.getenv("HF_LOCAL_DIR"),
+                batch_size=int(os.getenv("LLAMA_BATCH_SIZE", "1"))
+            )]
+        return cls(specs, budget, prefix_cache_bytes, session_cache_bytes)
+
+    def route(self, endpoint: str) -> ServedModel:
+        """
+        Return the model serving an endpoint.
+
+        Args:
+            endpoint (str): Endpoint name, e.g. "autocomplete".
+
+        Returns:
+            ServedModel: Model routed to the endpoint.
+        """
+        return self.models[self.routes[endpoint]]
+
+    def slots(self) -> dict:
+        """
+        Concurrent request capacity per model name.
+        """
+        return {name: model.spec.slots for name, model in self.models.items()}
+
+    @contextmanager
+    def acquire(self, endpoint: str):
+        """
+        Borrow an instance of the model serving an endpoint.
+
+        Args:
+            endpoint (str): Endpoint name.
+
+        Yields:
+            ModelInstance: Instance reserved for the caller.
+        """
+        self.load()
+        with self.route(endpoint).acquire() as instance:
+            yield instance
+
+    def load(self):
+        """
+        Download and load every instance, checking the memory budget first.
+
+        Settings tuned for this host by autotune.py are applied first.
+
+        Raises:
+            RuntimeError: If the estimated memory use exceeds the budget.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            for model in self.models.values():
+                apply_profile(model.spec)
+
+            # Downloads (or manifest lookups) of different models run in parallel.
+            with ThreadPoolExecutor(max_workers=len(self.models)) as pool:
+                resolved = pool.map(_resolve, [model.spec for model in self.models.values()])
+                paths = dict(zip(self.models, resolved))
+
+            # Instances of the same file share the mmapped weights.
+            weights = sum(os.path.getsize(path) for path in set(paths.values()))
+            estimate = weights + sum(m.spec.context_bytes() + m.cache_bytes() for m in self.models.values())
+            if self.memory_budget and estimate > self.memory_budget:
+                raise RuntimeError(
+                    f"Model pool needs about {estimate // (1024 * 1024)} MB, "
+                    f"over the budget of {self.memory_budget // (1024 * 1024)} MB"
+                )
+            self.memory_estimate = estimate
+
+            # Instances are kept only once every model has loaded, so a failed load
+            # can be retried without stacking up copies of the models that succeeded.
+            loaded = {}
+            try:
+                for name, model in self.models.items():
+                    instances = loaded.setdefault(name, [])
+                    for _ in range(model.spec.instances):
+                        instances.append(_create(model, paths[name]))
+                    print(f"✅ Model {name} loaded ({model.spec.instances} instance(s), "
+                          f"endpoints: {', '.join(e for e, n in self.routes.items() if n == name)})")
+            except BaseException:
+                for instance in (i for instances in loaded.values() for i in instances):
+                    if instance.batcher is not None:
+                        instance.batcher.close()
+                raise
+            for name, instances in loaded.items():
+                self.models[name].instances = instances
+            self._loaded = True
+
+    def close(self):
+        """
+        Stop the batch schedulers of every instance.
+        """
+        for model in self.models.values():
+            for instance in model.instances:
+                if instance.batcher is not None:
+                    instance.batcher.close()
+
+    def stats(self) -> dict:
+        """
+        Report per-model usage and the memory estimate.
+
+        Returns:
+            dict: Memory estimate and budget in bytes, routes and per-model stats.
+        """
+        return {
+            "memory_estimate": self.memory_estimate,
+            "memory_budget": self.memory_budget,
+            "routes": dict(self.routes),
+            "models": {name: model.stats() for name, model in self.models.items()},
+        }
+
+
+_manifest_lock = threading.Lock()
+
+
+def read_manifest(local_dir: str) -> dict:
+    """
+    Read the models recorded as downloaded to a directory.
+
+    Args:
+        local_dir (str): Download directory.
+
+    Returns:
+        dict: Entries {"path", "size"} by model id ("repo_id/filename").
+    """
+    try:
+        with open(os.path.join(local_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_download(local_dir: str, model_id: str, path: str):
+    """
+    Add a downloaded model to the manifest of its directory.
+
+    Args:
+        local_dir (str): Download directory.
+        model_id (str): "repo_id/filename" of the model.
+        path (str): Local file.
+    """
+    with _manifest_lock:
+        manifest = read_manifest(local_dir)
+        manifest[model_id] = {"path": os.path.abspath(path), "size": os.path.getsize(path)}
+        target = os.path.join(local_dir, MANIFEST_NAME)
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(target + ".tmp", target)
+
+
+def _resolve(spec: ModelSpec) -> str:
+    if spec.path:
+        return spec.path
+
+    # A file recorded in the manifest with its full size needs no call to the hub.
+    local_dir = spec.local_dir or "."
+    entry = read_manifest(local_dir).get(spec.model_id)
+    if entry and os.path.isfile(entry["path"]) and os.path.getsize(entry["path"]) == entry["size"]:
+        print(f"📦 Using local model {entry['path']}")
+        return entry["path"]
+
+    from huggingface_hub import hf_hub_download
+
+    print(f"📥 Downloading model {spec.repo_id}/{spec.filename} to {local_dir}")
+    path = hf_hub_download(repo_id=spec.repo_id, filename=spec.filename, local_dir=spec.local_dir)
+    try:
+        record_download(local_dir, spec.model_id, path)
+    except OSError:
+        print("⚠️ Could not write the model manifest:", traceback.format_exc())
+    return path
+
+
+def _create(model: ServedModel, path: str) -> ModelInstance:
+    from llama_cpp import Llama
+    from batching import BatchScheduler
+
+    spec = model.spec
+    try:
+        if spec.batch_size > 1:
+            # Every sequence in the batch gets its own n_ctx slice of the KV cache.
+            llm = Llama(model_path=path, n_threads=spec.n_threads, n_ctx=spec.n_ctx * spec.batch_size,
+                        n_batch=spec.n_batch, use_mmap=spec.use_mmap, use_mlock=spec.use_mlock, verbose=False)
+            return ModelInstance(model, llm, BatchScheduler(llm, max_batch_size=spec.batch_size))
+        llm = Llama(model_path=path, n_threads=spec.n_threads, n_ctx=spec.n_ctx, n_batch=spec.n_batch,
+                    logits_all=spec.logits_all, embedding=spec.embedding, use_mmap=spec.use_mmap,
+                    use_mlock=spec.use_mlock, verbose=False)
+        return ModelInstance(model, llm)
+    except Exception:
+        print(f"❌ Error loading model {spec.name}:", traceback.format_exc())
+        raise
@@ -58,3 +58,13 @@ class CodeRequest(BaseModel):
     code: str
     user_id: str
     user_level: Literal["beginner", "intermediate", "advanced"] = "intermediate"
+
+
+class ClassifyBatch(BaseModel):
+    """
+    Model representing many texts to classify in one request.
+
+    Attributes:
+        texts (list[str]): The texts to classify, e.g. the messages of a chat log.
+    """
+    texts: list[str]
@@ -1,5 +1,6 @@
 import ast
 import difflib
+import re
 import textwrap
 
 def remove_duplicate_comments(code: str) -> str:
@@ -56,23 +57,6 @@ def is_syntax_valid(code: str) -> bool:
         return False
 
 
-def try_exec(code: str) -> bool:
-    """
-    Attempt to execute the given code in a controlled environment.
-
-    Args:
-        code (str): The code snippet to execute.
-
-    Returns:
-        bool: True if execution succeeds, False otherwise.
-    """
-    try:
-        exec(code, {}, {})
-        return True
-    except Exception:
-        return False
-
-
 def compare_versions(original: str, refactored: str) -> str:
     """
     Compare two versions of code and return a unified diff.
@@ -92,3 +76,365 @@ def compare_versions(original: str, refactored: str) -> str:
         lineterm=""
     )
     return "\n".join(diff)
+
+
+# Everything _clean_mentor_response-style cleanup removes, as one alternation:
+# code blocks first, then lines and identifiers that leak from training data.
+_MENTOR_REMOVALS = re.compile(
+    r"\\begin\{code\}[\s\S]*?\\end\{code\}"
+    r"|```[\s\S]*?```"
+    r"|edge_all_open_tabs\s*=\s*\[[\s\S]*?\]"
+    r"|#\s*User.*browser.*tabs.*metadata.*"
+    r"|\bdef\s+_load_model\b"
+    r"|\bllama_cpp\b"
+    r"|\bimport\s+os\b"
+    r"|\btraceback\b",
+    flags=re.IGNORECASE
+)
+
+# Blank-line runs and repeated spaces, normalized in one pass.
+_MENTOR_WHITESPACE = re.compile(r"(\n{3,})|[ \t]{2,}")
+
+STEP_MARKER = re.compile(r"(Step\s*1|^\s*1\.)", flags=re.IGNORECASE | re.MULTILINE)
+
+_LIMITATION = re.compile(r"^limitation\s*:", flags=re.IGNORECASE)
+
+_TRAILING_KEYWORD = re.compile(r"\b(import|def)\s*$", flags=re.IGNORECASE)
+
+_ANSWER_PREFIXES = ("answer:", "explanation:", "response:")
+
+MENTOR_FALLBACK = (
+    "Step 1: Describe the main idea of the algorithm.\n"
+    "Step 2: Explain how the data is processed step by step.\n"
+    "Step 3: Highlight how edge cases or special conditions are handled.\n\n"
+    "Limitation: May fail if inputs do not match the expected format."
+)
+
+# Characters of mentor output held back before streaming starts, waiting for a
+# "Step 1" marker that would make everything before it disappear.
+MENTOR_STREAM_HOLDBACK = 160
+
+
+def _collapse_whitespace(match) -> str:
+    return "\n\n" if match.group(1) else " "
+
+
+def clean_mentor_response(text: str, trim_to_steps: bool = True) -> str:
+    """
+    Clean mentor-style responses by removing unwanted patterns.
+
+    All removal rules run as a single precompiled regex pass, followed by
+    one whitespace normalization pass.
+
+    Args:
+        text (str): Raw model output.
+        trim_to_steps (bool): Drop everything before the first "Step 1" / "1." marker.
+
+    Returns:
+        str: Cleaned response text.
+    """
+    if not text:
+        return ""
+    result = text.strip()
+
+    for prefix in _ANSWER_PREFIXES:
+        if result.lower().startswith(prefix):
+            result = result[len(prefix):].strip()
+
+    result = _MENTOR_REMOVALS.sub("", result)
+
+    m = STEP_MARKER.search(result) if trim_to_steps else None
+    if m:
+        result = result[m.start():]
+
+    result = _MENTOR_WHITESPACE.sub(_collapse_whitespace, result.strip()).strip()
+    return _LIMITATION.sub("Limitation:", result)
+
+
+def clean_autocomplete(result: str) -> str:
+    """
+    Keep only the continuation after the last "# CONTINUE:" marker.
+
+    Args:
+        result (str): Raw model output.
+
+    Returns:
+        str: Suggested continuation.
+    """
+    if "# CONTINUE:" in result:
+        return result.split("# CONTINUE:")[-1].strip()
+    return result.strip()
+
+
+def mentor_safe_end(raw: str) -> int:
+    """
+    Return how much of a partial mentor response the cleanup can safely see.
+
+    Holds back the last two (possibly incomplete) words, plus a trailing
+    "import"/"def" whose second word is still hidden, then stops before an
+    unclosed code block or a partial comment line, since those can still turn
+    into text that clean_mentor_response removes.
+    """
+    end = len(raw)
+    for _ in range(2):
+        end = len(raw[:end].rstrip())
+        end = max(raw.rfind(" ", 0, end), raw.rfind("\n", 0, end), 0)
+    if _TRAILING_KEYWORD.search(raw, 0, end):
+        end = len(raw[:end].rstrip())
+        end = max(raw.rfind(" ", 0, end), raw.rfind("\n", 0, end), 0)
+
+    visible = raw[:end]
+    if visible.count("```") % 2:
+        end = visible.rfind("```")
+    for opening, closing in (("\\begin{code}", "\\end{code}"), ("edge_all_open_tabs", "]")):
+        start = visible.rfind(opening)
+        if start >= 0 and visible.find(closing, start + len(opening)) < 0:
+            end = min(end, start)
+    line_start = raw.rfind("\n", 0, end) + 1
+    if raw[line_start:end].lstrip().startswith("#"):
+        end = line_start
+    return end
+
+
+
+class IncrementalCleaner:
+    """
+    Apply a whole-text cleanup function incrementally to a token stream.
+
+    The cleanup is re-run over the part of the raw text that later chunks can
+    no longer change (as decided by safe_end), only when that part grew, and
+    only the new suffix of the cleaned text is returned, so the streamed text
+    matches what the cleanup returns for the full text.
+
+    Args:
+        clean (Callable): Cleanup applied to the full text.
+        safe_end (Callable): Returns how much of the raw text is final.
+    """
+
+    def __init__(self, clean, safe_end=len):
+        self.clean = clean
+        self.safe_end = safe_end
+        self.raw = ""
+        self._sent = ""
+        self._end = 0
+
+    def _release(self, cleaned: str) -> str:
+        if len(cleaned) > len(self._sent) and cleaned.startswith(self._sent):
+            out = cleaned[len(self._sent):]
+            self._sent = cleaned
+            return out
+        return ""
+
+    def feed(self, text: str) -> str:
+        """
+        Add raw model output.
+
+        Args:
+            text (str): Next piece of raw output.
+
+        Returns:
+            str: Cleaned text that is now final.
+        """
+        self.raw += text
+        end = self.safe_end(self.raw)
+        if end <= self._end:
+            return ""
+        self._end = end
+        return self._release(self.clean(self.raw[:end]))
+
+    def finish(self) -> str:
+        """
+        Clean the full text and return what has not been released yet.
+
+        Returns:
+            str: Remaining cleaned text.
+        """
+        return self._release(self.clean(self.raw))
+
+
+class MentorFilter(IncrementalCleaner):
+    """
+    Incremental clean_mentor_response for streamed explanations.
+
+    Output is held back until a "Step 1" marker appears or
+    MENTOR_STREAM_HOLDBACK characters have been generated; in the latter case
+    the text is released as-is instead of being trimmed to the first step.
+    """
+
+    def __init__(self):
+        super().__init__(self._clean, self._safe_end)
+        self.trim_to_steps = None
+        self._marker_end = 0
+
+    def _clean(self, text: str) -> str:
+        return clean_mentor_response(text, self.trim_to_steps is not False)
+
+    def _safe_end(self, raw: str) -> int:
+        if self.trim_to_steps is None:
+            m = STEP_MARKER.search(raw)
+            if m:
+                self.trim_to_steps = True
+                self._marker_end = m.end()
+            elif len(raw) >= MENTOR_STREAM_HOLDBACK:
+                self.trim_to_steps = False
+            else:
+                return 0
+        end = mentor_safe_end(raw)
+        return end if end >= self._marker_end else 0
+
+
+class AutocompleteFilter(IncrementalCleaner):
+    """
+    Incremental clean_autocomplete.
+
+    Text after a "#" is held back until the end, since a repeated
+    "# CONTINUE:" marker discards everything before it.
+    """
+
+    def __init__(self):
+        super().__init__(clean_autocomplete, lambda raw: raw.find("#") if "#" in raw else len(raw))
+
+
+class CodeLineFilter:
+    """
+    Line filter used to clean code-only responses.
+
+    Drops markers, comments, metadata lines and any function after the first,
+    then appends the language end marker. Output decoded under a
+    single-function grammar contains none of those, so line dropping is
+    turned off for it and only the end marker is added.
+
+    Text can be fed in arbitrary chunks: feed() returns the part of the
+    cleaned output that later chunks can no longer change, and finish()
+    returns the rest, so streamed and non-streamed responses are identical.
+
+    Args:
+        language (str): Programming language of the generated code.
+        drop_lines (bool): Apply the line filters.
+    """
+
+    BRACE_LANGUAGES = ("javascript", "java", "c++", "c")
+
+    # Markers, comments (but not shebangs) and leaked metadata, in one pattern.
+    DROP_LINE = re.compile(r"BEGIN|END|edge_all_open_tabs|User|^\s*#(?!!)")
+
+    FUNCTION_START = re.compile(r"function |^\s*def ")
+
+    END_MARKERS = {"python": "\n# END", **{language: "\n// END" for language in BRACE_LANGUAGES}}
+
+    PLACEHOLDERS = {
+        "python": "def placeholder():\n    pass\n# END",
+        "javascript": "function placeholder() {}\n// END",
+    }
+
+    def __init__(self, language: str, drop_lines: bool = True):
+        self.language = language.lower()
+        self.drop_lines = drop_lines
+        self._braces = self.language in self.BRACE_LANGUAGES
+        self._partial = ""
+        self._held = ""
+        self._raw_seen = False
+        self._lines = 0
+        self._func_started = False
+        self._emitted = False
+
+    def _keep(self, line: str) -> bool:
+        if not self.drop_lines:
+            return True
+        if self.DROP_LINE.search(line):
+            return False
+        if self.FUNCTION_START.search(line):
+            if self._func_started:
+                return False
+            self._func_started = True
+        return True
+
+    def _add_line(self, line: str):
+        if not self._keep(line):
+            return
+        if self._lines:
+            self._held += "\n"
+        self._held += line
+        self._lines += 1
+
+    def _release(self) -> str:
+        if not self._emitted:
+            self._held = self._held.lstrip()
+        if self._braces:
+            cut = self._held.rfind("}") + 1
+        else:
+            cut = len(self._held.rstrip())
+        out, self._held = self._held[:cut], self._held[cut:]
+        if out:
+            self._emitted = True
+        return out
+
+    def feed(self, text: str) -> str:
+        """
+        Add raw model output.
+
+        Args:
+            text (str): Next piece of raw output.
+
+        Returns:
+            str: Cleaned text that is now final.
+        """
+        if text.strip():
+            self._raw_seen = True
+        self._partial += text
+        *lines, self._partial = self._partial.split("\n")
+        for line in lines:
+            self._add_line(line)
+        return self._release()
+
+    def finish(self) -> str:
+        """
+        Flush the remaining text and append the end marker.
+
+        Returns:
+            str: Remaining cleaned text.
+        """
+        out = ""
+        if not self._raw_seen and self.language in self.PLACEHOLDERS:
+            out += self.feed(self.PLACEHOLDERS[self.language])
+        self._add_line(self._partial)
+        self._partial = ""
+        out += self._release()
+
+        if self._braces and not self._emitted:
+            out += self._held.rstrip()
+        return out + self.END_MARKERS.get(self.language, "")
+
+
+def run_filter(text_filter, text: str) -> str:
+    """
+    Run a streaming filter over a complete text.
+
+    Args:
+        text_filter: Object with feed() and finish(), e.g. CodeLineFilter.
+        text (str): Full raw output.
+
+    Returns:
+        str: Cleaned text, identical to the concatenated streamed output.
+    """
+    return text_filter.feed(text) + text_filter.finish()
+
+
+def stream_filter(chunks, text_filter):
+    """
+    Run a streaming filter over raw text pieces.
+
+    Args:
+        chunks (Iterable[str]): Raw text pieces.
+        text_filter: Object with feed() and finish().
+
+    Yields:
+        str: Cleaned text pieces.
+    """
+    for chunk in chunks:
+        out = text_filter.feed(chunk)
+        if out:
+            yield out
+    out = text_filter.finish()
+    if out:
+        yield out
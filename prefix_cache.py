@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+
+
+def _state_size(state) -> int:
+    return state.llama_state_size + state.scores.nbytes + state.input_ids.nbytes
+
+
+class PrefixCache:
+    """
+    LRU cache of evaluated prompt prefixes, bounded by memory.
+
+    Each entry is the llama state (KV cache included) captured right after
+    evaluating a fixed prompt prefix such as an instruction template. Restoring
+    it before generation lets llama.cpp match the cached tokens against the
+    full prompt and evaluate only the variable suffix.
+
+    Only the last row of the logits matrix is kept per entry; the full
+    n_ctx x n_vocab matrix would dominate memory and earlier rows are never
+    read again once generation continues from the prefix. The cache may be
+    shared by several instances of the same model running in different threads.
+
+    Args:
+        capacity_bytes (int): Maximum total size of cached states.
+    """
+
+    def __init__(self, capacity_bytes: int):
+        self.capacity_bytes = capacity_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def restore(self, llm, key) -> bool:
+        """
+        Load the cached state for key into the model.
+
+        Args:
+            llm (Llama): Model to restore into.
+            key (Hashable): Cache key, e.g. the rendered prefix text.
+
+        Returns:
+            bool: True on a hit, False if the prefix has to be evaluated.
+        """
+        with self._lock:
+            state = self._entries.get(key)
+            if state is None:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # load_state replaces the full-size logits matrix with the stored row;
+        # put the row back into the existing matrix instead.
+        scores = llm.scores
+        llm.load_state(state)
+        scores[state.n_tokens - 1] = state.scores[0]
+        llm.scores = scores
+        return True
+
+    def save(self, llm, key):
+        """
+        Capture the model state as the cached state for key.
+
+        Args:
+            llm (Llama): Model that has just evaluated the prefix.
+            key (Hashable): Cache key.
+        """
+        state = llm.save_state()
+        state.scores = state.scores[state.n_tokens - 1:state.n_tokens].copy()
+        size = _state_size(state)
+        if size > self.capacity_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= _state_size(self._entries.pop(key))
+            self._entries[key] = state
+            self._size += size
+
+            while self._size > self.capacity_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= _state_size(evicted)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Report cache occupancy and hit counters.
+
+        Returns:
+            dict: Entries, bytes used, capacity, hits, misses and evictions.
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "capacity_bytes": self.capacity_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
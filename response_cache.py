@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+import pymongo
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonicalize free text: collapse whitespace runs and trim the ends.
+
+    Args:
+        text (str): Prompt or other natural-language input.
+
+    Returns:
+        str: Normalized text.
+    """
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def normalize_code(code: str) -> str:
+    """
+    Canonicalize code without touching indentation.
+
+    Line endings are unified, trailing whitespace is removed from every line
+    and leading/trailing blank lines are dropped.
+
+    Args:
+        code (str): Code snippet.
+
+    Returns:
+        str: Normalized code.
+    """
+    lines = (code or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def cache_key(endpoint: str, model: str, temperature: float, **fields) -> str:
+    """
+    Build a content-addressed key for a generation request.
+
+    Args:
+        endpoint (str): Endpoint name, e.g. "reply".
+        model (str): Identity of the model serving the endpoint.
+        temperature (float): Sampling temperature used for the endpoint.
+        **fields: Request fields that affect the output (already normalized).
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    payload = json.dumps(
+        {"endpoint": endpoint, "model": model, "temperature": temperature, **fields},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier exact cache for generated responses.
+
+    The first tier is an in-process LRU with a TTL. The second tier is a
+    MongoDB collection shared by every uvicorn worker and replica; hits from
+    it are copied into the local tier. MongoDB calls run in a worker thread
+    so they never block the event loop, and any database error degrades to a
+    cache miss.
+
+    Each MongoDB call, server selection included, is bounded by db_timeout,
+    so an unreachable database delays a request by that much at most. After
+    a failure the shared tier is skipped for db_retry_after seconds.
+
+    Args:
+        max_entries (int): Capacity of the in-process tier (0 disables it).
+        ttl (int): Entry lifetime in seconds.
+        collection (Callable): Returns the MongoDB collection for the shared tier, or None.
+        db_timeout (float): Time allowed per MongoDB call, in seconds.
+        db_retry_after (float): Seconds the shared tier is skipped after a failure.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: int = 86400,
+                 collection: Callable | None = None, db_timeout: float = 0.2,
+                 db_retry_after: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_timeout = db_timeout
+        self.db_retry_after = db_retry_after
+        self._collection = collection
+        self._entries: OrderedDict = OrderedDict()
+        self._indexed = False
+        self._db_retry_at = 0.0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.db_errors = 0
+        self.db_skipped = 0
+
+    async def get(self, key: str) -> str | None:
+        """
+        Look up a cached response.
+
+        Args:
+            key (str): Key from cache_key.
+
+        Returns:
+            str | None: Cached response, or None on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            del self._entries[key]
+
+        value = await self._db_get(key)
+        if value is not None:
+            self.db_hits += 1
+            self._remember(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, endpoint: str = ""):
+        """
+        Store a response in both tiers.
+
+        Args:
+            key (str): Key from cache_key.
+            value (str): Response to cache.
+            endpoint (str): Endpoint name, stored for inspection.
+        """
+        self._remember(key, value)
+        await self._db_set(key, value, endpoint)
+
+    def bypass(self):
+        """
+        Count a request that skipped the cache on purpose.
+        """
+        self.bypassed += 1
+
+    def _remember(self, key: str, value: str):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_open(self) -> bool:
+        # Circuit breaker: after a failure, the shared tier rests until _db_retry_at.
+        if self._collection is None:
+            return False
+        if time.monotonic() < self._db_retry_at:
+            self.db_skipped += 1
+            return False
+        return True
+
+    def _db_failed(self, action: str):
+        self.db_errors += 1
+        self._db_retry_at = time.monotonic() + self.db_retry_after
+        print(f"⚠️ Error {action} response cache, skipping MongoDB for {self.db_retry_after:g}s:",
+              traceback.format_exc())
+
+    def _db(self):
+        if self._collection is None:
+            return None
+        try:
+            collection = self._collection()
+        except RuntimeError:
+            # Database not connected (e.g. local runs without MongoDB).
+            return None
+        if not self._indexed:
+            collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    async def _db_get(self, key: str) -> str | None:
+        def find():
+            with pymongo.timeout(self.db_timeout):
+                collection = self._db()
+                if collection is None:
+                    return None
+                doc = collection.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+                return doc["value"] if doc else None
+
+        if not self._db_open():
+            return None
+        try:
+            return await asyncio.to_thread(find)
+        except Exception:
+            self._db_failed("reading")
+            return None
+
+    async def _db_set(self, key: str, value: str, endpoint: str):
+        def store():
+            with pymongo.timeout(self.db_timeout):
+                collection = self._db()
+                if collection is None:
+                    return
+                now = datetime.now(timezone.utc)
+                collection.replace_one(
+                    {"_id": key},
+                    {
+                        "_id": key,
+                        "value": value,
+                        "endpoint": endpoint,
+                        "created_at": now,
+                        "expires_at": now + timedelta(seconds=self.ttl),
+                    },
+                    upsert=True
+                )
+
+        if not self._db_open():
+            return
+        try:
+            await asyncio.to_thread(store)
+        except Exception:
+            self._db_failed("writing")
+
+    def stats(self) -> dict:
+        """
+        Report hit/miss counters.
+
+        Returns:
+            dict: Entries, hits per tier, misses, bypasses, database errors
+            and lookups or writes that skipped the database after an error.
+        """
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "db_errors": self.db_errors,
+            "db_skipped": self.db_skipped,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+        }
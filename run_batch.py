@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from batch import BatchItem, parse_records, run_batch
+from ml_engine import MODEL_POOL, _load_model
+from inference import InferenceExecutor, RemoteExecutor, PRIORITY_BATCH
+
+
+def _results(output_path: str):
+    # Results already in an output file, skipping lines cut short by an interrupted run.
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def completed_ids(output_path: str) -> set:
+    """
+    Read the ids already answered in an output file, for resuming a run.
+
+    Results with an error are not counted, so their records run again.
+
+    Args:
+        output_path (str): NDJSON output of an earlier run.
+
+    Returns:
+        set: JSON-encoded ids of completed records.
+    """
+    return {json.dumps(result.get("id")) for result in _results(output_path) if "error" not in result}
+
+
+def reported_errors(output_path: str) -> set:
+    """
+    Read the error results already in an output file.
+
+    A resumed run writes the errors of invalid records only once.
+
+    Args:
+        output_path (str): NDJSON output of an earlier run.
+
+    Returns:
+        set: JSON-encoded error results.
+    """
+    return {json.dumps(result) for result in _results(output_path) if "error" in result}
+
+
+async def main(input_path: str, output_path: str, concurrency: int, resume: bool):
+    """
+    Run a JSONL batch file and append NDJSON results to the output file.
+
+    The output file is the checkpoint: every result is flushed as soon as it
+    completes, and a resumed run skips records whose id already has a result
+    and invalid records whose error is already written.
+    With INFERENCE_SOCKET set the jobs go to the shared inference server at
+    batch priority; otherwise the models are loaded in this process.
+
+    Args:
+        input_path (str): JSONL file of CodePrompt/CodeRequest records.
+        output_path (str): NDJSON results file.
+        concurrency (int): Items in flight at once.
+        resume (bool): Skip records completed by an earlier run.
+    """
+    with open(input_path, encoding="utf-8") as f:
+        items, errors = parse_records(f)
+    done = completed_ids(output_path) if resume else set()
+    items = [item for item in items if json.dumps(item.id) not in done]
+    if resume:
+        reported = reported_errors(output_path)
+        errors = [error for error in errors if json.dumps(error) not in reported]
+    print(f"📄 {len(items)} records to run, {len(done)} already done, {len(errors)} newly invalid")
+
+    socket_path = os.getenv("INFERENCE_SOCKET")
+    if socket_path:
+        remote = RemoteExecutor(socket_path)
+        executors = {name: remote for name in MODEL_POOL.models}
+    else:
+        await asyncio.to_thread(_load_model)
+        executors = {name: InferenceExecutor(workers=slots) for name, slots in MODEL_POOL.slots().items()}
+    for executor in set(executors.values()):
+        await executor.start()
+
+    async def submit(item: BatchItem) -> str:
+        op = item.operation
+        executor = executors[MODEL_POOL.route(item.endpoint).name]
+        return await executor.submit(op.fn, *op.args(item.data), priority=PRIORITY_BATCH)
+
+    start = time.time()
+    completed = 0
+    try:
+        with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+            for error in errors:
+                out.write(json.dumps(error) + "\n")
+            async for result in run_batch(items, submit, concurrency):
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                completed += 1
+                if completed % 10 == 0 or completed == len(items):
+                    print(f"⏳ {completed}/{len(items)} done ({completed / (time.time() - start):.2f} records/s)")
+    finally:
+        for executor in set(executors.values()):
+            await executor.stop()
+        MODEL_POOL.close()
+    print(f"✅ Batch finished in {time.time() - start:.1f}s, results in {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a JSONL file of generation requests offline.")
+    parser.add_argument("input", help="JSONL file of CodePrompt/CodeRequest records")
+    parser.add_argument("output", help="NDJSON results file, also used as the resume checkpoint")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "2")))
+    parser.add_argument("--no-resume", action="store_true", help="Start over instead of skipping completed records")
+    args = parser.parse_args()
+    asyncio.run(main(args.input, args.output, args.concurrency, not args.no_resume))
@@ -1,17 +1,26 @@
 import os
 from llama_cpp import Llama
 
+from autotune import apply_profile
+from model_registry import ModelSpec
+
 # Load model path from environment variable
 MODEL_PATH = os.getenv("MODEL_PATH")
 if not MODEL_PATH:
     raise RuntimeError("MODEL_PATH is not set in environment variables")
 
+# Same defaults as the API, replaced by the profile autotune.py saved for this host
+spec = ModelSpec(name="run_model", path=MODEL_PATH, n_ctx=1024)
+apply_profile(spec)
+
 # Initialize the model
 llm = Llama(
     model_path=MODEL_PATH,
-    n_ctx=1024,       # context size
-    n_threads=8,      # adjust to the number of CPU cores
-    n_batch=256,      # moderate batch size for speed
+    n_ctx=spec.n_ctx,
+    n_threads=spec.n_threads,
+    n_batch=spec.n_batch,
+    use_mmap=spec.use_mmap,
+    use_mlock=spec.use_mlock,
     verbose=False     # suppress unnecessary logs
 )
 
@@ -0,0 +1,378 @@
+import ast
+import asyncio
+import builtins
+import functools
+import math
+import multiprocessing
+import resource
+import signal
+import symtable
+import threading
+import time
+from dataclasses import dataclass
+
+from postprocess import CodeLineFilter
+
+# Languages whose snippets are analyzed in a worker; the others only get a syntax check.
+ANALYZED_LANGUAGES = ("python",)
+
+# Names every module can read without defining them.
+_PREDEFINED = frozenset(dir(builtins)) | {"__name__", "__file__", "__doc__", "__builtins__", "__spec__",
+                                           "__loader__", "__package__", "__annotations__"}
+
+# Scopes whose bodies run as soon as they are reached, unlike functions and lambdas.
+_COMPREHENSIONS = ("listcomp", "setcomp", "dictcomp")
+
+
+@dataclass
+class ValidationResult:
+    """
+    Outcome of validating one generated snippet.
+
+    Attributes:
+        valid (bool): Whether the snippet passed every check that ran.
+        stage (str): Last check that ran: "syntax" or "names".
+        error (str): Reason the snippet was rejected, if any.
+    """
+    valid: bool
+    stage: str
+    error: str | None = None
+
+
+def strip_end_marker(code: str, language: str) -> str:
+    """
+    Remove the end marker appended to code-only responses.
+
+    Args:
+        code (str): Cleaned code-only response.
+        language (str): Programming language of the code.
+
+    Returns:
+        str: Code without the trailing marker.
+    """
+    marker = CodeLineFilter.END_MARKERS.get(language.lower(), "").strip()
+    code = code.rstrip()
+    if marker and code.endswith(marker):
+        code = code[:-len(marker)].rstrip()
+    return code
+
+
+def _unbalanced_brackets(code: str) -> str | None:
+    # Bracket matching for brace languages, skipping string literals and comments.
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack = []
+    i = 0
+    while i < len(code):
+        c = code[i]
+        if code.startswith("//", i):
+            i = code.find("\n", i)
+            if i < 0:
+                break
+        elif code.startswith("/*", i):
+            i = code.find("*/", i + 2)
+            if i < 0:
+                return "Unterminated block comment"
+            i += 1
+        elif c in "\"'`":
+            j = i + 1
+            while j < len(code) and code[j] != c:
+                j += 2 if code[j] == "\\" else 1
+            if j >= len(code):
+                return f"Unterminated string starting at offset {i}"
+            i = j
+        elif c in "([{":
+            stack.append(c)
+        elif c in pairs:
+            if not stack or stack.pop() != pairs[c]:
+                return f"Unexpected '{c}' at offset {i}"
+        i += 1
+    if stack:
+        return f"Unclosed '{stack[-1]}'"
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def check_syntax(code: str, language: str) -> str | None:
+    """
+    Check a snippet's syntax, with results cached per (code, language).
+
+    Python is compiled; brace languages get a bracket-balance check; other
+    languages are not checked.
+
+    Args:
+        code (str): Code snippet without end marker.
+        language (str): Programming language of the code.
+
+    Returns:
+        str | None: Error message, or None if no error was found.
+    """
+    language = language.lower()
+    if language == "python":
+        try:
+            compile(code, "<generated>", "exec")
+        except (SyntaxError, ValueError) as e:
+            return f"{type(e).__name__}: {e}"
+        return None
+    if language in CodeLineFilter.BRACE_LANGUAGES:
+        return _unbalanced_brackets(code)
+    return None
+
+
+def undefined_names(code: str) -> str | None:
+    """
+    Find names a Python snippet reads while its module runs but never defines.
+
+    The snippet is compiled, never executed. Only code that would run when
+    the module is executed is checked: top-level statements, class bodies,
+    decorators, default values and comprehensions there. Function bodies are
+    not, since they may call helpers from the user's own code. A name is
+    defined when the module assigns or imports it, a function assigns it
+    after declaring it global, or it is a builtin. Snippets with star
+    imports are not checked.
+
+    Args:
+        code (str): Python code without end marker.
+
+    Returns:
+        str | None: Error message naming the first undefined names, or None.
+    """
+    tree = ast.parse(code, "<generated>")
+    if any(isinstance(node, ast.ImportFrom) and any(a.name == "*" for a in node.names) for node in ast.walk(tree)):
+        return None
+    module = symtable.symtable(code, "<generated>", "exec")
+    defined = set(_PREDEFINED)
+    referenced = set()
+    # (table, whether its body runs while the module is executed)
+    tables = [(module, True)]
+    while tables:
+        table, runs = tables.pop()
+        for symbol in table.get_symbols():
+            name = symbol.get_name()
+            if symbol.is_assigned() or symbol.is_imported():
+                if table is module or symbol.is_declared_global():
+                    defined.add(name)
+            elif runs and symbol.is_referenced() and symbol.is_global():
+                referenced.add(name)
+        for child in table.get_children():
+            eager = child.get_type() == "class" or child.get_name() in _COMPREHENSIONS
+            tables.append((child, runs and eager))
+    undefined = sorted(referenced - defined)
+    if undefined:
+        return f"NameError: name {', '.join(repr(n) for n in undefined[:3])} is not defined"
+    return None
+
+
+def _isolate(memory_mb: int):
+    # Runs once in each worker, before it accepts any snippet.
+    if memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _worker_main(conn, cpu_seconds: int, memory_mb: int):
+    """
+    Sandbox worker loop: analyze snippets received on conn and send back the error, or None.
+
+    Generated code is only compiled, never executed, so it cannot reach the
+    network, processes or files. The worker still bounds what compiling
+    hostile input may cost: the CPU limit is re-armed before every snippet;
+    exceeding it kills the process (SIGXCPU), and the pool starts a replacement.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _isolate(memory_mb)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    while True:
+        try:
+            code = conn.recv()
+        except (EOFError, OSError):
+            return
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        limit = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+        try:
+            error = undefined_names(code)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        conn.send(error)
+
+
+class _Worker:
+    """
+    One pre-forked sandbox process and its pipe.
+    """
+
+    def __init__(self, context, cpu_seconds: int, memory_mb: int):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child, cpu_seconds, memory_mb), daemon=True, name="sandbox-worker"
+        )
+        self.process.start()
+        child.close()
+        self.jobs = 0
+
+    def run(self, code: str, timeout: float) -> tuple[str | None, bool]:
+        """
+        Analyze a snippet in the worker.
+
+        Returns:
+            tuple[str | None, bool]: Error message (None on success), and
+            whether the worker died or was killed and must be replaced.
+        """
+        self.jobs += 1
+        try:
+            self.conn.send(code)
+            if not self.conn.poll(timeout):
+                self.kill()
+                return f"TimeoutError: analysis exceeded {timeout:g}s", True
+            return self.conn.recv(), False
+        except (EOFError, OSError):
+            self.process.join(1)
+            code = self.process.exitcode
+            if code == -signal.SIGXCPU:
+                return "ResourceError: CPU time limit exceeded", True
+            return f"ResourceError: sandbox worker exited ({code})", True
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(1)
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pool of pre-forked, resource-limited processes that validate generated code.
+
+    Generated code follows user prompts, so it is never executed: workers
+    compile it and look for names it uses without defining them. They are
+    forked from a forkserver that has already imported this module, so a
+    validation never pays interpreter startup. Each worker handles one
+    snippet at a time under a CPU-time and an address-space limit; a snippet
+    that exceeds the wall-clock timeout or a resource limit gets its worker
+    killed and replaced, so it cannot stall the pool. Workers are also
+    replaced after max_jobs snippets.
+
+    Args:
+        workers (int): Number of worker processes (snippets validated in parallel).
+        cpu_seconds (int): CPU time allowed per snippet.
+        memory_mb (int): Address-space limit of each worker in MB (0 disables it).
+        timeout (float): Wall-clock time allowed per snippet, in seconds.
+        max_jobs (int): Snippets a worker runs before it is replaced.
+    """
+
+    def __init__(self, workers: int = 2, cpu_seconds: int = 2, memory_mb: int = 256,
+                 timeout: float = 5.0, max_jobs: int = 100):
+        self.workers = workers
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self._context = multiprocessing.get_context("forkserver")
+        self._context.set_forkserver_preload([__name__])
+        self._idle: asyncio.Queue | None = None
+        self._all: list[_Worker] = []
+        self._lock = threading.Lock()
+        self.validated = 0
+        self.invalid = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.analysis_seconds = 0.0
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context, self.cpu_seconds, self.memory_mb)
+        with self._lock:
+            self._all.append(worker)
+        return worker
+
+    def _retire(self, worker: _Worker):
+        worker.kill()
+        with self._lock:
+            if worker in self._all:
+                self._all.remove(worker)
+
+    async def start(self):
+        """
+        Fork the worker processes.
+        """
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(asyncio.to_thread(self._spawn) for _ in range(self.workers)))
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        print(f"✅ Sandbox pool started with {self.workers} workers")
+
+    async def stop(self):
+        """
+        Kill every worker process.
+        """
+        with self._lock:
+            workers = list(self._all)
+        for worker in workers:
+            await asyncio.to_thread(self._retire, worker)
+        self._idle = None
+
+    def _analyze(self, worker: _Worker, code: str) -> tuple[str | None, _Worker]:
+        # Runs on a helper thread; returns the error and the worker to put back.
+        start = time.perf_counter()
+        error, dead = worker.run(code, self.timeout)
+        with self._lock:
+            self.analysis_seconds += time.perf_counter() - start
+            if error is not None and error.startswith("TimeoutError"):
+                self.timeouts += 1
+        if dead or worker.jobs >= self.max_jobs:
+            self._retire(worker)
+            with self._lock:
+                self.restarts += 1
+            worker = self._spawn()
+        return error, worker
+
+    async def validate(self, code: str, language: str) -> ValidationResult:
+        """
+        Check a generated snippet's syntax and, for Python, its undefined names in a worker.
+
+        Args:
+            code (str): Code-only response, optionally ending with its end marker.
+            language (str): Programming language of the code.
+
+        Returns:
+            ValidationResult: Outcome of the checks.
+        """
+        if self._idle is None:
+            raise RuntimeError("Sandbox pool is not started")
+        code = strip_end_marker(code, language)
+        result = ValidationResult(True, "syntax", check_syntax(code, language))
+        if result.error is None and language.lower() in ANALYZED_LANGUAGES:
+            worker = await self._idle.get()
+            replacement = worker
+            try:
+                result.error, replacement = await asyncio.to_thread(self._analyze, worker, code)
+            finally:
+                self._idle.put_nowait(replacement)
+            result.stage = "names"
+        result.valid = result.error is None
+
+        with self._lock:
+            self.validated += 1
+            self.invalid += not result.valid
+        return result
+
+    def stats(self) -> dict:
+        """
+        Report validation counters.
+
+        Returns:
+            dict: Validated and invalid snippets, timeouts, worker restarts,
+            idle workers and the syntax cache hit rate.
+        """
+        cache = check_syntax.cache_info()
+        lookups = cache.hits + cache.misses
+        return {
+            "workers": self.workers,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "validated": self.validated,
+            "invalid": self.invalid,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "analysis_seconds": round(self.analysis_seconds, 3),
+            "syntax_cache_hit_rate": round(cache.hits / lookups, 4) if lookups else 0.0,
+        }
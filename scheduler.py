@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+from typing import Any
+
+
+class UserQueueFull(asyncio.QueueFull):
+    """
+    Raised when one user already has the most jobs allowed waiting.
+    """
+
+
+class FairQueue:
+    """
+    Job queue with strict priority classes and weighted fair queuing across users.
+
+    A job of a lower priority value always runs before any job of a higher
+    one. Within a class, users take turns in proportion to their weights
+    (start-time fair queuing): every job gets a virtual finish tag of
+    max(class virtual time, the user's previous tag) + 1 / weight, and the
+    smallest tag runs next. A user who submits a hundred jobs at once
+    therefore waits behind their own jobs, not in front of everyone else's.
+
+    Jobs can be discarded while waiting (expired deadline, client gone);
+    they stay in the heap until popped but stop counting immediately.
+
+    Args:
+        maxsize (int): Jobs waiting at most, across all users.
+        max_per_user (int): Jobs waiting at most for one user (0 for no limit).
+        weights (dict): Weight by user id; unlisted users weigh default_weight.
+        default_weight (float): Weight of unlisted users.
+    """
+
+    def __init__(self, maxsize: int, max_per_user: int = 0, weights: dict | None = None,
+                 default_weight: float = 1.0):
+        self.maxsize = maxsize
+        self.max_per_user = max_per_user
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self._heaps: dict[int, list] = {}
+        self._vtime: dict[int, float] = {}
+        self._finish: dict[tuple, float] = {}
+        self._waiting: Counter = Counter()
+        self._users: Counter = Counter()
+        self._entries: dict[int, tuple] = {}
+        self._order = itertools.count()
+        self._size = 0
+        self._nonempty = asyncio.Event()
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def ahead(self, priority: int) -> int:
+        """
+        Count the waiting jobs that run before a new job of this priority.
+
+        Args:
+            priority (int): Priority class of the new job.
+
+        Returns:
+            int: Jobs waiting in this class or a more urgent one.
+        """
+        return sum(count for p, count in self._waiting.items() if p <= priority)
+
+    def put_nowait(self, job: Any, priority: int, user: str | None = None):
+        """
+        Queue a job.
+
+        Args:
+            job: Queued object; its id() identifies it for discard().
+            priority (int): Priority class, lower runs first.
+            user (str | None): Owner of the job for fair sharing.
+
+        Raises:
+            asyncio.QueueFull: If maxsize jobs are already waiting.
+            UserQueueFull: If the user already has max_per_user jobs waiting.
+        """
+        if self._size >= self.maxsize:
+            raise asyncio.QueueFull
+        if self.max_per_user and self._users[user] >= self.max_per_user:
+            raise UserQueueFull
+
+        key = (priority, user)
+        tag = max(self._vtime.get(priority, 0.0), self._finish.get(key, 0.0))
+        tag += 1.0 / self.weights.get(user, self.default_weight)
+        self._finish[key] = tag
+        seq = next(self._order)
+        heapq.heappush(self._heaps.setdefault(priority, []), (tag, seq, job))
+        self._entries[id(job)] = key
+        self._waiting[priority] += 1
+        self._users[user] += 1
+        self._size += 1
+        self._nonempty.set()
+
+    def discard(self, job: Any) -> bool:
+        """
+        Stop counting a waiting job; it is skipped when it reaches the front.
+
+        Returns:
+            bool: False if the job was not waiting.
+        """
+        key = self._entries.pop(id(job), None)
+        if key is None:
+            return False
+        self._release(key)
+        return True
+
+    def _release(self, key: tuple):
+        priority, user = key
+        self._waiting[priority] -= 1
+        self._users[user] -= 1
+        if not self._users[user]:
+            del self._users[user]
+        self._size -= 1
+        if not any(u == user for p, u in self._entries.values() if p == priority):
+            # The user's next job starts from the class's current virtual time.
+            self._finish.pop(key, None)
+
+    async def get(self) -> Any:
+        """
+        Wait for and remove the next job.
+
+        Returns:
+            Any: The most urgent class's job with the smallest finish tag.
+        """
+        while True:
+            while not self._size:
+                self._nonempty.clear()
+                await self._nonempty.wait()
+            for priority in sorted(self._heaps):
+                heap = self._heaps[priority]
+                while heap:
+                    tag, _, job = heapq.heappop(heap)
+                    key = self._entries.pop(id(job), None)
+                    if key is None:
+                        continue  # discarded while waiting
+                    self._vtime[priority] = tag
+                    self._release(key)
+                    return job
+
+    def get_nowait(self) -> Any:
+        """
+        Remove every waiting job's entry and return one, for draining on shutdown.
+
+        Raises:
+            asyncio.QueueEmpty: If no job is waiting.
+        """
+        for heap in self._heaps.values():
+            while heap:
+                _, _, job = heapq.heappop(heap)
+                key = self._entries.pop(id(job), None)
+                if key is not None:
+                    self._release(key)
+                    return job
+        raise asyncio.QueueEmpty
+
+    def stats(self) -> dict:
+        """
+        Report waiting jobs by priority class and the number of waiting users.
+        """
+        return {
+            "waiting_by_priority": {str(p): n for p, n in sorted(self._waiting.items()) if n},
+            "waiting_users": len(self._users),
+        }
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+def _partition_id(partition: str) -> int:
+    return int.from_bytes(hashlib.sha256(partition.encode("utf-8")).digest()[:8], "little", signed=True)
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of responses, keyed by prompt embeddings.
+
+    Embeddings are normalized and kept as rows of one float32 matrix, so a
+    lookup is a single matrix-vector product: the most similar row of the
+    same partition is a hit if its cosine similarity reaches the threshold.
+    Partitions keep apart requests that must never share an answer, e.g.
+    different endpoints, models or languages. When full, the oldest row is
+    overwritten.
+
+    With a path, the matrix is a memory-mapped .npy file and the responses
+    are saved next to it by save(), so the cache survives restarts.
+
+    Args:
+        capacity (int): Rows at most.
+        threshold (float): Cosine similarity a hit needs, in [-1, 1].
+        ttl (int): Entry lifetime in seconds.
+        path (str): .npy file to keep the matrix in, or None for memory only.
+    """
+
+    def __init__(self, capacity: int = 10000, threshold: float = 0.95, ttl: int = 86400,
+                 path: str | None = None):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.path = path
+        self._matrix: np.ndarray | None = None
+        self._partitions = np.zeros(capacity, dtype=np.int64)
+        self._expires = np.zeros(capacity, dtype=np.float64)
+        self._values: list = [None] * capacity
+        self._texts: list = [None] * capacity
+        self._next = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._similarity_sum = 0.0
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._expires > time.time()))
+
+    def get(self, partition: str, embedding) -> tuple[str, float, str] | None:
+        """
+        Find the cached response of the most similar prompt.
+
+        Args:
+            partition (str): Partition of the request.
+            embedding (Sequence[float]): Embedding of the request's prompt.
+
+        Returns:
+            tuple | None: Response, similarity and the matched prompt, or None on a miss.
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None or query.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+            similarity = self._matrix @ query
+            usable = (self._partitions == _partition_id(partition)) & (self._expires > time.time())
+            similarity[~usable] = -np.inf
+            best = int(np.argmax(similarity))
+            if similarity[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._similarity_sum += float(similarity[best])
+            return self._values[best], float(similarity[best]), self._texts[best]
+
+    def add(self, partition: str, embedding, value: str, text: str = ""):
+        """
+        Cache a response under the embedding of its prompt.
+
+        Args:
+            partition (str): Partition of the request.
+            embedding (Sequence[float]): Embedding of the request's prompt.
+            value (str): Response to cache.
+            text (str): The prompt, kept to audit hits.
+        """
+        if self.capacity <= 0:
+            return
+        row = self._normalize(embedding)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = self._allocate(row.shape[0])
+            if row.shape[0] != self._matrix.shape[1]:
+                # A different embedding model; these rows cannot be compared.
+                self.errors += 1
+                return
+            slot = self._next % self.capacity
+            self._matrix[slot] = row
+            self._partitions[slot] = _partition_id(partition)
+            self._expires[slot] = time.time() + self.ttl
+            self._values[slot] = value
+            self._texts[slot] = text
+            self._next += 1
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _allocate(self, dim: int) -> np.ndarray:
+        if self.path:
+            return np.lib.format.open_memmap(self.path, mode="w+", dtype=np.float32, shape=(self.capacity, dim))
+        return np.zeros((self.capacity, dim), dtype=np.float32)
+
+    def _meta_path(self) -> str:
+        return self.path + ".json"
+
+    def _load(self):
+        try:
+            matrix = np.lib.format.open_memmap(self.path, mode="r+")
+            with open(self._meta_path(), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            print(f"⚠️ Ignoring unreadable semantic cache {self.path}")
+            return
+        if matrix.dtype != np.float32 or matrix.shape[0] != self.capacity:
+            print(f"⚠️ Semantic cache {self.path} has another shape; starting empty")
+            return
+        self._matrix = matrix
+        self._next = meta["next"]
+        for slot, entry in enumerate(meta["entries"][:self.capacity]):
+            if entry is not None:
+                self._partitions[slot], self._expires[slot], self._values[slot], self._texts[slot] = entry
+        print(f"📦 Semantic cache loaded from {self.path} ({len(self)} entries)")
+
+    def save(self):
+        """
+        Flush the memory-mapped matrix and write the responses next to it.
+        """
+        if not self.path or self._matrix is None:
+            return
+        with self._lock:
+            self._matrix.flush()
+            entries = [
+                [int(self._partitions[slot]), float(self._expires[slot]), self._values[slot], self._texts[slot]]
+                if self._values[slot] is not None else None
+                for slot in range(self.capacity)
+            ]
+            with open(self._meta_path() + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"next": self._next, "entries": entries}, f, ensure_ascii=False)
+            os.replace(self._meta_path() + ".tmp", self._meta_path())
+
+    def stats(self) -> dict:
+        """
+        Report entries, hit/miss counters and the mean similarity of hits.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "mean_hit_similarity": round(self._similarity_sum / self.hits, 4) if self.hits else None,
+        }
+
+
+def evaluate(pairs: list[dict], embed, thresholds: list[float]) -> list[dict]:
+    """
+    Measure how often a threshold would serve a wrong or miss a right answer.
+
+    Args:
+        pairs (list[dict]): Labeled prompt pairs {"a", "b", "same"}; "same"
+            is true when one answer serves both prompts.
+        embed (Callable): Maps a text to its embedding.
+        thresholds (list[float]): Similarity thresholds to evaluate.
+
+    Returns:
+        list[dict]: Per threshold, the false-positive rate (different pairs
+        that would hit), the hit rate of same pairs, and their counts.
+    """
+    similarities = np.array([
+        float(SemanticCache._normalize(embed(pair["a"])) @ SemanticCache._normalize(embed(pair["b"])))
+        for pair in pairs
+    ])
+    same = np.array([bool(pair["same"]) for pair in pairs])
+    results = []
+    for threshold in thresholds:
+        hit = similarities >= threshold
+        results.append({
+            "threshold": threshold,
+            "false_positive_rate": round(float(hit[~same].mean()), 4) if (~same).any() else 0.0,
+            "hit_rate": round(float(hit[same].mean()), 4) if same.any() else 0.0,
+            "false_positives": int(np.count_nonzero(hit & ~same)),
+            "different_pairs": int(np.count_nonzero(~same)),
+            "same_pairs": int(np.count_nonzero(same)),
+        })
+    return results
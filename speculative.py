@@ -0,0 +1,216 @@
+import codecs
+import threading
+import time
+
+import numpy as np
+
+from batching import _candidates
+
+
+def find_draft(tokens: list, ngram: int = 3, max_draft: int = 8) -> list:
+    """
+    Propose the next tokens by prompt lookup.
+
+    Finds the most recent earlier occurrence of the last n tokens (longest n
+    first) and returns the tokens that followed it. Edit-style outputs copy
+    long spans of the prompt, so these drafts are often accepted whole.
+
+    Args:
+        tokens (list): Prompt and generated tokens so far.
+        ngram (int): Longest suffix length to match.
+        max_draft (int): Maximum number of drafted tokens.
+
+    Returns:
+        list: Drafted tokens, possibly empty.
+    """
+    for n in range(min(ngram, len(tokens) - 1), 0, -1):
+        pattern = tokens[-n:]
+        for start in range(len(tokens) - n - 1, -1, -1):
+            if tokens[start:start + n] == pattern:
+                return tokens[start + n:start + n + max_draft]
+    return []
+
+
+def verify(rows: np.ndarray, draft: list, temperature: float, rng: np.random.Generator) -> tuple[int, int]:
+    """
+    Check drafted tokens against the model's distributions.
+
+    Drafts are deterministic, so speculative sampling reduces to accepting
+    each drafted token with its probability under the model and, on the
+    first rejection, sampling from the remaining probability mass. The
+    output has the same distribution as sampling token by token.
+
+    Args:
+        rows (np.ndarray): len(draft) + 1 logit rows; row i predicts draft[i].
+        draft (list): Drafted tokens.
+        temperature (float): Sampling temperature, 0 for greedy decoding.
+        rng (np.random.Generator): Random generator.
+
+    Returns:
+        tuple[int, int]: Number of accepted drafted tokens, and the token that follows them.
+    """
+    for i, token in enumerate(draft):
+        if temperature <= 0:
+            best = int(np.argmax(rows[i]))
+            if best != token:
+                return i, best
+            continue
+
+        candidates, probs = _candidates(rows[i], temperature)
+        match = np.flatnonzero(candidates == token)
+        p = float(probs[match[0]]) if len(match) else 0.0
+        if rng.random() < p:
+            continue
+        if len(match):
+            probs = probs.copy()
+            probs[match[0]] = 0.0
+            probs /= probs.sum()
+        return i, int(candidates[rng.choice(len(candidates), p=probs)])
+
+    last = rows[len(draft)]
+    if temperature <= 0:
+        return len(draft), int(np.argmax(last))
+    candidates, probs = _candidates(last, temperature)
+    return len(draft), int(candidates[rng.choice(len(candidates), p=probs)])
+
+
+class SpeculativeStats:
+    """
+    Acceptance and throughput counters of one endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.drafted = 0
+        self.accepted = 0
+        self.tokens = 0
+        self.forward_passes = 0
+        self.seconds = 0.0
+
+    def record(self, drafted: int, accepted: int, tokens: int, forward_passes: int, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self.drafted += drafted
+            self.accepted += accepted
+            self.tokens += tokens
+            self.forward_passes += forward_passes
+            self.seconds += seconds
+
+    def as_dict(self) -> dict:
+        """
+        Report the counters.
+
+        Returns:
+            dict: Drafted/accepted tokens, acceptance rate, tokens per forward
+            pass (the speedup over one token per pass) and tokens per second.
+        """
+        return {
+            "requests": self.requests,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance_rate": round(self.accepted / self.drafted, 4) if self.drafted else 0.0,
+            "tokens": self.tokens,
+            "speedup": round(self.tokens / self.forward_passes, 2) if self.forward_passes else 0.0,
+            "tokens_per_sec": round(self.tokens / self.seconds, 2) if self.seconds else 0.0,
+        }
+
+
+def generate(llm, tokens: list, max_tokens: int, temperature: float, stop=None,
+             cancel: threading.Event | None = None, stats: SpeculativeStats | None = None,
+             ngram: int = 3, max_draft: int = 8, seed: int | None = None):
+    """
+    Generate with prompt-lookup speculative decoding.
+
+    Each step evaluates the last sampled token together with a draft looked
+    up in the prompt and generated text, in a single forward pass, then keeps
+    the accepted prefix of the draft. The model must be created with
+    logits_all=True so every drafted position gets its logits.
+
+    Args:
+        llm (Llama): Model, possibly holding the state of a prompt prefix.
+        tokens (list): Prompt tokens.
+        max_tokens (int): Maximum number of tokens to generate.
+        temperature (float): Sampling temperature.
+        stop (list): Stop sequences.
+        cancel (threading.Event): Stops generation at the next step when set.
+        stats (SpeculativeStats): Counters to update.
+        ngram (int): Longest suffix matched by the lookup.
+        max_draft (int): Maximum drafted tokens per step.
+        seed (int): Seed for token sampling.
+
+    Yields:
+        str: Text pieces in decoding order.
+    """
+    stop = list(stop or [])
+    rng = np.random.default_rng(seed)
+    eos = llm.token_eos()
+    n_ctx = llm.n_ctx()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    start = time.perf_counter()
+    drafted = accepted = generated = passes = 0
+    text = ""
+    sent = 0
+
+    # Reuse whatever prefix of the prompt the model already holds, but always
+    # evaluate the last prompt token to get fresh logits.
+    matched = 0
+    limit = min(llm.n_tokens, len(tokens) - 1)
+    while matched < limit and llm.input_ids[matched] == tokens[matched]:
+        matched += 1
+    llm.n_tokens = matched
+    history = list(tokens)
+    pending = tokens[matched:]
+
+    try:
+        while generated < max_tokens:
+            if cancel is not None and cancel.is_set():
+                return
+            room = min(max_tokens - generated - 1, n_ctx - llm.n_tokens - len(pending) - 1, max_draft)
+            draft = find_draft(history, ngram, room) if room > 0 else []
+
+            base = llm.n_tokens + len(pending) - 1
+            llm.eval(pending + draft)
+            passes += 1
+            n_accepted, token = verify(llm.scores[base:base + len(draft) + 1], draft, temperature, rng)
+            drafted += len(draft)
+            accepted += n_accepted
+
+            # Drop the rejected part of the draft from the KV cache bookkeeping.
+            llm.n_tokens = base + 1 + n_accepted
+            new_tokens = draft[:n_accepted] + [token]
+            history.extend(new_tokens)
+            pending = [token]
+
+            finished = False
+            for t in new_tokens:
+                generated += 1
+                if t == eos:
+                    finished = True
+                    break
+                text += decoder.decode(llm.detokenize([t]))
+                if generated >= max_tokens:
+                    finished = True
+                    break
+
+            end = len(text)
+            for s in stop:
+                at = text.find(s, max(sent - len(s), 0))
+                if at >= 0:
+                    end = min(end, at)
+                    finished = True
+            if not finished:
+                # Hold back text that could still become the start of a stop sequence.
+                for s in stop:
+                    for k in range(min(len(s) - 1, end - sent), 0, -1):
+                        if text.endswith(s[:k]):
+                            end = min(end, len(text) - k)
+                            break
+            if end > sent:
+                yield text[sent:end]
+                sent = end
+            if finished or llm.n_tokens + 1 >= n_ctx:
+                return
+    finally:
+        if stats is not None:
+            stats.record(drafted, accepted, generated, passes, time.perf_counter() - start)
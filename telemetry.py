@@ -0,0 +1,182 @@
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable
+
+
+class TelemetryWriter:
+    """
+    Buffered background writer of request records to MongoDB.
+
+    record() only appends to an in-memory buffer, so it never blocks a
+    request on the database. A worker thread writes the buffer with
+    insert_many whenever batch_size records are waiting or flush_interval
+    seconds have passed. When the buffer is full, new records are dropped and
+    counted; when a write fails, its batch is dropped and counted, so a slow
+    or unreachable database costs data, never latency.
+
+    Args:
+        collection (Callable): Returns the MongoDB collection to write to
+            (raises RuntimeError while the database is not connected).
+        capacity (int): Records held in memory at most.
+        batch_size (int): Records per insert_many, and the size that triggers a flush.
+        flush_interval (float): Seconds between time-based flushes.
+    """
+
+    def __init__(self, collection: Callable, capacity: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 5.0):
+        self._collection = collection
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: deque = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.last_flush_seconds = 0.0
+
+    def record(self, **fields) -> bool:
+        """
+        Queue one record, stamped with the current time.
+
+        Args:
+            **fields: Document fields.
+
+        Returns:
+            bool: False if the buffer was full and the record was dropped.
+        """
+        fields.setdefault("timestamp", datetime.now(timezone.utc))
+        with self._lock:
+            if len(self._buffer) >= self.capacity:
+                self.dropped += 1
+                return False
+            self._buffer.append(fields)
+            self.recorded += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+        return True
+
+    def start(self):
+        """
+        Start the flush thread.
+        """
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stop the flush thread and write every buffered record.
+        """
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write the buffered records in batches of batch_size.
+
+        Returns:
+            int: Records written.
+        """
+        written = 0
+        with self._flush_lock:
+            start = time.perf_counter()
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    break
+                try:
+                    self._collection().insert_many(batch, ordered=False)
+                except Exception:
+                    with self._lock:
+                        self.write_errors += 1
+                        self.dropped += len(batch)
+                    print("Error writing telemetry:", traceback.format_exc())
+                    break
+                written += len(batch)
+                with self._lock:
+                    self.written += len(batch)
+            self.last_flush_seconds = time.perf_counter() - start
+        return written
+
+    def stats(self) -> dict:
+        """
+        Report buffer and write counters.
+
+        Returns:
+            dict: Buffered, recorded, written and dropped records, and write errors.
+        """
+        with self._lock:
+            return {
+                "buffered": len(self._buffer),
+                "capacity": self.capacity,
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "write_errors": self.write_errors,
+                "last_flush_seconds": round(self.last_flush_seconds, 4),
+            }
+
+
+class UsageRecorder:
+    """
+    ASGI middleware recording one telemetry record per authenticated request.
+
+    The endpoint's auth dependency stores the user id in request.state;
+    requests without one (health checks, rejected tokens) are not recorded.
+
+    Args:
+        app: ASGI application to wrap.
+        writer (TelemetryWriter): Destination of the records.
+    """
+
+    def __init__(self, app, writer: TelemetryWriter):
+        self.app = app
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = scope.setdefault("state", {})
+        status = 500
+        start = time.perf_counter()
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            if state.get("user_id") is not None:
+                self.writer.record(
+                    user_id=state["user_id"],
+                    endpoint=scope["path"],
+                    status=status,
+                    duration=time.perf_counter() - start,
+                )
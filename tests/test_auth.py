@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from google.auth import crypt, jwt
+
+os.environ.setdefault("TEST_MODE", "true")  # no Firebase credentials here
+import auth  # noqa: E402
+
+PROJECT = "demo-project"
+
+
+@pytest.fixture(scope="module")
+def key():
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return crypt.RSASigner.from_string(private_pem, key_id="local"), public_pem
+
+
+def _token(signer, **overrides) -> str:
+    now = int(time.time())
+    claims = {"iss": auth.FIREBASE_ISSUER + PROJECT, "aud": PROJECT, "sub": "user-1",
+              "iat": now, "exp": now + 3600, **overrides}
+    return jwt.encode(signer, claims).decode("utf-8")
+
+
+class _Request:
+    def __init__(self):
+        self.url = type("URL", (), {"path": "/reply"})()
+        self.state = type("State", (), {})()
+
+
+@pytest.fixture
+def local_verifier(key):
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return {"local": key[1]}, 3600
+
+    verifier = auth.FirebaseVerifier(PROJECT, auth.CertificateStore(fetch))
+    calls = []
+
+    def counting(token):
+        calls.append(token)
+        return verifier(token)
+
+    auth.set_verifier(counting)
+    yield calls, fetches
+    auth.set_verifier(None)
+
+
+def test_verified_tokens_are_cached(key, local_verifier):
+    """The second request with the same token skips verification."""
+    calls, fetches = local_verifier
+    token = _token(key[0])
+    for _ in range(2):
+        request = _Request()
+        user = asyncio.run(auth.verify_token(request, f"Bearer {token}"))
+        assert user["uid"] == "user-1"
+        assert request.state.user_id == "user-1"
+    assert len(calls) == 1
+    assert len(fetches) == 1
+
+
+def test_invalid_tokens_are_rejected(key, local_verifier):
+    """Wrong audience, expired tokens and malformed headers get a 401."""
+    for header in (f"Bearer {_token(key[0], aud='other')}",
+                   f"Bearer {_token(key[0], iat=int(time.time()) - 7200, exp=int(time.time()) - 3600)}",
+                   "Basic abc"):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(auth.verify_token(_Request(), header))
+        assert error.value.status_code == 401
+
+
+def test_cache_entries_expire_and_are_bounded():
+    """Entries end at the token's exp, and the least recently used is evicted."""
+    cache = auth.TokenCache(max_entries=2)
+    cache.put("expired", {"uid": "a", "exp": time.time() - 1})
+    assert cache.get("expired") is None
+    for token in ("t1", "t2", "t3"):
+        cache.put(token, {"uid": token, "exp": time.time() + 60})
+    assert cache.get("t1") is None
+    assert cache.get("t3")["uid"] == "t3"
+    assert cache.stats()["entries"] == 2
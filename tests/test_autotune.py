@@ -0,0 +1,42 @@
+import json
+
+import autotune
+from benchmarks.fake_model import FakeLlama
+from model_registry import ModelSpec, load_config
+
+
+def test_sweep_ranks_settings_by_speed():
+    """
+    Test that the sweep measures every combination and puts the fastest first.
+    """
+    def create(n_threads, n_batch, use_mmap, use_mlock):
+        # More threads decode faster on this pretend host.
+        return FakeLlama(token_latency=0.004 / n_threads)
+
+    results = autotune.sweep(create, ["def f(x):\n    return x\n"], threads=[1, 4], batches=[64],
+                             mmap_options=[True], mlock_options=[False], max_tokens=8)
+    assert len(results) == 2
+    assert results[0]["n_threads"] == 4
+    assert results[0]["decode_tps"] > results[1]["decode_tps"]
+
+
+def test_profiles_apply_except_pinned_settings(tmp_path):
+    """
+    Test that a saved profile is found for this CPU and skips settings set in the config.
+    """
+    profiles = str(tmp_path / "profiles.json")
+    autotune.save_profile("org/repo/model.gguf", {"n_threads": 6, "n_batch": 512, "use_mlock": True}, profiles)
+    assert autotune.cpu_key() in autotune.load_profiles(profiles)
+
+    config = tmp_path / "models.json"
+    config.write_text(json.dumps({"models": [
+        {"name": "default", "repo_id": "org/repo", "filename": "model.gguf", "n_batch": 64}
+    ]}))
+    spec = load_config(str(config))[0][0]
+    applied = autotune.apply_profile(spec, profiles)
+    assert applied == {"n_threads": 6, "use_mlock": True}
+    assert (spec.n_threads, spec.n_batch, spec.use_mlock) == (6, 64, True)
+
+    other = ModelSpec(name="other", path="other.gguf")
+    assert autotune.apply_profile(other, profiles) is None
+    assert other.n_threads == 4
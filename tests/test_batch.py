@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from batch import parse_records, run_batch, schedule
+from inference import QueueFullError
+from run_batch import completed_ids, reported_errors
+
+
+def test_parse_and_schedule_groups_by_prefix_then_length():
+    """
+    Test record parsing, error reporting and the throughput order.
+    """
+    lines = [
+        json.dumps({"id": "a", "endpoint": "reply", "prompt": "p", "language": "python", "code": "x = 1" * 20,
+                    "user_id": "u"}),
+        json.dumps({"prompt": "long javascript task", "language": "javascript"}),
+        "",
+        json.dumps({"id": "b", "prompt": "p", "language": "python", "code": "y", "user_id": "u"}),
+        "not json",
+        json.dumps({"endpoint": "translate", "prompt": "p"}),
+        json.dumps({"prompt": "js", "language": "javascript"}),
+    ]
+    items, errors = parse_records(lines, user_id="me")
+
+    assert [e["id"] for e in errors] == [5, 6]
+    assert [(i.id, i.endpoint) for i in schedule(items)] == [(7, "generate"), (2, "generate"), ("b", "reply"), ("a", "reply")]
+    assert {i.data.user_id for i in items if i.endpoint == "reply"} == {"me"}
+
+
+def test_run_batch_limits_concurrency_and_retries_full_queue(tmp_path):
+    """
+    Test that at most `concurrency` items run at once and rejected items are retried.
+    """
+    items, _ = parse_records(json.dumps({"id": n, "prompt": f"task {n}"}) for n in range(6))
+    running = []
+    peak = []
+    rejected = set()
+
+    async def submit(item):
+        if item.id == 3 and item.id not in rejected:
+            rejected.add(item.id)
+            raise QueueFullError("full")
+        running.append(item.id)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(item.id)
+        return f"code {item.id}"
+
+    async def main():
+        return [r async for r in run_batch(items, submit, concurrency=2, retry_delay=0.01)]
+
+    results = asyncio.run(main())
+    assert sorted(r["id"] for r in results) == list(range(6))
+    assert all(r["code"] == f"code {r['id']}" for r in results)
+    assert max(peak) == 2
+
+    output = tmp_path / "out.jsonl"
+    output.write_text("\n".join(json.dumps(r) for r in results[:4]) + '\n{"id": 9, "error": "x"}\n{"id": 5, "co')
+    assert completed_ids(str(output)) == {json.dumps(r["id"]) for r in results[:4]}
+    assert reported_errors(str(output)) == {json.dumps({"id": 9, "error": "x"})}
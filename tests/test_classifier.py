@@ -0,0 +1,37 @@
+from classifier import classify_batch, classify_text
+
+
+def test_words_match_on_boundaries_only():
+    """
+    Test that lexicon words inside other words are not counted.
+    """
+    assert classify_text("the badge is on the sadistic goodwill page") == ("neutral", 0.0)
+    assert classify_text("This is BAD.") == ("negative", -1.0)
+    assert classify_text("it's 'good'") == ("positive", 1.0)
+
+
+def test_negation_flips_nearby_words_in_the_clause():
+    """
+    Test that negated words count with the opposite sign until the clause ends.
+    """
+    assert classify_text("this is not good") == ("negative", -1.0)
+    assert classify_text("it wasn't that bad") == ("positive", 1.0)
+    assert classify_text("not bad. awful") == ("negative", -1.0)
+    assert classify_text("no, this is great") == ("positive", 1.0)
+
+
+def test_strong_words_outweigh_mild_ones():
+    """
+    Test that the score is the sum of the word weights.
+    """
+    assert classify_text("good start but a terrible ending") == ("negative", -1.0)
+    assert classify_text("sad but wonderful") == ("positive", 1.0)
+
+
+def test_batch_matches_per_text_results():
+    """
+    Test that batch scoring gives each text its own result, in order.
+    """
+    texts = ["great", "", "not happy", "meh", "awful, not good", "fatal\x1enot", "excellent"]
+    assert classify_batch(texts) == [classify_text(t) for t in texts]
+    assert classify_batch([]) == []
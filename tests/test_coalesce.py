@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from coalesce import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_run():
+    """
+    Test that callers with the same key get one result from one call.
+    """
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.05)
+        return value * 2
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            *(flight.run("same", lambda: work(21)) for _ in range(5)),
+            flight.run("other", lambda: work(1)),
+        )
+        return results, flight.stats()
+
+    results, stats = asyncio.run(main())
+    assert [r for r, _ in results] == [42] * 5 + [2]
+    assert [leader for _, leader in results] == [True, False, False, False, False, True]
+    assert calls == [21, 1]
+    assert stats == {"in_flight": 0, "leaders": 2, "followers": 4}
+
+
+def test_errors_reach_every_caller():
+    """
+    Test that a failing shared call raises in every waiting caller.
+    """
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.run("k", fail) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
+
+
+def test_late_subscribers_replay_the_stream():
+    """
+    Test that a stream joined midway yields every item from the first.
+    """
+    opened = []
+
+    async def source():
+        for piece in ("a", "b", "c"):
+            await asyncio.sleep(0.02)
+            yield piece
+
+    async def open_stream():
+        opened.append(1)
+        return source()
+
+    async def collect(flight, delay):
+        await asyncio.sleep(delay)
+        chunks, leader = await flight.stream("k", open_stream)
+        return "".join([c async for c in chunks]), leader
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(collect(flight, 0), collect(flight, 0.03))
+
+    assert asyncio.run(main()) == [("abc", True), ("abc", False)]
+    assert len(opened) == 1
+
+
+def test_stream_stops_when_every_subscriber_leaves():
+    """
+    Test that the shared source is closed once nobody reads it.
+    """
+    async def main():
+        done = asyncio.Event()
+
+        async def source():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield "x"
+            finally:
+                done.set()
+
+        async def open_stream():
+            return source()
+
+        flight = SingleFlight()
+        chunks, _ = await flight.stream("k", open_stream)
+        async for _ in chunks:
+            break
+        await chunks.aclose()
+        await asyncio.wait_for(done.wait(), 1)
+        await asyncio.sleep(0)
+        return flight.stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+
+
+def test_open_errors_are_raised_to_the_opener():
+    """
+    Test that a failure to open (e.g. a full queue) is not swallowed.
+    """
+    async def open_stream():
+        raise RuntimeError("queue full")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(SingleFlight().stream("k", open_stream))
@@ -0,0 +1,78 @@
+import pytest
+
+from context_budget import ContextOverflowError, fit_prompt, outline_code, shrink_candidates, tail_candidates
+
+
+PYTHON_CODE = '''import math
+
+@cache
+def area(radius,
+         scale=1):
+    """Area of a circle."""
+    value = math.pi * radius ** 2
+    return value * scale
+
+class Shape:
+    def perimeter(self):
+        total = 0
+        for side in self.sides:
+            total += side
+        return total
+'''
+
+
+def test_python_outline_keeps_signatures_and_docstrings():
+    """
+    Test that Python bodies are replaced while decorators, signatures and docstrings stay.
+    """
+    outline = outline_code(PYTHON_CODE, "python")
+
+    assert "@cache\ndef area(radius,\n         scale=1):\n    \"\"\"Area of a circle.\"\"\"\n    ...\n" in outline
+    assert "class Shape:\n    def perimeter(self):\n        ...\n" in outline
+    assert "math.pi" not in outline and "total" not in outline
+
+
+def test_outline_without_parse_or_in_brace_languages():
+    """
+    Test the indentation fallback for partial Python and the brace heuristic for JavaScript.
+    """
+    partial = "def f(x):\n    y = x + 1\n    return (y\nz = 1"
+    assert outline_code(partial, "python").startswith("def f(x):\n    ...\n")
+
+    js = "class A {\n  run(x) {\n    return x + 1;\n  }\n}\nconst f = (a) => {\n  return a;\n};"
+    outline = outline_code(js, "javascript")
+    assert outline == "class A {\n  run(x) {\n      // ...\n  }\n}\nconst f = (a) => {\n    // ...\n};"
+
+
+def test_fit_prompt_lowers_max_tokens_then_shrinks():
+    """
+    Test that the generation budget is lowered first and the code shrunk only when needed.
+    """
+    def count(text):
+        return len(text.split())
+
+    def build(code):
+        return f"explain {code}"
+
+    code = " ".join(["word"] * 100)
+
+    prompt, max_tokens, used = fit_prompt(build, code, [], count, n_ctx=300, max_tokens=400, min_tokens=100)
+    assert (max_tokens, used) == (199, code)
+
+    prompt, max_tokens, used = fit_prompt(build, code, ["short code"], count, n_ctx=150, max_tokens=400, min_tokens=100)
+    assert (prompt, max_tokens, used) == ("explain short code", 147, "short code")
+
+    with pytest.raises(ContextOverflowError):
+        fit_prompt(build, code, ["still " * 80], count, n_ctx=150, max_tokens=400, min_tokens=100)
+
+
+def test_candidates_shrink_monotonically():
+    """
+    Test that shrink and tail candidates get shorter at every step.
+    """
+    code = "\n".join(f"x{i} = {i}" for i in range(16))
+    sizes = [len(c) for c in shrink_candidates(code, "python")]
+    assert sizes == sorted(sizes, reverse=True) and len(sizes) == 4
+
+    tails = list(tail_candidates(code))
+    assert tails[0].startswith("x8 = 8") and tails[-1] == "x15 = 15"
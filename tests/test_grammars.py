@@ -0,0 +1,35 @@
+import threading
+
+import pytest
+
+import grammars
+
+
+def test_grammars_compile_once_per_thread(monkeypatch):
+    """
+    Test that each grammar parses and is reused by later calls on the same thread.
+    """
+    pytest.importorskip("llama_cpp")
+    monkeypatch.setattr(grammars, "GRAMMAR_DECODING", True)
+
+    python = grammars.function_grammar("Python")
+    assert python is not None
+    assert grammars.function_grammar("python") is python
+    assert grammars.function_grammar("javascript") is not None
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(grammars.function_grammar("python")))
+    thread.start()
+    thread.join()
+    assert other[0] is not python
+
+
+def test_no_grammar_when_disabled_or_unsupported(monkeypatch):
+    """
+    Test that decoding stays unconstrained when disabled or for languages without a grammar.
+    """
+    monkeypatch.setattr(grammars, "GRAMMAR_DECODING", False)
+    assert grammars.function_grammar("python") is None
+
+    monkeypatch.setattr(grammars, "GRAMMAR_DECODING", True)
+    assert grammars.function_grammar("rust") is None
@@ -0,0 +1,237 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from inference import (
+    InferenceExecutor, JobCancelledError, JobDeadlineError, QueueFullError, SupersedingJobs,
+    PRIORITY_AUTOCOMPLETE, PRIORITY_GENERATE, PRIORITY_REPLY, job_stop
+)
+
+
+def test_jobs_run_one_at_a_time():
+    """
+    Test that concurrent submissions never overlap on the inference thread.
+    """
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def job(i):
+        with lock:
+            active.append(i)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(i)
+        return i * 2
+
+    async def main():
+        executor = InferenceExecutor(max_queue_size=8)
+        await executor.start()
+        results = await asyncio.gather(*(executor.submit(job, i) for i in range(5)))
+        stats = executor.stats()
+        await executor.stop()
+        return results, stats
+
+    results, stats = asyncio.run(main())
+    assert results == [0, 2, 4, 6, 8]
+    assert max(peak) == 1
+    assert stats["processed"] == 5
+    assert stats["wait_max"] > 0
+
+
+def test_full_queue_rejects_jobs():
+    """
+    Test that submissions beyond max_queue_size fail fast with QueueFullError.
+    """
+    release = threading.Event()
+
+    async def main():
+        executor = InferenceExecutor(max_queue_size=1)
+        await executor.start()
+        running = asyncio.ensure_future(executor.submit(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.submit(lambda: "queued"))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await executor.submit(lambda: "rejected")
+        release.set()
+        result = await queued
+        await running
+        stats = executor.stats()
+        await executor.stop()
+        return result, stats
+
+    result, stats = asyncio.run(main())
+    assert result == "queued"
+    assert stats["rejected"] == 1
+
+
+def test_job_errors_propagate():
+    """
+    Test that exceptions raised on the inference thread reach the caller.
+    """
+    def boom():
+        raise ValueError("bad prompt")
+
+    async def main():
+        executor = InferenceExecutor()
+        await executor.start()
+        try:
+            with pytest.raises(ValueError):
+                await executor.submit(boom)
+        finally:
+            await executor.stop()
+
+    asyncio.run(main())
+
+
+def test_stream_yields_items_in_order():
+    """
+    Test that generator jobs stream their items and report generator errors.
+    """
+    def tokens(n):
+        for i in range(n):
+            time.sleep(0.001)
+            yield f"tok{i}"
+
+    def broken():
+        yield "partial"
+        raise RuntimeError("decode failed")
+
+    async def main():
+        executor = InferenceExecutor()
+        await executor.start()
+        streamed = [item async for item in executor.stream(tokens, 5)]
+        received = []
+        with pytest.raises(RuntimeError):
+            async for item in executor.stream(broken):
+                received.append(item)
+        await executor.stop()
+        return streamed, received
+
+    streamed, received = asyncio.run(main())
+    assert streamed == [f"tok{i}" for i in range(5)]
+    assert received == ["partial"]
+
+
+def test_stream_stops_when_consumer_leaves():
+    """
+    Test that closing the stream early stops the generator on the inference thread.
+    """
+    produced = []
+
+    def tokens():
+        for i in range(1000):
+            produced.append(i)
+            time.sleep(0.001)
+            yield i
+
+    async def main():
+        executor = InferenceExecutor()
+        await executor.start()
+        stream = executor.stream(tokens)
+        async for item in stream:
+            if item == 2:
+                break
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        await executor.stop()
+
+    asyncio.run(main())
+    assert len(produced) < 1000
+
+
+def test_priority_and_superseded_jobs():
+    """
+    Test that autocomplete jobs jump the queue and superseded ones are dropped.
+    """
+    release = threading.Event()
+    order = []
+    jobs = SupersedingJobs()
+
+    async def main():
+        executor = InferenceExecutor()
+        await executor.start()
+        blocker = asyncio.ensure_future(executor.submit(release.wait))
+        await asyncio.sleep(0.05)
+
+        reply = asyncio.ensure_future(executor.submit(order.append, "reply", priority=PRIORITY_REPLY))
+        first = jobs.start("uid")
+        stale = asyncio.ensure_future(
+            executor.submit(order.append, "stale", priority=PRIORITY_AUTOCOMPLETE, cancel=first)
+        )
+        second = jobs.start("uid")
+        fresh = asyncio.ensure_future(
+            executor.submit(order.append, "fresh", priority=PRIORITY_AUTOCOMPLETE, cancel=second)
+        )
+        await asyncio.sleep(0)
+        release.set()
+
+        await asyncio.gather(blocker, reply, fresh)
+        with pytest.raises(JobCancelledError):
+            await stale
+        stats = executor.stats()
+        await executor.stop()
+        return stats
+
+    stats = asyncio.run(main())
+    assert order == ["fresh", "reply"]
+    assert stats["cancelled"] == 1
+
+
+def _decode(steps, delay=0.01):
+    # Stands in for a generation that checks its stop signal between tokens.
+    stop = job_stop()
+    for step in range(steps):
+        if stop.is_set():
+            return step
+        time.sleep(delay)
+    return steps
+
+
+def test_running_job_stops_when_its_caller_leaves():
+    """
+    Test that cancelling the wait for a running job stops it at its next step.
+    """
+    async def main():
+        executor = InferenceExecutor(max_queue_size=4)
+        await executor.start()
+        waiting = asyncio.ensure_future(executor.submit(_decode, 500))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        start = time.perf_counter()
+        # The next job runs as soon as the abandoned one has stopped.
+        await executor.submit(lambda: None)
+        freed_after = time.perf_counter() - start
+        stats = executor.stats()
+        await executor.stop()
+        return freed_after, stats
+
+    freed_after, stats = asyncio.run(main())
+    assert freed_after < 1
+    assert stats["aborted"] == {"disconnected": 1}
+
+
+def test_request_deadline_stops_generation():
+    """
+    Test that a job still running at its request deadline is cut off and fails.
+    """
+    async def main():
+        executor = InferenceExecutor(max_queue_size=4, request_deadlines={PRIORITY_GENERATE: 0.1})
+        await executor.start()
+        start = time.perf_counter()
+        with pytest.raises(JobDeadlineError):
+            await executor.submit(_decode, 500)
+        elapsed = time.perf_counter() - start
+        unlimited = await executor.submit(_decode, 3, priority=PRIORITY_REPLY)
+        stats = executor.stats()
+        await executor.stop()
+        return elapsed, unlimited, stats
+
+    elapsed, unlimited, stats = asyncio.run(main())
+    assert elapsed < 1
+    assert unlimited == 3
+    assert stats["aborted"] == {"deadline": 1}
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import inference_server
+from inference import InferenceExecutor, QueueFullError, RemoteExecutor
+
+
+def test_remote_executor_round_trip(tmp_path, monkeypatch):
+    """
+    Test that results, streamed items and cancellation travel over the socket, and that a closed server is noticed.
+    """
+    def echo(text):
+        return text.upper()
+
+    def tokens(text, cancel):
+        for word in text.split():
+            if cancel is not None and cancel.is_set():
+                return
+            yield word
+            time.sleep(0.01)
+
+    monkeypatch.setitem(inference_server.OPERATIONS, "echo", ("generate", echo))
+    monkeypatch.setitem(inference_server.OPERATIONS, "tokens", ("generate", tokens))
+
+    async def main():
+        local = InferenceExecutor(max_queue_size=4, workers=2)
+        await local.start()
+        monkeypatch.setattr(inference_server, "executors", {"default": local})
+        path = str(tmp_path / "inference.sock")
+        server = await asyncio.start_unix_server(inference_server.handle, path=path)
+
+        remote = RemoteExecutor(path, connect_timeout=1)
+        await remote.start()
+        result = await remote.submit(echo, "hello")
+        items = [item async for item in await remote.open_stream(tokens, "a b c", None)]
+
+        cancel = threading.Event()
+        stream = await remote.open_stream(tokens, "x " * 200, cancel, cancel=cancel)
+        cancelled = []
+        async for item in stream:
+            cancelled.append(item)
+            cancel.set()
+
+        with pytest.raises(RuntimeError, match="Unknown operation"):
+            await remote.submit(print, "not exposed")
+
+        alive = await remote.reachable()
+        server.close()
+        await server.wait_closed()
+        gone = not await remote.reachable()
+        await local.stop()
+        return result, items, cancelled, alive and gone
+
+    result, items, cancelled, probed = asyncio.run(main())
+    assert probed
+    assert result == "HELLO"
+    assert items == ["a", "b", "c"]
+    assert 0 < len(cancelled) < 200
+
+
+def test_remote_executor_reports_full_queue(tmp_path, monkeypatch):
+    """
+    Test that a full server queue is raised as QueueFullError before streaming starts.
+    """
+    release = threading.Event()
+
+    def block(_):
+        release.wait(timeout=5)
+        yield "done"
+
+    monkeypatch.setitem(inference_server.OPERATIONS, "block", ("generate", block))
+
+    async def main():
+        local = InferenceExecutor(max_queue_size=1)
+        await local.start()
+        monkeypatch.setattr(inference_server, "executors", {"default": local})
+        path = str(tmp_path / "inference.sock")
+        server = await asyncio.start_unix_server(inference_server.handle, path=path)
+        remote = RemoteExecutor(path)
+
+        first = await remote.open_stream(block, 1)
+        await asyncio.sleep(0.05)
+        second = await remote.open_stream(block, 2)
+        with pytest.raises(QueueFullError):
+            await remote.open_stream(block, 3)
+
+        release.set()
+        results = [[item async for item in first], [item async for item in second]]
+        server.close()
+        await server.wait_closed()
+        await local.stop()
+        return results, remote.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [["done"], ["done"]]
+    assert stats["rejected"] == 1
@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from benchmarks.fake_model import FakeLlama
+from benchmarks.load_test import call, percentile
+
+
+def test_fake_model_is_deterministic_and_honours_stop():
+    """
+    Test that the fake backend returns the same text for the same prompt and stops on stop sequences.
+    """
+    llm = FakeLlama(token_latency=0.0)
+    prompt = "Code:\nx = 1\n\nExplanation:\n"
+    text = llm(prompt, max_tokens=400)["choices"][0]["text"]
+    assert text.startswith("Step 1:") and text == llm(prompt, max_tokens=400)["choices"][0]["text"]
+    streamed = "".join(c["choices"][0]["text"] for c in llm(prompt, max_tokens=400, stop=["Step 2"], stream=True))
+    assert "Step 2" not in streamed and streamed.startswith("Step 1:")
+    assert llm.detokenize(llm.tokenize(b"a  b\nc")) == b"a  b\nc"
+
+
+def test_asgi_driver_measures_time_to_first_chunk():
+    """
+    Test that streamed responses report a first-chunk time before the end of the response.
+    """
+    app = FastAPI()
+
+    @app.post("/slow")
+    async def slow():
+        async def body():
+            yield "first\n"
+            await asyncio.sleep(0.05)
+            yield "second\n"
+        return StreamingResponse(body())
+
+    result = asyncio.run(call(app, "/slow", {}, {}))
+    assert result["status"] == 200
+    assert result["ttft"] < result["latency"] - 0.04
+    assert percentile([3, 1, 2, 4], 50) == 2 and percentile([3, 1, 2, 4], 99) == 4
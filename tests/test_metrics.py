@@ -0,0 +1,74 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from inference import InferenceExecutor, job_wait
+from metrics import Counter, Histogram, REGISTRY, REQUEST_SECONDS, RequestTimer
+
+
+def test_histogram_renders_cumulative_buckets():
+    """
+    Test the Prometheus text format of a labelled histogram.
+    """
+    histogram = Histogram("test_seconds", "Test.", ("endpoint",), buckets=(0.1, 1.0))
+    REGISTRY.remove(histogram)
+    histogram.observe(0.05, endpoint="reply")
+    histogram.observe(0.1, endpoint="reply")
+    histogram.observe(3.0, endpoint="reply")
+
+    lines = histogram.render()
+    assert lines[1] == "# TYPE test_seconds histogram"
+    assert lines[2:] == [
+        'test_seconds_bucket{endpoint="reply",le="0.1"} 2',
+        'test_seconds_bucket{endpoint="reply",le="1.0"} 2',
+        'test_seconds_bucket{endpoint="reply",le="+Inf"} 3',
+        'test_seconds_sum{endpoint="reply"} 3.15',
+        'test_seconds_count{endpoint="reply"} 3',
+    ]
+
+
+def test_counter_renders_one_line_per_label_set():
+    """
+    Test the Prometheus text format of a labelled counter.
+    """
+    counter = Counter("test_aborted_total", "Test.", ("reason",))
+    REGISTRY.remove(counter)
+    assert not counter.has_observations()
+    counter.inc(reason="deadline")
+    counter.inc(reason="disconnected")
+    counter.inc(2, reason="disconnected")
+
+    assert counter.render()[1:] == [
+        "# TYPE test_aborted_total counter",
+        'test_aborted_total{reason="deadline"} 1',
+        'test_aborted_total{reason="disconnected"} 3',
+    ]
+
+
+def test_request_time_is_labelled_with_the_worker_pid():
+    """
+    Test that request times carry the serving worker's pid, so workers' series stay apart.
+    """
+    async def app(scope, receive, send):
+        pass
+
+    scope = {"type": "http", "path": "/ping", "app": SimpleNamespace(routes=[SimpleNamespace(path="/ping")])}
+    asyncio.run(RequestTimer(app)(scope, None, None))
+    assert any(line.startswith(f'assistant_request_seconds_count{{endpoint="/ping",worker="{os.getpid()}"}}')
+               for line in REQUEST_SECONDS.render())
+
+
+def test_jobs_see_their_own_queue_wait():
+    """
+    Test that a job can read how long it waited, and code outside jobs sees None.
+    """
+    async def main():
+        executor = InferenceExecutor(max_queue_size=4)
+        await executor.start()
+        waits = await asyncio.gather(*(executor.submit(job_wait) for _ in range(3)))
+        await executor.stop()
+        return waits
+
+    waits = asyncio.run(main())
+    assert all(w is not None and w >= 0 for w in waits)
+    assert job_wait() is None
@@ -0,0 +1,32 @@
+import ml_engine
+from benchmarks.fake_model import FakeLlama
+from model_registry import ModelInstance, ModelPool, ModelSpec
+
+
+def _pool_with(llm) -> ModelPool:
+    pool = ModelPool([ModelSpec("default")])
+    model = pool.route("generate")
+    model.instances = [ModelInstance(model, llm)]
+    pool._loaded = True
+    return pool
+
+
+def test_generation_passes_prompt_text_to_the_model(monkeypatch):
+    """
+    Test that generate_response and stream_response call the model with text, as Llama.__call__ requires.
+    """
+    prompts = []
+
+    class TextOnlyLlama(FakeLlama):
+        def __call__(self, prompt: str, **kwargs):
+            prompts.append(prompt)
+            return super().__call__(prompt, **kwargs)
+
+    monkeypatch.setattr(ml_engine, "MODEL_POOL", _pool_with(TextOnlyLlama(token_latency=0.0)))
+    prompt = "Code:\nx = 1\n\nExplanation:\n"
+
+    text = ml_engine.generate_response(prompt, max_tokens=400, endpoint="reply")
+    streamed = "".join(ml_engine.stream_response(prompt, max_tokens=400, endpoint="reply"))
+
+    assert text.startswith("Step 1:") and streamed.strip() == text
+    assert prompts == [prompt, prompt]
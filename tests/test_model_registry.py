@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+
+import pytest
+
+from model_registry import ModelInstance, ModelPool, ModelSpec, load_config
+
+
+def test_endpoints_route_to_configured_models(tmp_path):
+    """
+    Test that claimed endpoints go to their model and the rest to the model without endpoints.
+    """
+    config = tmp_path / "models.json"
+    config.write_text(json.dumps({
+        "memory_budget_mb": 4096,
+        "models": [
+            {"name": "small", "path": "small.gguf", "endpoints": ["autocomplete"], "n_threads": 2},
+            {"name": "large", "path": "large.gguf", "n_ctx": 1024, "batch_size": 2, "instances": 2},
+        ]
+    }))
+
+    specs, budget = load_config(str(config))
+    pool = ModelPool(specs, budget)
+
+    assert budget == 4096
+    assert pool.route("autocomplete").name == "small"
+    assert pool.route("reply").name == "large"
+    assert pool.route("generate").spec.model_id == "large.gguf"
+    assert pool.slots() == {"small": 1, "large": 4}
+
+
+def test_invalid_configs_are_rejected(tmp_path):
+    """
+    Test that unknown settings, double routes and unrouted endpoints fail early.
+    """
+    config = tmp_path / "models.json"
+    config.write_text(json.dumps({"models": [{"name": "a", "path": "a.gguf", "threads": 4}]}))
+    with pytest.raises(ValueError):
+        load_config(str(config))
+
+    with pytest.raises(ValueError):
+        ModelPool([ModelSpec("a", endpoints=["reply"]), ModelSpec("b", endpoints=["reply"])])
+    with pytest.raises(ValueError):
+        ModelPool([ModelSpec("a", endpoints=["reply"])])
+
+
+def test_load_enforces_memory_budget(tmp_path):
+    """
+    Test that the pool refuses to load models whose estimate exceeds the budget.
+    """
+    weights = tmp_path / "model.gguf"
+    weights.write_bytes(b"\0" * 1024)
+    spec = ModelSpec("default", path=str(weights), n_ctx=512, kv_bytes_per_token=4096, instances=2)
+    pool = ModelPool([spec], memory_budget_mb=1)
+
+    with pytest.raises(RuntimeError, match="budget"):
+        pool.load()
+
+
+def test_acquire_balances_instances():
+    """
+    Test that requests borrow the least busy instance and wait when all are busy.
+    """
+    pool = ModelPool([ModelSpec("default", instances=2)])
+    model = pool.route("reply")
+    model.instances = [ModelInstance(model, llm="a"), ModelInstance(model, llm="b")]
+    pool._loaded = True
+
+    with pool.acquire("reply") as first, pool.acquire("generate") as second:
+        assert {first.llm, second.llm} == {"a", "b"}
+
+        acquired = threading.Event()
+
+        def third():
+            with pool.acquire("autocomplete"):
+                acquired.set()
+
+        thread = threading.Thread(target=third)
+        thread.start()
+        time.sleep(0.05)
+        assert not acquired.is_set()
+
+    thread.join(timeout=1)
+    assert acquired.is_set()
+    assert pool.stats()["models"]["default"]["requests"] == 3
+
+
+def test_failed_load_keeps_no_instances(monkeypatch, tmp_path):
+    """
+    Test that a load failing on one model leaves no instances behind, so a retry loads each model once.
+    """
+    import model_registry
+
+    weights = tmp_path / "model.gguf"
+    weights.write_bytes(b"\0")
+    attempts = []
+
+    def create(model, path):
+        attempts.append(model.name)
+        if model.name == "large" and attempts.count("large") == 1:
+            raise RuntimeError("out of memory")
+        return ModelInstance(model, llm=model.name)
+
+    monkeypatch.setattr(model_registry, "_resolve", lambda spec: str(weights))
+    monkeypatch.setattr(model_registry, "_create", create)
+    pool = ModelPool([ModelSpec("small", endpoints=["autocomplete"], instances=2), ModelSpec("large")])
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        pool.load()
+    assert [len(model.instances) for model in pool.models.values()] == [0, 0]
+
+    pool.load()
+    assert [len(model.instances) for model in pool.models.values()] == [2, 1]
@@ -0,0 +1,45 @@
+from postprocess import (
+    AutocompleteFilter, CodeLineFilter, MentorFilter, clean_mentor_response, run_filter, stream_filter
+)
+
+
+def _chunks(text, size=3):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_clean_mentor_response_applies_all_rules():
+    """
+    Test that code blocks, leaked identifiers, extra whitespace and text before the first step are removed.
+    """
+    raw = (
+        "Explanation: Intro text.\n```python\nprint(1)\n```\n"
+        "Step 1: Uses  llama_cpp to load.\n\n\n\nStep 2: Done.\nlimitation: none"
+    )
+    assert clean_mentor_response(raw) == "Step 1: Uses to load.\n\nStep 2: Done.\nlimitation: none"
+    assert clean_mentor_response("limitation : slow") == "Limitation: slow"
+    assert clean_mentor_response("Intro. Step 1: go", trim_to_steps=False) == "Intro. Step 1: go"
+
+
+def test_stream_filters_match_whole_text_cleanup():
+    """
+    Test that streamed chunks concatenate to the non-streamed cleanup.
+    """
+    reply = "Sure.\nStep 1: Read the file with import os and traceback.\n```\ncode\n```\nStep 2: Parse it.\n"
+    assert "".join(stream_filter(_chunks(reply), MentorFilter())) == clean_mentor_response(reply)
+
+    completion = "# CONTINUE:\n    return x  # done\n"
+    assert "".join(stream_filter(_chunks(completion), AutocompleteFilter())) == "return x  # done"
+
+    code = "// BEGIN\nfunction a() {\n  // note\n  return 1;\n}\nfunction b() {}\n"
+    streamed = "".join(stream_filter(_chunks(code), CodeLineFilter("JavaScript")))
+    assert streamed == run_filter(CodeLineFilter("javascript"), code) == "function a() {\n  // note\n  return 1;\n}\n// END"
+
+
+def test_code_line_filter_keeps_shebang_and_adds_placeholder():
+    """
+    Test that shebangs survive the comment rule and empty output gets a placeholder.
+    """
+    assert run_filter(CodeLineFilter("python"), "#!/bin/env python\n# hi\ndef f():\n    pass\n") == (
+        "#!/bin/env python\ndef f():\n    pass\n# END"
+    )
+    assert run_filter(CodeLineFilter("python"), "  ") == "def placeholder():\n    pass\n# END"
@@ -0,0 +1,116 @@
+import asyncio
+
+from response_cache import ResponseCache, cache_key, normalize_code, normalize_text
+
+
+class FakeCollection:
+    """
+    Minimal in-memory stand-in for the MongoDB collection used by the shared tier.
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        if doc and doc["expires_at"] > query["expires_at"]["$gt"]:
+            return doc
+        return None
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = doc
+
+
+def test_key_ignores_non_semantic_whitespace():
+    """
+    Test that keys are stable across whitespace-only differences.
+    """
+    a = cache_key("reply", "m", 0.3, code=normalize_code("def f():\r\n    return 1   \n\n"))
+    b = cache_key("reply", "m", 0.3, code=normalize_code("\ndef f():\n    return 1"))
+    assert a == b
+    assert normalize_text("  reverse   a\nstring ") == "reverse a string"
+    assert cache_key("reply", "m", 0.3, code="x") != cache_key("reply", "m", 0.2, code="x")
+    assert cache_key("reply", "m", 0.3, code="x") != cache_key("reply", "other", 0.3, code="x")
+
+
+def test_memory_tier_lru_and_counters():
+    """
+    Test LRU eviction and hit/miss accounting of the in-process tier.
+    """
+    async def main():
+        cache = ResponseCache(max_entries=2)
+        await cache.set("a", "A")
+        await cache.set("b", "B")
+        assert await cache.get("a") == "A"
+        await cache.set("c", "C")
+        return cache, await cache.get("b"), await cache.get("a")
+
+    cache, evicted, kept = asyncio.run(main())
+    assert evicted is None
+    assert kept == "A"
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_shared_tier_is_used_across_instances():
+    """
+    Test that a second process-local cache hits entries stored by the first.
+    """
+    collection = FakeCollection()
+
+    async def main():
+        writer = ResponseCache(collection=lambda: collection)
+        reader = ResponseCache(collection=lambda: collection)
+        await writer.set("k", "value", "/reply")
+        first = await reader.get("k")
+        second = await reader.get("k")
+        return reader, first, second
+
+    reader, first, second = asyncio.run(main())
+    assert first == second == "value"
+    assert reader.stats()["db_hits"] == 1
+    assert reader.stats()["memory_hits"] == 1
+
+
+def test_expired_entries_are_misses():
+    """
+    Test that entries past their TTL are not served.
+    """
+    async def main():
+        cache = ResponseCache(ttl=-1)
+        await cache.set("k", "v")
+        return await cache.get("k")
+
+    assert asyncio.run(main()) is None
+
+
+def test_unreachable_database_is_skipped_after_a_failure():
+    """
+    Test that a failing shared tier degrades to misses and is not called again until the retry delay passes.
+    """
+    calls = []
+
+    class DownCollection(FakeCollection):
+        def find_one(self, query):
+            calls.append(query["_id"])
+            raise TimeoutError("No servers available")
+
+    collection = DownCollection()
+
+    async def main():
+        cache = ResponseCache(collection=lambda: collection, db_retry_after=0.05)
+        first = await cache.get("a")
+        await cache.set("b", "B")
+        second = await cache.get("c")
+        await asyncio.sleep(0.06)
+        third = await cache.get("d")
+        return cache, (first, second, third)
+
+    cache, results = asyncio.run(main())
+    assert results == (None, None, None)
+    assert calls == ["a", "d"]
+    assert cache.stats()["db_errors"] == 2 and cache.stats()["db_skipped"] == 2
@@ -0,0 +1,59 @@
+import asyncio
+
+from sandbox import SandboxPool, check_syntax
+
+
+def test_syntax_errors_are_reported_without_execution():
+    """
+    Test the cached syntax checks for Python and brace languages.
+    """
+    check_syntax.cache_clear()
+    assert check_syntax("def f(:\n", "python").startswith("SyntaxError")
+    assert check_syntax("def f(:\n", "Python").startswith("SyntaxError")
+    assert check_syntax("function f() { return '}'; }", "javascript") is None
+    assert check_syntax("function f() { return [1; }", "javascript") == "Unexpected '}' at offset 26"
+    assert check_syntax.cache_info().misses == 4
+
+    async def main():
+        pool = SandboxPool(workers=1)
+        await pool.start()
+        result = await pool.validate("def f(:\n# END", "python")
+        await pool.stop()
+        return result
+
+    result = asyncio.run(main())
+    assert not result.valid and result.stage == "syntax"
+
+
+def test_generated_code_is_analyzed_but_never_executed(tmp_path):
+    """
+    Test that sockets, subprocesses and file writes in a snippet never run, and only names read at module level must be defined.
+    """
+    target = tmp_path / "sandbox_pwned"
+    hostile = (
+        "import _socket, subprocess\n"
+        "_socket.socket()\n"
+        "subprocess.run(['touch', %r])\n"
+        "open(%r, 'w').write('x')\n" % (str(target), str(target))
+    )
+
+    async def main():
+        pool = SandboxPool(workers=2, timeout=0.1)
+        await pool.start()
+        results = await asyncio.gather(
+            pool.validate(hostile, "python"),
+            pool.validate("x = 1\n" * 100000, "python"),
+            pool.validate("def add(a, b):\n    return helper(a, b)\n\ntotal = add(1, missing)\n# END", "python"),
+        )
+        after = await pool.validate("def mean(xs):\n    return np.mean(helper(xs))\n# END", "python")
+        stats = pool.stats()
+        await pool.stop()
+        return results, after, stats
+
+    (hostile_result, slow, undefined), after, stats = asyncio.run(main())
+    assert hostile_result.stage == "names"
+    assert not target.exists()
+    assert slow.error.startswith("TimeoutError")
+    assert undefined.error == "NameError: name 'missing' is not defined"
+    assert after.valid and after.stage == "names"
+    assert stats["timeouts"] == 1 and stats["restarts"] == 1
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from inference import (
+    InferenceExecutor, QueueTimeoutError, UserQueueFullError,
+    PRIORITY_AUTOCOMPLETE, PRIORITY_REPLY
+)
+from scheduler import FairQueue
+
+
+def test_users_take_turns_by_weight():
+    """
+    Test that a burst from one user is interleaved with other users' jobs.
+    """
+    async def main():
+        queue = FairQueue(maxsize=16, weights={"vip": 2})
+        for i in range(4):
+            queue.put_nowait(f"script-{i}", PRIORITY_REPLY, "script")
+        queue.put_nowait("alice-0", PRIORITY_REPLY, "alice")
+        for i in range(2):
+            queue.put_nowait(f"vip-{i}", PRIORITY_REPLY, "vip")
+        queue.put_nowait("autocomplete", PRIORITY_AUTOCOMPLETE, "script")
+        return [await queue.get() for _ in range(queue.qsize())]
+
+    order = asyncio.run(main())
+    assert order[0] == "autocomplete"
+    assert order.index("alice-0") < order.index("script-1")
+    assert order.index("vip-1") < order.index("script-1")
+
+
+def test_discarded_jobs_free_their_place():
+    """
+    Test that a discarded job stops counting and is never returned.
+    """
+    async def main():
+        queue = FairQueue(maxsize=2, max_per_user=1)
+        queue.put_nowait("a", PRIORITY_REPLY, "u1")
+        queue.put_nowait("b", PRIORITY_REPLY, "u2")
+        assert queue.discard("a")
+        queue.put_nowait("c", PRIORITY_REPLY, "u1")
+        return [await queue.get(), await queue.get()]
+
+    assert asyncio.run(main()) == ["b", "c"]
+
+
+def test_user_limit_and_queue_deadline():
+    """
+    Test 429-style rejection per user and deadline expiry while waiting.
+    """
+    release = threading.Event()
+
+    async def main():
+        executor = InferenceExecutor(max_queue_size=8, max_user_jobs=1, deadlines={PRIORITY_REPLY: 0.1})
+        await executor.start()
+        blocker = asyncio.ensure_future(executor.submit(release.wait, user="other"))
+        await asyncio.sleep(0.05)
+
+        waiting = asyncio.ensure_future(executor.submit(lambda: "late", priority=PRIORITY_REPLY, user="u1"))
+        await asyncio.sleep(0)
+        with pytest.raises(UserQueueFullError):
+            await executor.submit(lambda: "second", priority=PRIORITY_REPLY, user="u1")
+
+        start = time.perf_counter()
+        with pytest.raises(QueueTimeoutError) as error:
+            await waiting
+        waited = time.perf_counter() - start
+        release.set()
+        await blocker
+        stats = executor.stats()
+        await executor.stop()
+        return waited, error.value.retry_after, stats
+
+    waited, retry_after, stats = asyncio.run(main())
+    assert waited < 1
+    assert retry_after >= 1
+    assert stats["expired"] == 1
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_jobs_over_the_deadline_are_shed_on_submit():
+    """
+    Test that a job whose estimated wait exceeds the deadline is rejected at once.
+    """
+    release = threading.Event()
+
+    async def main():
+        executor = InferenceExecutor(deadlines={PRIORITY_REPLY: 0.5})
+        await executor.start()
+        await executor.submit(time.sleep, 0.2)
+        blocker = asyncio.ensure_future(executor.submit(release.wait))
+        await asyncio.sleep(0.05)
+        queued = [asyncio.ensure_future(executor.submit(time.sleep, 0, priority=PRIORITY_REPLY))
+                  for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(QueueTimeoutError):
+            await executor.submit(time.sleep, 0, priority=PRIORITY_REPLY)
+        release.set()
+        await asyncio.gather(blocker, *queued)
+        stats = executor.stats()
+        await executor.stop()
+        return stats
+
+    assert asyncio.run(main())["shed"] == 1
@@ -0,0 +1,66 @@
+import numpy as np
+
+from semantic_cache import SemanticCache, evaluate
+
+
+def test_similar_embedding_in_the_same_partition_hits():
+    """
+    Test that a lookup returns the answer of the most similar cached prompt above the threshold.
+    """
+    cache = SemanticCache(capacity=8, threshold=0.9)
+    cache.add("generate/python", [1.0, 0.0, 0.0], "def reverse(s): return s[::-1]", "reverse a string")
+    cache.add("generate/python", [0.0, 1.0, 0.0], "def is_prime(n): ...", "check if a number is prime")
+
+    value, similarity, text = cache.get("generate/python", [0.95, 0.1, 0.0])
+    assert value == "def reverse(s): return s[::-1]"
+    assert text == "reverse a string"
+    assert similarity > 0.99
+    assert cache.get("generate/python", [0.7, 0.7, 0.0]) is None
+    assert cache.get("generate/javascript", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_oldest_rows_are_overwritten_and_entries_expire():
+    """
+    Test that a full cache reuses its oldest row and expired rows never hit.
+    """
+    cache = SemanticCache(capacity=2, threshold=0.9)
+    for i, vector in enumerate(np.eye(3)):
+        cache.add("p", vector, f"answer {i}")
+    assert cache.get("p", [1.0, 0.0, 0.0]) is None
+    assert cache.get("p", [0.0, 0.0, 1.0])[0] == "answer 2"
+
+    expired = SemanticCache(capacity=2, threshold=0.9, ttl=-1)
+    expired.add("p", [1.0, 0.0], "old")
+    assert expired.get("p", [1.0, 0.0]) is None
+
+
+def test_memory_mapped_cache_survives_a_restart(tmp_path):
+    """
+    Test that a saved cache is loaded back from its .npy file.
+    """
+    path = str(tmp_path / "semantic.npy")
+    cache = SemanticCache(capacity=4, threshold=0.9, path=path)
+    cache.add("p", [0.0, 3.0], "kept", "prompt")
+    cache.save()
+
+    restored = SemanticCache(capacity=4, threshold=0.9, path=path)
+    assert isinstance(restored._matrix, np.memmap)
+    assert restored.get("p", [0.0, 1.0])[0] == "kept"
+    assert len(restored) == 1
+
+
+def test_evaluate_reports_false_positives_per_threshold():
+    """
+    Test that evaluate counts different pairs whose similarity reaches each threshold.
+    """
+    vectors = {"a": [1.0, 0.0], "a'": [0.96, 0.28], "b": [0.8, 0.6], "c": [0.0, 1.0]}
+    pairs = [
+        {"a": "a", "b": "a'", "same": True},
+        {"a": "a", "b": "b", "same": False},
+        {"a": "a", "b": "c", "same": False},
+    ]
+    low, high = evaluate(pairs, vectors.get, [0.75, 0.9])
+    assert (low["false_positives"], low["false_positive_rate"], low["hit_rate"]) == (1, 0.5, 1.0)
+    assert (high["false_positives"], high["hit_rate"]) == (0, 1.0)
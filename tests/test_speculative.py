@@ -0,0 +1,82 @@
+import numpy as np
+
+import speculative
+
+
+class CountingModel:
+    """
+    Tiny stand-in for Llama whose next token is always (previous + 1) % 8.
+    """
+
+    def __init__(self, n_ctx=64, n_vocab=10):
+        self.scores = np.zeros((n_ctx, n_vocab), dtype=np.single)
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.n_tokens = 0
+        self.eval_calls = 0
+        self._n_ctx = n_ctx
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    def token_eos(self):
+        return 9
+
+    def detokenize(self, tokens):
+        return "".join(f"{t} " for t in tokens).encode("utf-8")
+
+    def eval(self, tokens):
+        self.eval_calls += 1
+        for token in tokens:
+            self.input_ids[self.n_tokens] = token
+            self.scores[self.n_tokens] = 0.0
+            self.scores[self.n_tokens, (token + 1) % 8] = 10.0
+            self.n_tokens += 1
+
+
+def test_find_draft_prefers_longest_recent_match():
+    """
+    Test that the lookup continues the latest occurrence of the longest suffix.
+    """
+    tokens = [5, 1, 2, 3, 9, 1, 2, 4, 7, 1, 2]
+    assert speculative.find_draft(tokens, ngram=3, max_draft=2) == [4, 7]
+    assert speculative.find_draft([1, 2, 3], ngram=3) == []
+
+
+def test_verify_rejects_at_first_mismatch():
+    """
+    Test greedy verification: accepted prefix plus the model's own next token.
+    """
+    rows = np.zeros((4, 10), dtype=np.single)
+    for i, best in enumerate([3, 4, 6, 7]):
+        rows[i, best] = 1.0
+    rng = np.random.default_rng(0)
+
+    assert speculative.verify(rows, [3, 4, 5], 0.0, rng) == (2, 6)
+    assert speculative.verify(rows[:3], [3, 4], 0.0, rng) == (2, 6)
+
+
+def test_generate_matches_plain_greedy_decoding_with_fewer_passes():
+    """
+    Test that speculative output equals token-by-token decoding and drafts are counted.
+    """
+    llm = CountingModel()
+    stats = speculative.SpeculativeStats()
+    prompt = [1, 2, 3, 4, 5, 6, 7, 0, 1, 2]
+
+    text = "".join(speculative.generate(llm, prompt, max_tokens=10, temperature=0.0, stats=stats))
+
+    assert text == "3 4 5 6 7 0 1 2 3 4 "
+    report = stats.as_dict()
+    assert report["tokens"] == 10
+    assert report["acceptance_rate"] == 1.0
+    assert report["speedup"] > 2
+    assert llm.eval_calls < 10
+
+
+def test_generate_stops_on_stop_sequence():
+    """
+    Test that text from a stop sequence on is never emitted.
+    """
+    llm = CountingModel()
+    text = "".join(speculative.generate(llm, [0, 1], max_tokens=20, temperature=0.0, stop=["5 "]))
+    assert text == "2 3 4 "
@@ -0,0 +1,40 @@
+import os
+
+import model_registry
+from model_registry import ModelSpec, read_manifest, record_download
+
+
+def test_manifest_skips_the_hub(tmp_path, monkeypatch):
+    """
+    Test that a model recorded in the manifest resolves without downloading.
+    """
+    weights = tmp_path / "model.gguf"
+    weights.write_bytes(b"gguf" * 10)
+    record_download(str(tmp_path), "org/repo/model.gguf", str(weights))
+    assert read_manifest(str(tmp_path))["org/repo/model.gguf"]["size"] == 40
+
+    def download(**kwargs):
+        raise AssertionError("the hub must not be contacted")
+
+    monkeypatch.setattr("huggingface_hub.hf_hub_download", download)
+    spec = ModelSpec(name="default", repo_id="org/repo", filename="model.gguf", local_dir=str(tmp_path))
+    assert model_registry._resolve(spec) == os.path.abspath(weights)
+
+
+def test_truncated_file_is_downloaded_again(tmp_path, monkeypatch):
+    """
+    Test that a manifest entry whose file size changed is not trusted.
+    """
+    weights = tmp_path / "model.gguf"
+    weights.write_bytes(b"gguf" * 10)
+    record_download(str(tmp_path), "org/repo/model.gguf", str(weights))
+    weights.write_bytes(b"gg")
+
+    def download(repo_id, filename, local_dir):
+        weights.write_bytes(b"gguf" * 10)
+        return str(weights)
+
+    monkeypatch.setattr("huggingface_hub.hf_hub_download", download)
+    spec = ModelSpec(name="default", repo_id="org/repo", filename="model.gguf", local_dir=str(tmp_path))
+    assert model_registry._resolve(spec) == str(weights)
+    assert read_manifest(str(tmp_path))["org/repo/model.gguf"]["size"] == 40
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from telemetry import TelemetryWriter, UsageRecorder
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def _collection():
+    return mongomock.MongoClient().ml_metrics.usage
+
+
+def test_flushes_when_batch_is_full():
+    """A full batch wakes the worker thread before the flush interval."""
+    usage = _collection()
+    writer = TelemetryWriter(lambda: usage, capacity=100, batch_size=3, flush_interval=60)
+    writer.start()
+    try:
+        for i in range(3):
+            assert writer.record(user_id="u1", endpoint="/reply", status=200, duration=0.1 * i)
+        deadline = time.time() + 5
+        while usage.count_documents({}) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        assert usage.count_documents({"user_id": "u1"}) == 3
+    finally:
+        writer.close()
+
+
+def test_drops_records_when_buffer_is_full_and_flushes_on_close():
+    """Records beyond capacity are counted as dropped; close() writes the rest."""
+    usage = _collection()
+    writer = TelemetryWriter(lambda: usage, capacity=2, batch_size=10, flush_interval=60)
+    writer.start()
+    assert writer.record(user_id="u1") and writer.record(user_id="u2")
+    assert not writer.record(user_id="u3")
+    writer.close()
+    assert usage.count_documents({}) == 2
+    assert writer.stats()["dropped"] == 1
+    assert writer.stats()["written"] == 2
+
+
+def test_write_errors_do_not_raise():
+    """A failing database loses the batch but never reaches the caller."""
+    def unavailable():
+        raise RuntimeError("Database not initialized, call connect_db first")
+
+    writer = TelemetryWriter(unavailable, batch_size=10)
+    writer.record(user_id="u1")
+    assert writer.flush() == 0
+    assert writer.stats()["write_errors"] == 1
+
+
+def test_usage_recorder_records_authenticated_requests():
+    """Only requests whose auth dependency set a user id are recorded."""
+    async def app(scope, receive, send):
+        if scope["path"] == "/reply":
+            scope["state"]["user_id"] = "u1"
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        pass
+
+    writer = TelemetryWriter(_collection)
+    recorder = UsageRecorder(app, writer)
+    for path in ("/reply", "/health"):
+        asyncio.run(recorder({"type": "http", "path": path}, None, send))
+    assert writer.stats()["recorded"] == 1
+    assert writer._buffer[0]["endpoint"] == "/reply"
+    assert writer._buffer[0]["status"] == 200